@@ -0,0 +1,171 @@
+"""
+Single-process ASGI server for the bot
+Serves the Telegram update webhook, the PayPal webhook and the payment return
+pages from one event loop, sharing one InviteMemberBot and therefore one
+database executor, PayPal client and Telegram client.
+
+Per-user update ordering and shared payment starts are per process: with
+several workers a user's updates may be handled by different workers.
+
+Run with: python run.py --mode asgi [--port 8000] [--workers 4]
+"""
+import asyncio
+import logging
+import contextlib
+from datetime import datetime
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Update
+
+from config import WEBHOOK_BASE_URL, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET, PAYPAL_WEBHOOK_ID
+from bot import InviteMemberBot
+from webhook_worker import WebhookEventWorker
+from webhook_signature import WebhookVerifier
+from payment_pages import SUCCESS_PAGE, FAILED_PAGE, CANCEL_PAGE
+
+logger = logging.getLogger(__name__)
+
+if not TELEGRAM_WEBHOOK_SECRET:
+    # Without it anyone who finds the webhook path can post fake updates
+    raise RuntimeError("TELEGRAM_WEBHOOK_SECRET must be set to serve the Telegram webhook")
+
+bot = InviteMemberBot()
+webhook_worker = WebhookEventWorker(
+    bot.db,
+    bot.paypal,
+    on_purchase=lambda user_id: bot.send_invite_link(None, user_id)
+)
+
+if PAYPAL_WEBHOOK_ID:
+    webhook_verifier = WebhookVerifier.from_config()
+else:
+    webhook_verifier = None
+    logger.warning("PAYPAL_WEBHOOK_ID is not set: PayPal webhook signatures are NOT verified")
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    """Start the bot and webhook workers with the server and stop them with it"""
+    bot.setup_application()
+    await bot.app.initialize()
+    await bot.app.start()
+    await bot.app.bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL}{TELEGRAM_WEBHOOK_PATH}",
+        secret_token=TELEGRAM_WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES
+    )
+    webhook_worker.start()
+    logger.info("ASGI server ready")
+
+    try:
+        yield
+    finally:
+        await webhook_worker.stop()
+        await bot.app.stop()
+        await bot.post_stop(bot.app)
+        await bot.app.shutdown()
+        await bot.post_shutdown(bot.app)
+
+async def telegram_webhook(request: Request):
+    """Hand a Telegram update to the bot's update queue"""
+    if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != TELEGRAM_WEBHOOK_SECRET:
+        return Response(status_code=403)
+
+    try:
+        update = Update.de_json(await request.json(), bot.app.bot)
+    except ValueError:
+        return Response(status_code=400)
+
+    await bot.app.update_queue.put(update)
+    return Response(status_code=200)
+
+async def paypal_webhook(request: Request):
+    """Queue a PayPal webhook notification and acknowledge it immediately"""
+    try:
+        body = await request.body()
+        try:
+            webhook_data = await request.json()
+        except ValueError:
+            webhook_data = None
+
+        if not webhook_data:
+            return JSONResponse({'error': 'No data received'}, status_code=400)
+
+        event_id = webhook_data.get('id')
+        event_type = webhook_data.get('event_type')
+        if not event_id:
+            return JSONResponse({'error': 'Missing event id'}, status_code=400)
+
+        # Off the loop: the first event for a certificate URL downloads it
+        if webhook_verifier and not await asyncio.to_thread(webhook_verifier.verify, request.headers, body):
+            return JSONResponse({'error': 'Invalid signature'}, status_code=400)
+
+        if await bot.db.enqueue_webhook_event(event_id, event_type, body.decode()):
+            logger.info(f"Queued PayPal webhook {event_id}: {event_type}")
+            webhook_worker.notify()
+            return JSONResponse({'status': 'queued'})
+
+        logger.info(f"Duplicate PayPal webhook {event_id} ignored")
+        return JSONResponse({'status': 'duplicate'})
+
+    except Exception as e:
+        logger.error(f"Webhook error: {e}")
+        return JSONResponse({'error': 'Internal server error'}, status_code=500)
+
+async def payment_success(request: Request):
+    """Handle successful payment return from PayPal"""
+    try:
+        payment_id = request.query_params.get('paymentId')
+        payer_id = request.query_params.get('PayerID')
+        session_id = request.query_params.get('session_id')
+
+        if not all([payment_id, payer_id, session_id]):
+            return PlainTextResponse("Missing payment parameters", status_code=400)
+
+        completed = await bot.complete_payment_return(session_id, payment_id, payer_id)
+        if completed is None:
+            return PlainTextResponse("Invalid session", status_code=400)
+        if completed:
+            return HTMLResponse(SUCCESS_PAGE)
+        return HTMLResponse(FAILED_PAGE, status_code=400)
+
+    except Exception as e:
+        logger.error(f"Payment success handler error: {e}")
+        return PlainTextResponse("Internal server error", status_code=500)
+
+async def payment_cancel(request: Request):
+    """Handle cancelled payment return from PayPal"""
+    return HTMLResponse(CANCEL_PAGE)
+
+async def metrics(request: Request):
+    """Operational metrics as JSON"""
+    return JSONResponse({
+        'database': {'user_cache': bot.db.cache_stats()},
+        'paypal': bot.paypal.metrics(),
+        'telegram': bot.send_scheduler.metrics(),
+        'webhooks': {
+            **webhook_worker.metrics(),
+            'queue': await bot.db.webhook_queue_stats(),
+            'signatures': webhook_verifier.metrics() if webhook_verifier else None
+        }
+    })
+
+async def health_check(request: Request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat()
+    })
+
+app = Starlette(
+    routes=[
+        Route(TELEGRAM_WEBHOOK_PATH, telegram_webhook, methods=['POST']),
+        Route('/webhook/paypal', paypal_webhook, methods=['POST']),
+        Route('/payment/success', payment_success),
+        Route('/payment/cancel', payment_cancel),
+        Route('/metrics', metrics),
+        Route('/health', health_check)
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, List
+
+from config import DATABASE_EXECUTOR_WORKERS
+from database import DatabaseManager, UserStatus
+
+class AsyncDatabaseManager:
+    """
+    Awaitable facade over DatabaseManager
+    Every call runs on a small dedicated executor so SQLite disk I/O never
+    blocks the event loop that dispatches Telegram updates.
+    """
+
+    def __init__(self, db: DatabaseManager = None, max_workers: int = None):
+        self.db = db or DatabaseManager()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or DATABASE_EXECUTOR_WORKERS,
+            thread_name_prefix='db'
+        )
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking DatabaseManager method on the DB executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        """Wait for queued operations, then close the underlying connections"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
+        logging.info("Async database executor stopped")
+
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> bool:
+        return await self._run(self.db.add_user, user_id, username, first_name, last_name)
+
+    async def queue_user_upsert(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        return await self._run(self.db.queue_user_upsert, user_id, username, first_name, last_name)
+
+    async def flush_user_upserts(self) -> int:
+        return await self._run(self.db.flush_user_upserts)
+
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        return await self._run(self.db.get_user, user_id)
+
+    async def user_has_paid(self, user_id: int) -> bool:
+        return await self._run(self.db.user_has_paid, user_id)
+
+    async def user_has_invite(self, user_id: int) -> bool:
+        return await self._run(self.db.user_has_invite, user_id)
+
+    async def get_user_status(self, user_id: int, fresh: bool = False) -> UserStatus:
+        return await self._run(self.db.get_user_status, user_id, fresh)
+
+    async def mark_user_paid(self, user_id: int) -> bool:
+        return await self._run(self.db.mark_user_paid, user_id)
+
+    async def mark_invite_sent(self, user_id: int) -> bool:
+        return await self._run(self.db.mark_invite_sent, user_id)
+
+    async def add_payment_session(self, user_id: int, session_id: str, payment_url: str, expires_at: datetime,
+                                  precreated: bool = False, payment_id: str = None) -> bool:
+        return await self._run(
+            self.db.add_payment_session, user_id, session_id, payment_url, expires_at, precreated, payment_id
+        )
+
+    async def claim_precreated_session(self, session_id: str) -> bool:
+        return await self._run(self.db.claim_precreated_session, session_id)
+
+    async def get_payment_session(self, session_id: str) -> Optional[Dict]:
+        return await self._run(self.db.get_payment_session, session_id)
+
+    async def get_session_by_payment_id(self, payment_id: str) -> Optional[Dict]:
+        return await self._run(self.db.get_session_by_payment_id, payment_id)
+
+    async def complete_payment_session(self, session_id: str) -> bool:
+        return await self._run(self.db.complete_payment_session, session_id)
+
+    async def sweep_payment_sessions(self, **kwargs) -> Dict:
+        return await self._run(self.db.sweep_payment_sessions, **kwargs)
+
+    async def get_unfinished_sessions(self, after_id: int, limit: int, min_age_minutes: float,
+                                      lookback_hours: float) -> List[Dict]:
+        return await self._run(self.db.get_unfinished_sessions, after_id, limit, min_age_minutes, lookback_hours)
+
+    async def get_checkpoint(self, name: str) -> int:
+        return await self._run(self.db.get_checkpoint, name)
+
+    async def set_checkpoint(self, name: str, position: int):
+        return await self._run(self.db.set_checkpoint, name, position)
+
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        return await self._run(self.db.acquire_lease, name, owner, ttl_seconds)
+
+    async def release_lease(self, name: str, owner: str):
+        return await self._run(self.db.release_lease, name, owner)
+
+    async def create_broadcast(self, audience: str, text: str, created_by: int) -> Optional[int]:
+        return await self._run(self.db.create_broadcast, audience, text, created_by)
+
+    async def get_broadcast(self, broadcast_id: int = None, running: bool = False) -> Optional[Dict]:
+        return await self._run(self.db.get_broadcast, broadcast_id, running)
+
+    async def get_broadcast_recipients(self, audience: str, after_user_id: int, limit: int) -> List[int]:
+        return await self._run(self.db.get_broadcast_recipients, audience, after_user_id, limit)
+
+    async def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                      blocked: int, elapsed: float) -> bool:
+        return await self._run(
+            self.db.save_broadcast_progress, broadcast_id, last_user_id, sent, failed, blocked, elapsed
+        )
+
+    async def finish_broadcast(self, broadcast_id: int, status: str) -> bool:
+        return await self._run(self.db.finish_broadcast, broadcast_id, status)
+
+    async def add_payment(self, user_id: int, payment_id: str, payer_id: str, amount: float, currency: str, status: str) -> bool:
+        return await self._run(self.db.add_payment, user_id, payment_id, payer_id, amount, currency, status)
+
+    async def payment_recorded(self, payment_id: str) -> bool:
+        return await self._run(self.db.payment_recorded, payment_id)
+
+    async def complete_purchase(self, user_id: int, session_id: Optional[str], payment_id: str, payer_id: str,
+                                amount: float, currency: str, status: str = 'approved') -> bool:
+        return await self._run(
+            self.db.complete_purchase, user_id, session_id, payment_id, payer_id, amount, currency, status
+        )
+
+    async def enqueue_webhook_event(self, event_id: str, event_type: str, payload: str) -> bool:
+        return await self._run(self.db.enqueue_webhook_event, event_id, event_type, payload)
+
+    async def claim_webhook_events(self, limit: int, lease_seconds: float) -> List[Dict]:
+        return await self._run(self.db.claim_webhook_events, limit, lease_seconds)
+
+    async def finish_webhook_event(self, event_row_id: int, error: str = None, retry_delay: float = 0,
+                                   max_attempts: int = 1) -> bool:
+        return await self._run(self.db.finish_webhook_event, event_row_id, error, retry_delay, max_attempts)
+
+    async def webhook_queue_stats(self) -> Dict[str, int]:
+        return await self._run(self.db.webhook_queue_stats)
+
+    def cache_stats(self) -> Dict:
+        # In-memory counters only, cheap enough to read on the event loop
+        return self.db.cache_stats()
+
+    async def get_user_stats(self) -> Dict:
+        return await self._run(self.db.get_user_stats)
+
+    async def rebuild_stats(self) -> Dict:
+        return await self._run(self.db.rebuild_stats)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the DatabaseManager connection layer
+
+Compares the old connect-per-call pattern against the pooled, WAL-tuned
+connections DatabaseManager now keeps open.
+
+Usage:
+    python benchmarks/bench_database.py [--ops 5000]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+
+def connect_per_call_ops(db_path: str, ops: int) -> float:
+    """Run the workload the way database.py used to: one connection per call"""
+    start = time.perf_counter()
+    for i in range(ops):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO users (user_id, username, first_name, last_name) VALUES (?, ?, ?, ?)',
+                (i, f'user{i}', 'First', 'Last')
+            )
+            conn.commit()
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('SELECT * FROM users WHERE user_id = ?', (i,)).fetchone()
+    return (ops * 2) / (time.perf_counter() - start)
+
+
+def pooled_ops(db: DatabaseManager, ops: int) -> float:
+    """Run the same workload through the pooled DatabaseManager"""
+    start = time.perf_counter()
+    for i in range(ops):
+        db.add_user(i, f'user{i}', 'First', 'Last')
+        db.get_user(i)
+    return (ops * 2) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DatabaseManager microbenchmark')
+    parser.add_argument('--ops', type=int, default=5000, help='Upsert + lookup pairs per run (default: 5000)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.db')
+        after_path = os.path.join(tmp, 'after.db')
+
+        # Same schema for both runs; the "before" file stays in rollback-journal mode
+        DatabaseManager(before_path).close()
+        with sqlite3.connect(before_path) as conn:
+            conn.execute('PRAGMA journal_mode = DELETE')
+
+        before = connect_per_call_ops(before_path, args.ops)
+
+        db = DatabaseManager(after_path)
+        after = pooled_ops(db, args.ops)
+        db.close()
+
+    print(f"connect-per-call : {before:>10,.0f} ops/sec")
+    print(f"pooled (WAL)     : {after:>10,.0f} ops/sec")
+    print(f"speedup          : {after / before:>10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
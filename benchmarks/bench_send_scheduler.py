@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Check and time the outbound Telegram send scheduler
+
+Pushes a burst of bulk, reply and invite sends through SendScheduler with a
+fake Bot API call that records when each request went out, then checks that
+the global and per-chat limits held, that invites overtook the backlog and
+that a RetryAfter answer was waited out and resent.
+
+Usage:
+    python benchmarks/bench_send_scheduler.py [--messages 300] [--global-rate 30]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter
+
+from send_scheduler import SendScheduler, PRIORITY_INVITE, PRIORITY_REPLY, PRIORITY_BULK
+
+FLOODED_CHAT = 424242
+
+
+def max_in_window(times, window: float) -> int:
+    """Most events inside any window-second interval"""
+    times = sorted(times)
+    best, start = 0, 0
+    for end in range(len(times)):
+        while times[end] - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args):
+    scheduler = SendScheduler(global_rate=args.global_rate, chat_rate=1, chat_burst=3, max_retries=2)
+    sent_at = defaultdict(list)
+    finished = {}
+    flooded = []
+
+    async def send(chat_id, tag):
+        if chat_id == FLOODED_CHAT and not flooded:
+            flooded.append(time.monotonic())
+            raise RetryAfter(1)
+        sent_at[chat_id].append(time.monotonic())
+        finished[tag] = time.monotonic()
+        return True
+
+    def request(chat_id, tag, lane):
+        return scheduler.process_request(
+            send, (chat_id, tag), {}, 'sendMessage', {'chat_id': chat_id, 'text': tag}, lane
+        )
+
+    started = time.monotonic()
+    tasks = [request(1000 + i, f"bulk-{i}", PRIORITY_BULK) for i in range(args.messages)]
+    # One chat gets a burst of replies, which its own bucket has to spread out
+    tasks += [request(7, f"reply-{i}", PRIORITY_REPLY) for i in range(6)]
+    tasks.append(request(FLOODED_CHAT, 'flooded', None))
+    await asyncio.sleep(0)
+
+    # Invites arrive after the bulk backlog is already queued
+    invite_queued = time.monotonic()
+    tasks += [request(2000 + i, f"invite-{i}", PRIORITY_INVITE) for i in range(10)]
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    all_times = [t for times in sent_at.values() for t in times]
+    invite_done = max(finished[f"invite-{i}"] for i in range(10)) - invite_queued
+    bulk_done = sorted(finished[f"bulk-{i}"] for i in range(args.messages))
+
+    checks = [
+        ('global rate held (1 s window)', max_in_window(all_times, 1.0) <= 2 * args.global_rate),
+        ('global rate held (5 s window)', max_in_window(all_times, 5.0) <= args.global_rate * 6),
+        # Three go out at once, the other three a second apart
+        ('per-chat burst then 1/s', sent_at[7][-1] - sent_at[7][2] >= 2.5),
+        ('invites overtake the bulk backlog', invite_done < 1.0 and invite_done < bulk_done[len(bulk_done) // 2] - started),
+        ('RetryAfter waited out and resent', len(sent_at[FLOODED_CHAT]) == 1 and
+         sent_at[FLOODED_CHAT][0] - flooded[0] >= 1.0),
+        ('nothing left queued', sum(scheduler.metrics()['queued'].values()) == 0)
+    ]
+    failed = [name for name, passed in checks if not passed]
+    for name, passed in checks:
+        print(f"{'✅' if passed else '❌'} {name}")
+
+    metrics = scheduler.metrics()
+    await scheduler.shutdown()
+    print(f"\n{len(all_times)} sends in {elapsed:.1f}s ({len(all_times) / elapsed:.1f}/s, "
+          f"limit {args.global_rate:g}/s); last invite {invite_done * 1000:.0f} ms after queueing")
+    for lane, latency in metrics['latency_ms'].items():
+        print(f"  {lane:<7} sent {metrics['sent'][lane]:>5}  p50 {latency['p50']:>8.1f} ms  p95 {latency['p95']:>8.1f} ms")
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send scheduler check and benchmark')
+    parser.add_argument('--messages', type=int, default=300, help='Bulk messages to queue (default: 300)')
+    parser.add_argument('--global-rate', type=float, default=30, help='Global sends per second (default: 30)')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Compare per-update allocations of inline message building and the template registry
+
+Renders the texts and keyboards of a mix of updates (/start, /help, /status,
+"Pay Now", invite) the way the handlers used to, with f-strings and fresh
+InlineKeyboardMarkup objects, and through TemplateRegistry. Results are kept
+alive while tracemalloc runs, so the traced size is what each update allocated.
+
+Usage:
+    python benchmarks/bench_templates.py [--updates 20000]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, User
+
+from config import PAYMENT_AMOUNT, PAYMENT_CURRENCY, TELEGRAM_GROUP_INVITE_LINK
+from templates import TemplateRegistry
+
+PAYMENT_URL = 'https://www.sandbox.paypal.com/checkoutnow?token=PAYID-BENCH'
+
+
+def inline_start(first_name):
+    text = f"""
+🤖 **Welcome to the Premium Group Access Bot!**
+
+Hello {first_name}! 👋
+
+To join our exclusive Telegram group, you need to make a one-time payment of **${PAYMENT_AMOUNT} {PAYMENT_CURRENCY}**.
+
+**What you get:**
+• Access to our premium Telegram group
+• Exclusive content and discussions
+• Direct access to community members
+• Lifetime membership
+
+**How it works:**
+1. Click the "💳 Pay Now" button below
+2. Complete the payment via PayPal
+3. Receive your invite link automatically
+
+Ready to join? Click the button below! 👇
+        """
+    keyboard = [
+        [InlineKeyboardButton("💳 Pay Now", callback_data="pay_now")],
+        [InlineKeyboardButton("ℹ️ Help", callback_data="help")],
+        [InlineKeyboardButton("📊 My Status", callback_data="status")]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def inline_help(first_name):
+    text = """
+🆘 **Help & Support**
+
+**Available Commands:**
+• `/start` - Start the bot and see payment options
+• `/help` - Show this help message
+• `/status` - Check your payment status
+• `/pay` - Start the payment process
+
+**How to join the group:**
+1. Use `/start` to begin
+2. Click "💳 Pay Now" to make payment
+3. Complete PayPal payment
+4. Receive your invite link
+
+**Payment Information:**
+• Amount: $10.00 USD
+• Method: PayPal
+• One-time payment
+• Lifetime access
+
+**Need Support?**
+If you encounter any issues, please contact our support team.
+
+**Security Note:**
+We use secure PayPal payments. Your financial information is protected.
+        """
+    return text, None
+
+
+def inline_status(first_name):
+    text = f"❌ **Payment Status: PENDING**\n\n" \
+           f"You haven't completed the payment yet.\n" \
+           f"Amount required: ${PAYMENT_AMOUNT} {PAYMENT_CURRENCY}\n\n" \
+           f"Use /pay to start the payment process."
+    keyboard = [
+        [InlineKeyboardButton("💳 Pay Now", callback_data="pay_now")],
+        [InlineKeyboardButton("🔄 Refresh Status", callback_data="status")]
+    ]
+    return text, InlineKeyboardMarkup([btn for btn in keyboard if btn])
+
+
+def inline_payment(first_name):
+    minutes_left = 29
+    text = f"""
+💳 **Payment Ready**
+
+Amount: **${PAYMENT_AMOUNT} {PAYMENT_CURRENCY}**
+
+Click the button below to complete your payment via PayPal.
+
+⏰ This payment link expires in {minutes_left} minutes.
+
+After successful payment, you'll automatically receive your invite link!
+                """
+    keyboard = [
+        [InlineKeyboardButton("💳 Pay with PayPal", url=PAYMENT_URL)],
+        [InlineKeyboardButton("❌ Cancel", callback_data="cancel_payment")]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def inline_invite(first_name):
+    text = f"""
+🎉 **Welcome to the Premium Group!**
+
+Congratulations! Your payment has been confirmed.
+
+Here's your exclusive invite link:
+{TELEGRAM_GROUP_INVITE_LINK}
+
+**Important Notes:**
+• This link is for your personal use only
+• Click the link to join the group immediately
+• Save this message for future reference
+
+Welcome to our community! 🚀
+            """
+    return text, None
+
+
+def registry_renderers(registry, user):
+    templates = registry.for_user(user)
+    return [
+        lambda first_name: (templates.text('welcome', first_name=first_name), templates.start_keyboard),
+        lambda first_name: (templates.text('help'), None),
+        lambda first_name: (templates.text('status_pending'), templates.status_keyboard_unpaid),
+        lambda first_name: (templates.text('payment_ready', minutes_left=29), templates.payment_keyboard(PAYMENT_URL)),
+        lambda first_name: (templates.text('invite'), None)
+    ]
+
+
+def measure(renderers, updates):
+    """(bytes allocated per update, µs per update)"""
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(updates):
+        kept.append(renderers[i % len(renderers)](f"Buyer{i % 100}"))
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+
+    start = time.perf_counter()
+    for i in range(updates):
+        renderers[i % len(renderers)](f"Buyer{i % 100}")
+    elapsed = time.perf_counter() - start
+    return allocated / updates, elapsed / updates * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Template registry allocation benchmark')
+    parser.add_argument('--updates', type=int, default=20000, help='Updates to render (default: 20000)')
+    args = parser.parse_args()
+
+    user = User(id=1, first_name='Buyer', is_bot=False, language_code='en')
+    inline = [inline_start, inline_help, inline_status, inline_payment, inline_invite]
+    registry = registry_renderers(TemplateRegistry(), user)
+    # The per-update list append is the same for both, so it cancels out in the comparison
+    inline_bytes, inline_us = measure(inline, args.updates)
+    registry_bytes, registry_us = measure(registry, args.updates)
+
+    print(f"{'':<10}{'bytes/update':>14}{'µs/update':>12}")
+    print(f"{'inline':<10}{inline_bytes:>14.0f}{inline_us:>12.2f}")
+    print(f"{'registry':<10}{registry_bytes:>14.0f}{registry_us:>12.2f}")
+    print(f"\nAllocations per update down {(1 - registry_bytes / inline_bytes) * 100:.0f}%")
+
+
+if __name__ == '__main__':
+    main()
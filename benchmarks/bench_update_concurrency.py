@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Replay an update stream through the bot at several concurrency settings
+
+Runs the real handlers against the PayPal and Telegram fakes from loadtest/
+and a throwaway database. Every simulated user sends /start, taps "Pay Now"
+and sends /status; the users' updates are interleaved at random, but each
+user's own updates keep their order. The stream is replayed once per
+--concurrency value, and the report shows updates per second and whether
+every user's replies came back in the order they were asked for.
+
+A second check sends one more /status than there are slots from a user whose
+replies are slow, followed by one /status from each of many other users. The
+other users must all be answered before the slow user's first reply, since
+updates waiting on their own user's previous one must not hold a slot.
+
+Usage:
+    python benchmarks/bench_update_concurrency.py [--users 200] [--concurrency 1,4,16,64]
+        [--paypal-latency 0.2] [--record stream.jsonl | --replay stream.jsonl]
+        [--slow-user-latency 1.0] [--slow-check-concurrency 4] [--slow-check-users 20]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'loadtest'))
+
+from fake_common import FaultInjector
+from fake_paypal import FakePayPal
+from fake_telegram import FakeTelegram
+
+# Each run gets its own user ids, so earlier runs' payment sessions are not reused
+RUN_USER_STRIDE = 1_000_000
+# What each step of a user's conversation must answer with, in order
+EXPECTED_REPLIES = ('Welcome to the Premium Group Access Bot', 'Payment Ready', 'Payment Status: PENDING')
+
+
+def generate_stream(users: int, seed: int):
+    """/start, "Pay Now" and /status per user, shuffled across users but ordered per user"""
+    rng = random.Random(seed)
+    pending = {user_id: ['/start', 'pay_now', '/status'] for user_id in range(1, users + 1)}
+    stream = []
+    while pending:
+        user_id = rng.choice(list(pending))
+        stream.append({'user_id': user_id, 'action': pending[user_id].pop(0)})
+        if not pending[user_id]:
+            del pending[user_id]
+    return stream
+
+
+def to_update(event, user_id: int, update_id: int):
+    user = FakeTelegram.user(user_id)
+    chat = {'id': user_id, 'type': 'private'}
+    if event['action'].startswith('/'):
+        text = event['action']
+        return {'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        }}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': user, 'chat_instance': str(user_id), 'data': event['action'],
+        'message': {'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'text': 'Welcome'}
+    }}
+
+
+def replies_in_order(telegram: FakeTelegram, user_id: int) -> bool:
+    texts = [message['text'] for message in telegram._outbox.get(user_id, [])]
+    if len(texts) != len(EXPECTED_REPLIES):
+        return False
+    return all(expected in text for expected, text in zip(EXPECTED_REPLIES, texts))
+
+
+async def start_bot(concurrency: int):
+    from bot import InviteMemberBot
+
+    bot = InviteMemberBot()
+    bot.setup_application(update_concurrency=concurrency)
+    await bot.app.initialize()
+    await bot.app.start()
+    return bot
+
+
+async def stop_bot(bot):
+    await bot.app.stop()
+    await bot.app.shutdown()
+    await bot.post_shutdown(bot.app)
+
+
+async def replay(stream, concurrency: int, run: int, telegram: FakeTelegram):
+    from telegram import Update
+
+    bot = await start_bot(concurrency)
+    app = bot.app
+
+    offset = run * RUN_USER_STRIDE
+    updates = [Update.de_json(to_update(event, offset + event['user_id'], i + 1), app.bot)
+               for i, event in enumerate(stream)]
+
+    started = time.perf_counter()
+    for update in updates:
+        await app.update_queue.put(update)
+    await app.update_queue.join()
+    elapsed = time.perf_counter() - started
+
+    await stop_bot(bot)
+
+    user_ids = {offset + event['user_id'] for event in stream}
+    out_of_order = sum(1 for user_id in user_ids if not replies_in_order(telegram, user_id))
+    return elapsed, out_of_order
+
+
+async def slow_user_check(concurrency: int, run: int, telegram: FakeTelegram, fast_users: int):
+    """Seconds until every other user was answered, and until the slow user's first reply"""
+    from telegram import Update
+
+    bot = await start_bot(concurrency)
+    app = bot.app
+
+    offset = run * RUN_USER_STRIDE
+    slow_user = offset + 1
+    others = [offset + 2 + i for i in range(fast_users)]
+    users = [slow_user] * (concurrency + 1) + others
+    updates = [Update.de_json(to_update({'action': '/status'}, user_id, i + 1), app.bot)
+               for i, user_id in enumerate(users)]
+
+    started = time.perf_counter()
+    for update in updates:
+        await app.update_queue.put(update)
+    others_done = slow_first = None
+    while others_done is None or slow_first is None:
+        now = time.perf_counter() - started
+        if others_done is None and all(telegram.sent_count(user_id) for user_id in others):
+            others_done = now
+        if slow_first is None and telegram.sent_count(slow_user):
+            slow_first = now
+        await asyncio.sleep(0.01)
+    await app.update_queue.join()
+
+    await stop_bot(bot)
+    return others_done, slow_first
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update concurrency replay benchmark')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', default='1,4,16,64', help='Comma-separated settings to compare')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--record', help='Save the generated stream to this JSONL file')
+    parser.add_argument('--replay', help='Replay a stream saved with --record instead of generating one')
+    parser.add_argument('--paypal-latency', type=float, default=0.2)
+    parser.add_argument('--telegram-latency', type=float, default=0.02)
+    parser.add_argument('--paypal-port', type=int, default=8082)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--slow-user-latency', type=float, default=1.0,
+                        help='Seconds each reply to the slow user takes in the slow-user check')
+    parser.add_argument('--slow-check-concurrency', type=int, default=4)
+    parser.add_argument('--slow-check-users', type=int, default=20, help='Other users in the slow-user check')
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as f:
+            stream = [json.loads(line) for line in f if line.strip()]
+    else:
+        stream = generate_stream(args.users, args.seed)
+    if args.record:
+        with open(args.record, 'w') as f:
+            f.writelines(json.dumps(event) + '\n' for event in stream)
+
+    paypal = FakePayPal(FaultInjector(args.paypal_latency))
+    telegram = FakeTelegram(FaultInjector(args.telegram_latency))
+    servers = [paypal.serve(args.paypal_port), telegram.serve(args.telegram_port)]
+    workdir = tempfile.mkdtemp(prefix='bench-updates-')
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN='123456:BENCH',
+        TELEGRAM_GROUP_INVITE_LINK='https://t.me/+bench',
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{args.telegram_port}/bot",
+        # Measure the bot, not Telegram's flood limits
+        TELEGRAM_SEND_GLOBAL_RATE='100000',
+        PAYPAL_CLIENT_ID='bench',
+        PAYPAL_CLIENT_SECRET='bench',
+        PAYPAL_API_BASE_URL=f"http://127.0.0.1:{args.paypal_port}",
+        DATABASE_PATH=os.path.join(workdir, 'bench.db')
+    )
+
+    settings = [int(value) for value in args.concurrency.split(',')]
+    print(f"Replaying {len(stream)} updates ({len(stream) // 3} users), "
+          f"PayPal latency {args.paypal_latency * 1000:.0f} ms\n")
+    print(f"{'concurrency':>12}{'seconds':>10}{'updates/s':>12}{'speedup':>10}{'out of order':>14}")
+    baseline = None
+    failed = False
+    try:
+        for run, concurrency in enumerate(settings):
+            elapsed, out_of_order = asyncio.run(replay(stream, concurrency, run, telegram))
+            baseline = baseline or elapsed
+            failed = failed or out_of_order > 0
+            print(f"{concurrency:>12}{elapsed:>10.2f}{len(stream) / elapsed:>12.1f}"
+                  f"{baseline / elapsed:>9.1f}x{out_of_order:>14}")
+
+        run = len(settings)
+        concurrency = args.slow_check_concurrency
+        telegram.slow_chats[run * RUN_USER_STRIDE + 1] = args.slow_user_latency
+        others_done, slow_first = asyncio.run(slow_user_check(concurrency, run, telegram, args.slow_check_users))
+        blocked = others_done >= slow_first
+        failed = failed or blocked
+        print(f"\nOne slow user ({concurrency + 1} updates, {args.slow_user_latency:.1f}s per reply) "
+              f"next to {args.slow_check_users} others at concurrency {concurrency}:")
+        print(f"  others all answered after {others_done:.2f}s, slow user's first reply after {slow_first:.2f}s")
+        print(f"{'❌' if blocked else '✅'} other users were not held up behind the slow user")
+    finally:
+        for server in servers:
+            server.shutdown()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
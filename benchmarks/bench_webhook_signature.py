@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Check and time local PayPal webhook signature verification
+
+Builds a throwaway root CA, intermediate and signing certificate, checks that
+WebhookVerifier accepts a correctly signed event and rejects tampered ones,
+then measures the cost of a verification once the certificate is cached.
+
+Usage:
+    python benchmarks/bench_webhook_signature.py [--ops 20000]
+"""
+import os
+import sys
+import time
+import base64
+import zlib
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+from webhook_signature import WebhookVerifier, SIGNING_CERT_COMMON_NAME
+
+CERT_URL = 'https://api.sandbox.paypal.com/v1/notifications/certs/CERT-local-test'
+WEBHOOK_ID = 'WH-LOCAL-TEST'
+
+
+def make_cert(common_name, key, issuer_cert=None, issuer_key=None, ca=False, days=30, offset_days=-1):
+    """Certificate for key, self-signed unless an issuer is given"""
+    now = datetime.now(timezone.utc) + timedelta(days=offset_days)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    return (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(issuer_cert.subject if issuer_cert else subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+        .sign(issuer_key or key, hashes.SHA256())
+    )
+
+
+def new_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def pem(*certs) -> bytes:
+    return b''.join(cert.public_bytes(serialization.Encoding.PEM) for cert in certs)
+
+
+def sign(key, body: bytes, transmission_id='tx-1', transmission_time='2024-01-01T00:00:00Z', webhook_id=WEBHOOK_ID):
+    message = f"{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(body)}".encode()
+    return {
+        'PAYPAL-TRANSMISSION-ID': transmission_id,
+        'PAYPAL-TRANSMISSION-TIME': transmission_time,
+        'PAYPAL-TRANSMISSION-SIG': base64.b64encode(key.sign(message, padding.PKCS1v15(), hashes.SHA256())).decode(),
+        'PAYPAL-CERT-URL': CERT_URL,
+        'PAYPAL-AUTH-ALGO': 'SHA256withRSA'
+    }
+
+
+def verifier_for(roots, chain_pem):
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return chain_pem
+
+    verifier = WebhookVerifier(WEBHOOK_ID, roots, ('api.sandbox.paypal.com',), fetch=fetch)
+    return verifier, fetched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webhook signature verification check and benchmark')
+    parser.add_argument('--ops', type=int, default=20000, help='Verifications to time (default: 20000)')
+    args = parser.parse_args()
+
+    root_key, intermediate_key, leaf_key, other_key = new_key(), new_key(), new_key(), new_key()
+    root = make_cert('Local Test Root CA', root_key, ca=True, days=3650)
+    intermediate = make_cert('Local Test Intermediate', intermediate_key, root, root_key, ca=True, days=365)
+    leaf = make_cert(SIGNING_CERT_COMMON_NAME, leaf_key, intermediate, intermediate_key)
+    chain = pem(leaf, intermediate)
+    body = b'{"id": "WH-1", "event_type": "PAYMENT.SALE.COMPLETED"}'
+    headers = sign(leaf_key, body)
+
+    checks = []
+
+    verifier, fetched = verifier_for([root], chain)
+    checks.append(('valid signature accepted', verifier.verify(headers, body)))
+    checks.append(('certificate cached after first use', verifier.verify(headers, body) and len(fetched) == 1))
+    checks.append(('tampered body rejected', not verifier.verify(headers, body + b' ')))
+    checks.append(('wrong webhook id rejected', not verifier.verify(sign(leaf_key, body, webhook_id='WH-OTHER'), body)))
+    checks.append(('foreign key rejected', not verifier.verify(sign(other_key, body), body)))
+    checks.append(('cert URL off PayPal rejected', not verifier.verify(
+        {**headers, 'PAYPAL-CERT-URL': 'https://evil.example.com/cert.pem'}, body
+    )))
+    checks.append(('missing headers rejected', not verifier.verify({'PAYPAL-TRANSMISSION-ID': 'tx-1'}, body)))
+
+    untrusted, _ = verifier_for([make_cert('Someone Else CA', other_key, ca=True)], chain)
+    checks.append(('untrusted root rejected', not untrusted.verify(headers, body)))
+
+    expired_leaf = make_cert(SIGNING_CERT_COMMON_NAME, leaf_key, intermediate, intermediate_key, offset_days=-60)
+    expired, _ = verifier_for([root], pem(expired_leaf, intermediate))
+    checks.append(('expired certificate rejected', not expired.verify(headers, body)))
+
+    wrong_name_leaf = make_cert('www.example.com', leaf_key, intermediate, intermediate_key)
+    wrong_name, _ = verifier_for([root], pem(wrong_name_leaf, intermediate))
+    checks.append(('wrong certificate subject rejected', not wrong_name.verify(headers, body)))
+
+    non_ca = make_cert('Not A CA', intermediate_key, root, root_key, ca=False)
+    leaf_under_non_ca = make_cert(SIGNING_CERT_COMMON_NAME, leaf_key, non_ca, intermediate_key)
+    bad_issuer, _ = verifier_for([root], pem(leaf_under_non_ca, non_ca))
+    checks.append(('leaf issued by a non-CA rejected', not bad_issuer.verify(headers, body)))
+
+    failed = [name for name, passed in checks if not passed]
+    for name, passed in checks:
+        print(f"{'✅' if passed else '❌'} {name}")
+    if failed:
+        sys.exit(1)
+
+    start = time.perf_counter()
+    for _ in range(args.ops):
+        verifier.verify(headers, body)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{args.ops} verifications with a cached certificate: "
+          f"{elapsed / args.ops * 1e6:.1f} µs each ({args.ops / elapsed:,.0f}/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,45 @@
 import logging
 import asyncio
+import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Optional, Tuple, Dict
+from telegram import Update, User
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 from telegram.constants import ParseMode
+from telegram.error import Forbidden, TelegramError
 
 from config import (
     TELEGRAM_BOT_TOKEN, 
-    TELEGRAM_GROUP_INVITE_LINK, 
-    PAYMENT_AMOUNT, 
+    TELEGRAM_API_BASE_URL,
+    WEBHOOK_BASE_URL,
+    UPDATE_CONCURRENCY,
     PAYMENT_CURRENCY,
-    ADMIN_USER_ID
+    ADMIN_USER_ID,
+    SESSION_SWEEP_INTERVAL,
+    PAYMENT_SESSION_TTL_MINUTES,
+    PAYMENT_SESSION_REUSE_MIN_SECONDS,
+    PAYMENT_PRECREATE_ENABLED,
+    PAYMENT_PRECREATE_CONCURRENCY,
+    PAYMENT_START_LEASE_SECONDS,
+    PAYMENT_START_POLL_INTERVAL,
+    RECONCILE_INTERVAL,
+    RECONCILE_BATCH_SIZE,
+    RECONCILE_MAX_BATCHES,
+    RECONCILE_CONCURRENCY,
+    RECONCILE_MIN_AGE_MINUTES,
+    RECONCILE_LOOKBACK_HOURS,
+    RECONCILE_EXECUTE_LEASE_SECONDS,
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_WORKERS,
+    BROADCAST_LEASE_SECONDS
 )
-from database import DatabaseManager
-from paypal_handler import PayPalHandler
+from async_database import AsyncDatabaseManager
+from database import UserStatus, BROADCAST_AUDIENCE_FILTERS
+from paypal_handler import AsyncPayPalHandler
+from send_scheduler import SendScheduler, PRIORITY_INVITE, PRIORITY_BULK
+from templates import TemplateRegistry
+from update_processor import PerUserUpdateProcessor
 
 # Configure logging
 logging.basicConfig(
@@ -23,18 +48,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# job_checkpoints row holding the last payment session id reconciled in the current pass
+RECONCILE_CHECKPOINT = 'payment_reconciliation'
+
+# Reply to /broadcast without a valid action
+BROADCAST_USAGE = (
+    "Usage: `/broadcast <all|paid|unpaid> <message>`\n"
+    "`/broadcast` shows the latest broadcast, `/broadcast cancel` stops the running one."
+)
+
 class InviteMemberBot:
     def __init__(self):
-        self.db = DatabaseManager()
-        self.paypal = PayPalHandler()
+        self.db = AsyncDatabaseManager()
+        self.paypal = AsyncPayPalHandler()
+        self.send_scheduler = SendScheduler()
+        self.templates = TemplateRegistry()
+        self.update_processor = None
         self.app = None
+        self.last_sweep = None
+        self.last_reconcile = None
+        self.last_broadcast = None
+        self._broadcast_task: Optional[asyncio.Task] = None
+        self._broadcast_id: Optional[int] = None
+        
+        # Speculative payment creation on /start
+        self._precreate_tasks: Dict[int, asyncio.Task] = {}
+        self.precreate_metrics = {
+            'started': 0,
+            'created': 0,
+            'failed': 0,
+            'skipped': 0,
+            'hits': 0,
+            'misses': 0,
+            'wasted': 0
+        }
+        
+        # One payment creation per user at a time: shared in-process, leased across processes
+        self.instance_id = uuid.uuid4().hex
+        self._payment_starts: Dict[int, asyncio.Future] = {}
+        self.payment_start_metrics = {
+            'started': 0,
+            'shared': 0,
+            'lease_waits': 0
+        }
         
         # For webhook mode (if you want to use webhooks instead of polling)
-        self.webhook_base_url = "https://your-domain.com"  # Update this if using webhooks
+        self.webhook_base_url = WEBHOOK_BASE_URL
     
-    def setup_application(self):
+    def setup_application(self, update_concurrency: int = None):
         """Setup the Telegram bot application"""
-        self.app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        self.update_processor = PerUserUpdateProcessor(update_concurrency or UPDATE_CONCURRENCY)
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .rate_limiter(self.send_scheduler)
+            .concurrent_updates(self.update_processor)
+            .post_stop(self.post_stop)
+            .post_shutdown(self.post_shutdown)
+        )
+        if TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(TELEGRAM_API_BASE_URL)
+        self.app = builder.build()
         
         # Command handlers
         self.app.add_handler(CommandHandler("start", self.start_command))
@@ -45,6 +119,8 @@ class InviteMemberBot:
         # Admin commands
         self.app.add_handler(CommandHandler("admin", self.admin_command))
         self.app.add_handler(CommandHandler("stats", self.stats_command))
+        self.app.add_handler(CommandHandler("rebuildstats", self.rebuild_stats_command))
+        self.app.add_handler(CommandHandler("broadcast", self.broadcast_command))
         
         # Callback query handler
         self.app.add_handler(CallbackQueryHandler(self.button_callback))
@@ -52,15 +128,278 @@ class InviteMemberBot:
         # Message handler for general messages
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         
+        # Background maintenance jobs
+        if self.app.job_queue:
+            self.app.job_queue.run_repeating(
+                self.sweep_sessions_job,
+                interval=SESSION_SWEEP_INTERVAL,
+                first=SESSION_SWEEP_INTERVAL
+            )
+            self.app.job_queue.run_repeating(
+                self.reconcile_payments_job,
+                interval=RECONCILE_INTERVAL,
+                first=RECONCILE_INTERVAL
+            )
+            # Picks up a broadcast interrupted by a restart, or left by a process that stopped
+            self.app.job_queue.run_repeating(
+                self.resume_broadcast_job,
+                interval=BROADCAST_LEASE_SECONDS,
+                first=5
+            )
+        else:
+            logger.warning("JobQueue unavailable, payment session sweeper, reconciliation and broadcast resume disabled")
+        
         logger.info("Bot application setup complete")
     
+    async def sweep_sessions_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Expire and archive stale payment sessions"""
+        try:
+            result = await self.db.sweep_payment_sessions()
+        except Exception as e:
+            logger.error(f"Payment session sweep failed: {e}")
+            return
+        
+        self.last_sweep = result
+        self.precreate_metrics['wasted'] += result['precreated_wasted']
+        logger.info(
+            f"Payment session sweep: {result['expired']} expired, {result['archived']} archived, "
+            f"{result['freed_pages']} pages freed in {result['duration'] * 1000:.1f} ms "
+            f"({result['rows_per_sec']:.0f} rows/s)"
+        )
+    
+    async def reconcile_payments_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Finalize payments whose buyer never returned to /payment/success
+        Unfinished sessions are read in id order, one batch at a time, and checked
+        against PayPal with bounded concurrency. The position is checkpointed after
+        every batch, so a restart resumes the pass instead of starting over.
+        """
+        if not self.paypal.available:
+            logger.info("PayPal unavailable, skipping payment reconciliation")
+            return
+        
+        started = time.perf_counter()
+        result = {'checked': 0, 'completed': 0, 'errors': 0, 'pass_finished': False}
+        semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+        
+        try:
+            position = await self.db.get_checkpoint(RECONCILE_CHECKPOINT)
+            for _ in range(RECONCILE_MAX_BATCHES):
+                sessions = await self.db.get_unfinished_sessions(
+                    position, RECONCILE_BATCH_SIZE, RECONCILE_MIN_AGE_MINUTES, RECONCILE_LOOKBACK_HOURS
+                )
+                outcomes = await asyncio.gather(*(self._reconcile_session(s, semaphore) for s in sessions))
+                result['checked'] += len(sessions)
+                result['completed'] += outcomes.count('completed')
+                result['errors'] += outcomes.count('error')
+                
+                if not self.paypal.available:
+                    # PayPal failed mid-batch: check this batch again next run
+                    break
+                if len(sessions) < RECONCILE_BATCH_SIZE:
+                    # End of the table; the next run starts a new pass
+                    position = 0
+                    result['pass_finished'] = True
+                else:
+                    position = sessions[-1]['id']
+                await self.db.set_checkpoint(RECONCILE_CHECKPOINT, position)
+                if result['pass_finished']:
+                    break
+        except Exception as e:
+            logger.error(f"Payment reconciliation failed: {e}")
+        
+        result['duration'] = time.perf_counter() - started
+        self.last_reconcile = result
+        logger.info(
+            f"Payment reconciliation: {result['checked']} sessions checked, {result['completed']} completed, "
+            f"{result['errors']} errors in {result['duration']:.1f}s"
+        )
+    
+    async def _reconcile_session(self, session: Dict, semaphore: asyncio.Semaphore) -> str:
+        """
+        Check one unfinished session against PayPal and record it if it was paid
+        Returns: 'completed', 'skipped' (nothing to record) or 'error'
+        """
+        async with semaphore:
+            user_id = session['user_id']
+            payment_id = session['payment_id']
+            
+            details = await self.paypal.get_payment_details(payment_id)
+            if details is None:
+                return 'error'
+            
+            payer_id = details['payer_info'].get('payer_id')
+            if details['state'] == 'created' and payer_id:
+                # Approved by the buyer but never executed; never charge someone twice,
+                # so another process reconciling the same payment makes this one step aside
+                lease = f"execute:{payment_id}"
+                if not await self.db.acquire_lease(lease, self.instance_id, RECONCILE_EXECUTE_LEASE_SECONDS):
+                    return 'skipped'
+                try:
+                    if (await self.db.get_user_status(user_id, fresh=True)).has_paid:
+                        return 'skipped'
+                    success, executed = await self.paypal.execute_payment(payment_id, payer_id)
+                finally:
+                    await self.db.release_lease(lease, self.instance_id)
+                if not success:
+                    return 'error'
+                details = {**details, **executed}
+            elif details['state'] != 'approved':
+                return 'skipped'
+            
+            recorded = await self.db.complete_purchase(
+                user_id=user_id,
+                session_id=session['session_id'],
+                payment_id=payment_id,
+                payer_id=payer_id,
+                amount=details['amount'],
+                currency=details['currency'],
+                status='approved'
+            )
+            if not recorded:
+                # The redirect or another run got there first
+                return 'skipped'
+            
+            logger.info(f"Reconciled payment {payment_id} for user {user_id}")
+            await self.send_invite_link(None, user_id)
+            return 'completed'
+    
+    async def resume_broadcast_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Continue a running broadcast nobody is sending"""
+        try:
+            broadcast = await self.db.get_broadcast(running=True)
+        except Exception as e:
+            logger.error(f"Error looking for a broadcast to resume: {e}")
+            return
+        
+        if broadcast:
+            self.start_broadcast(broadcast['id'])
+    
+    def start_broadcast(self, broadcast_id: int):
+        """Send a broadcast in the background, one at a time per process"""
+        if self._broadcast_task and not self._broadcast_task.done():
+            if broadcast_id != self._broadcast_id:
+                # The previous broadcast is still sending its report: start right after it
+                def start_next(task: asyncio.Task):
+                    if not task.cancelled():
+                        self.start_broadcast(broadcast_id)
+                self._broadcast_task.add_done_callback(start_next)
+            return
+        self._broadcast_id = broadcast_id
+        self._broadcast_task = asyncio.create_task(self.run_broadcast(broadcast_id))
+    
+    async def run_broadcast(self, broadcast_id: int):
+        """
+        Send a broadcast to its audience, one page of recipients at a time
+        Each page is sent by BROADCAST_WORKERS concurrent senders in the send
+        scheduler's bulk lane, then checkpointed with its counts, so a restart
+        resumes after the last finished page. A lease keeps other processes
+        from sending the same broadcast.
+        """
+        lease = f"broadcast:{broadcast_id}"
+        try:
+            if not await self.db.acquire_lease(lease, self.instance_id, BROADCAST_LEASE_SECONDS):
+                # Another process is sending it
+                return
+            broadcast = await self.db.get_broadcast(broadcast_id)
+            if broadcast is None or broadcast['status'] != 'running':
+                return
+            
+            position = broadcast['last_user_id']
+            logger.info(f"Sending broadcast {broadcast_id} to {broadcast['audience']} users after user {position}")
+            semaphore = asyncio.Semaphore(BROADCAST_WORKERS)
+            while True:
+                started = time.perf_counter()
+                recipients = await self.db.get_broadcast_recipients(
+                    broadcast['audience'], position, BROADCAST_BATCH_SIZE
+                )
+                outcomes = await asyncio.gather(
+                    *(self._send_broadcast_message(user_id, broadcast['text'], semaphore) for user_id in recipients)
+                )
+                if recipients:
+                    position = recipients[-1]
+                still_running = await self.db.save_broadcast_progress(
+                    broadcast_id, position, outcomes.count('sent'), outcomes.count('failed'),
+                    outcomes.count('blocked'), time.perf_counter() - started
+                )
+                if not still_running:
+                    # Cancelled with /broadcast cancel
+                    break
+                if len(recipients) < BROADCAST_BATCH_SIZE:
+                    await self.db.finish_broadcast(broadcast_id, 'finished')
+                    break
+                if not await self.db.acquire_lease(lease, self.instance_id, BROADCAST_LEASE_SECONDS):
+                    logger.warning(f"Lost the lease on broadcast {broadcast_id}, leaving it to another process")
+                    return
+            
+            self.last_broadcast = await self.db.get_broadcast(broadcast_id)
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} failed: {e}")
+            return
+        finally:
+            await self.db.release_lease(lease, self.instance_id)
+        
+        logger.info(
+            f"Broadcast {broadcast_id} {self.last_broadcast['status']}: {self.last_broadcast['sent']} sent, "
+            f"{self.last_broadcast['blocked']} blocked, {self.last_broadcast['failed']} failed "
+            f"in {self.last_broadcast['elapsed']:.1f}s"
+        )
+        if self.last_broadcast['created_by']:
+            try:
+                await self.app.bot.send_message(
+                    chat_id=self.last_broadcast['created_by'],
+                    text=self.format_broadcast(self.last_broadcast),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            except TelegramError as e:
+                logger.error(f"Error sending broadcast report: {e}")
+    
+    async def _send_broadcast_message(self, user_id: int, text: str, semaphore: asyncio.Semaphore) -> str:
+        """
+        Send one broadcast message
+        Returns: 'sent', 'blocked' (the user blocked the bot or deleted their account) or 'failed'
+        """
+        async with semaphore:
+            try:
+                # Sent as written: a formatting mistake must not fail the whole audience
+                await self.app.bot.send_message(chat_id=user_id, text=text, rate_limit_args=PRIORITY_BULK)
+                return 'sent'
+            except Forbidden:
+                return 'blocked'
+            except TelegramError as e:
+                logger.warning(f"Broadcast message to user {user_id} failed: {e}")
+                return 'failed'
+    
+    @staticmethod
+    def format_broadcast(broadcast: Dict) -> str:
+        """Progress and outcome of a broadcast for admin messages"""
+        handled = broadcast['sent'] + broadcast['blocked'] + broadcast['failed']
+        throughput = handled / broadcast['elapsed'] if broadcast['elapsed'] > 0 else 0.0
+        return (
+            f"📣 **Broadcast #{broadcast['id']}** to {broadcast['audience']} users: {broadcast['status']}\n"
+            f"• Sent: {broadcast['sent']}, Blocked: {broadcast['blocked']}, Failed: {broadcast['failed']}\n"
+            f"• Throughput: {throughput:.1f} messages/s over {broadcast['elapsed']:.1f}s"
+        )
+    
+    async def post_stop(self, application: Application):
+        """Stop a broadcast in progress while the bot can still send"""
+        if self._broadcast_task and not self._broadcast_task.done():
+            # Resumed from its last checkpoint on the next start
+            self._broadcast_task.cancel()
+            await asyncio.gather(self._broadcast_task, return_exceptions=True)
+    
+    async def post_shutdown(self, application: Application):
+        """Release database and PayPal resources once the application has stopped"""
+        await self.paypal.close()
+        self.db.close()
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
         chat_id = update.effective_chat.id
         
         # Add user to database
-        self.db.add_user(
+        await self.db.queue_user_upsert(
             user_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -68,122 +407,56 @@ class InviteMemberBot:
         )
         
         # Check if user has already paid
-        if self.db.user_has_paid(user.id):
-            if self.db.user_has_invite(user.id):
-                await update.message.reply_text(
-                    "✅ You have already paid and received the invite link!\n\n"
-                    "If you need the link again, please contact support."
-                )
+        templates = self.templates.for_user(user)
+        status = await self.db.get_user_status(user.id)
+        if status.has_paid:
+            if status.invite_sent:
+                await update.message.reply_text(templates.text('already_invited'))
             else:
                 # Send invite link
                 await self.send_invite_link(update, user.id)
             return
         
-        welcome_message = f"""
-🤖 **Welcome to the Premium Group Access Bot!**
-
-Hello {user.first_name}! 👋
-
-To join our exclusive Telegram group, you need to make a one-time payment of **${PAYMENT_AMOUNT} {PAYMENT_CURRENCY}**.
-
-**What you get:**
-• Access to our premium Telegram group
-• Exclusive content and discussions
-• Direct access to community members
-• Lifetime membership
-
-**How it works:**
-1. Click the "💳 Pay Now" button below
-2. Complete the payment via PayPal
-3. Receive your invite link automatically
-
-Ready to join? Click the button below! 👇
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Pay Now", callback_data="pay_now")],
-            [InlineKeyboardButton("ℹ️ Help", callback_data="help")],
-            [InlineKeyboardButton("📊 My Status", callback_data="status")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Have a payment link ready by the time the user taps "Pay Now"
+        if PAYMENT_PRECREATE_ENABLED and not self.reusable_payment_session(status)[0]:
+            self.schedule_payment_precreation(user.id)
         
         await update.message.reply_text(
-            welcome_message,
+            templates.text('welcome', first_name=user.first_name),
             parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup
+            reply_markup=templates.start_keyboard
         )
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        help_text = """
-🆘 **Help & Support**
-
-**Available Commands:**
-• `/start` - Start the bot and see payment options
-• `/help` - Show this help message
-• `/status` - Check your payment status
-• `/pay` - Start the payment process
-
-**How to join the group:**
-1. Use `/start` to begin
-2. Click "💳 Pay Now" to make payment
-3. Complete PayPal payment
-4. Receive your invite link
-
-**Payment Information:**
-• Amount: $10.00 USD
-• Method: PayPal
-• One-time payment
-• Lifetime access
-
-**Need Support?**
-If you encounter any issues, please contact our support team.
-
-**Security Note:**
-We use secure PayPal payments. Your financial information is protected.
-        """
-        
         await update.message.reply_text(
-            help_text,
+            self.templates.for_user(self._user_of(update)).text('help'),
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /status command"""
-        user_id = update.effective_user.id
-        user_data = self.db.get_user(user_id)
+        user = self._user_of(update)
+        templates = self.templates.for_user(user)
+        status = await self.db.get_user_status(user.id)
         
-        if not user_data:
-            await update.message.reply_text("❌ User not found. Please use /start first.")
+        if not status.exists:
+            await update.message.reply_text(templates.text('user_not_found'))
             return
         
-        has_paid = self.db.user_has_paid(user_id)
-        has_invite = self.db.user_has_invite(user_id)
-        
-        if has_paid and has_invite:
-            status_text = "✅ **Payment Status: COMPLETED**\n\n" \
-                         "You have successfully paid and received access to the group!"
-        elif has_paid and not has_invite:
-            status_text = "⏳ **Payment Status: PAID**\n\n" \
-                         "Your payment is confirmed. Processing your invite link..."
+        if status.has_paid and status.invite_sent:
+            status_text = templates.text('status_completed')
+        elif status.has_paid:
+            status_text = templates.text('status_paid')
             # Send invite link
-            await self.send_invite_link(update, user_id)
+            await self.send_invite_link(update, user.id)
         else:
-            status_text = f"❌ **Payment Status: PENDING**\n\n" \
-                         f"You haven't completed the payment yet.\n" \
-                         f"Amount required: ${PAYMENT_AMOUNT} {PAYMENT_CURRENCY}\n\n" \
-                         f"Use /pay to start the payment process."
-        
-        keyboard = [
-            [InlineKeyboardButton("💳 Pay Now", callback_data="pay_now")] if not has_paid else [],
-            [InlineKeyboardButton("🔄 Refresh Status", callback_data="status")]
-        ]
-        reply_markup = InlineKeyboardMarkup([btn for btn in keyboard if btn])
+            status_text = templates.text('status_pending')
         
         await update.message.reply_text(
             status_text,
             parse_mode=ParseMode.MARKDOWN,
-            reply_markup=reply_markup if keyboard else None
+            reply_markup=templates.status_keyboard_paid if status.has_paid else templates.status_keyboard_unpaid
         )
     
     async def pay_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -191,11 +464,14 @@ We use secure PayPal payments. Your financial information is protected.
         user_id = update.effective_user.id
         
         # Check if user already paid
-        if self.db.user_has_paid(user_id):
-            await update.message.reply_text("✅ You have already completed the payment!")
+        status = await self.db.get_user_status(user_id)
+        if status.has_paid:
+            await update.message.reply_text(
+                self.templates.for_user(update.effective_user).text('already_paid')
+            )
             return
         
-        await self.initiate_payment(update, user_id)
+        await self.initiate_payment(update, user_id, status)
     
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /admin command"""
@@ -210,6 +486,8 @@ We use secure PayPal payments. Your financial information is protected.
 
 **Available Commands:**
 • `/stats` - View bot statistics
+• `/rebuildstats` - Recompute statistics from raw data
+• `/broadcast <all|paid|unpaid> <message>` - Message users
 • `/admin` - Show this admin panel
 
 **Quick Stats:**
@@ -229,7 +507,15 @@ Use /stats for detailed statistics.
             await update.message.reply_text("❌ Access denied. Admin only.")
             return
         
-        stats = self.db.get_user_stats()
+        stats = await self.db.get_user_stats()
+        cache = self.db.cache_stats()
+        paypal = self.paypal.metrics()
+        token = paypal['token']
+        breaker = paypal['breaker']
+        retries = ', '.join(f"{op}: {count}" for op, count in sorted(paypal['retries'].items())) or 'none'
+        sends = self.send_scheduler.metrics()
+        updates = self.update_processor.metrics()
+        queued = ', '.join(f"{lane}: {count}" for lane, count in sends['queued'].items())
         
         stats_text = f"""
 📊 **Bot Statistics**
@@ -245,13 +531,135 @@ Use /stats for detailed statistics.
 📈 **Conversion Rate:**
 • Payment Rate: {(stats['paid_users'] / max(stats['total_users'], 1) * 100):.1f}%
 • Invite Rate: {(stats['invited_users'] / max(stats['paid_users'], 1) * 100):.1f}%
+
+⚡ **User Cache:**
+• Hit Rate: {cache['hit_rate'] * 100:.1f}% ({cache['hits']} hits / {cache['misses']} misses)
+• Entries: {cache['size']}/{cache['maxsize']}
+
+🔑 **PayPal Token:**
+• Fetches: {token['fetch_count']} ({token['fetch_failures']} failed, {token['background_refreshes']} background)
+• Last Refresh: {(token['last_refresh_latency'] or 0) * 1000:.0f} ms
+
+🛡 **PayPal Health:**
+• Circuit: {breaker['state']} (opened {breaker['times_opened']} times, {breaker['rejected_calls']} calls rejected)
+• Retries: {retries}
+
+📨 **Telegram Sends:**
+• Queued: {queued}
+• Sent: {sum(sends['sent'].values())} ({sends['failed']} failed, {sends['retry_afters']} flood waits)
+• Reply Latency: p50 {sends['latency_ms']['reply']['p50']:.0f} ms, p95 {sends['latency_ms']['reply']['p95']:.0f} ms
+
+⚙️ **Update Processing:**
+• Concurrency: {updates['concurrency']}, In Flight: {updates['in_flight']}, Processed: {updates['processed']}
         """
         
+        if PAYMENT_PRECREATE_ENABLED:
+            precreate = self.precreate_metrics
+            shown = precreate['hits'] + precreate['misses']
+            stats_text += (
+                f"\n🚀 **Payment Pre-creation:**\n"
+                f"• Hit Rate: {precreate['hits'] / max(shown, 1) * 100:.1f}% "
+                f"({precreate['hits']} hits / {precreate['misses']} misses)\n"
+                f"• Created: {precreate['created']}, Failed: {precreate['failed']}, "
+                f"Skipped: {precreate['skipped']}, Wasted: {precreate['wasted']}\n"
+            )
+        
+        starts = self.payment_start_metrics
+        stats_text += (
+            f"\n🔒 **Payment Starts:**\n"
+            f"• Started: {starts['started']}, Shared: {starts['shared']}, "
+            f"Waited on another process: {starts['lease_waits']}\n"
+        )
+        
+        if self.last_reconcile:
+            stats_text += (
+                f"\n🔁 **Last Payment Reconciliation:**\n"
+                f"• Checked: {self.last_reconcile['checked']}, Completed: {self.last_reconcile['completed']}, "
+                f"Errors: {self.last_reconcile['errors']}\n"
+            )
+        
+        if self.last_broadcast:
+            stats_text += f"\n{self.format_broadcast(self.last_broadcast)}\n"
+        
+        if self.last_sweep:
+            stats_text += (
+                f"\n🧹 **Last Session Sweep:**\n"
+                f"• Expired: {self.last_sweep['expired']}, Archived: {self.last_sweep['archived']}\n"
+                f"• Took {self.last_sweep['duration'] * 1000:.1f} ms ({self.last_sweep['rows_per_sec']:.0f} rows/s)\n"
+            )
+        
         await update.message.reply_text(
             stats_text,
             parse_mode=ParseMode.MARKDOWN
         )
     
+    async def rebuild_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /rebuildstats command"""
+        user_id = update.effective_user.id
+        
+        if str(user_id) != str(ADMIN_USER_ID):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        result = await self.db.rebuild_stats()
+        before, after = result['before'], result['after']
+        
+        if result['consistent']:
+            rebuild_text = "✅ **Statistics verified**\n\nCounters match the raw tables."
+        else:
+            drift = "\n".join(
+                f"• {name}: {before[name]} → {after[name]}"
+                for name in after if before[name] != after[name]
+            )
+            rebuild_text = f"⚠️ **Statistics rebuilt**\n\nCorrected counters:\n{drift}"
+        
+        await update.message.reply_text(
+            rebuild_text,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    async def broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /broadcast command"""
+        user_id = update.effective_user.id
+        
+        if str(user_id) != str(ADMIN_USER_ID):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        # Split off the audience only, so the message keeps its line breaks
+        parts = update.message.text.split(maxsplit=2)
+        action = parts[1].lower() if len(parts) > 1 else None
+        
+        if action is None:
+            broadcast = await self.db.get_broadcast()
+            broadcast_text = f"{self.format_broadcast(broadcast)}\n\n{BROADCAST_USAGE}" if broadcast else BROADCAST_USAGE
+        elif action == 'cancel':
+            broadcast = await self.db.get_broadcast(running=True)
+            if broadcast and await self.db.finish_broadcast(broadcast['id'], 'cancelled'):
+                broadcast_text = (
+                    f"🛑 Broadcast #{broadcast['id']} cancelled. "
+                    f"The final counts follow once the messages in flight are done."
+                )
+            else:
+                broadcast_text = "No broadcast is running."
+        elif action in BROADCAST_AUDIENCE_FILTERS and len(parts) == 3:
+            broadcast_id = await self.db.create_broadcast(action, parts[2], user_id)
+            if broadcast_id is None:
+                broadcast_text = "⚠️ A broadcast is already running. Stop it with `/broadcast cancel` first."
+            else:
+                self.start_broadcast(broadcast_id)
+                broadcast_text = (
+                    f"📣 Broadcast #{broadcast_id} to {action} users started. "
+                    f"You will get a report when it finishes."
+                )
+        else:
+            broadcast_text = BROADCAST_USAGE
+        
+        await update.message.reply_text(
+            broadcast_text,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle inline button callbacks"""
         query = update.callback_query
@@ -267,52 +675,43 @@ Use /stats for detailed statistics.
         elif data == "status":
             await self.status_command(query, context)
     
-    async def initiate_payment(self, update, user_id: int):
+    async def initiate_payment(self, update, user_id: int, status: Optional[UserStatus] = None):
         """Initiate PayPal payment process"""
+        templates = self.templates.for_user(self._user_of(update))
         try:
-            # Generate session ID
-            session_id = PayPalHandler.generate_session_id()
+            if status is None:
+                status = await self.db.get_user_status(user_id)
             
-            # Create return URLs (for webhook mode, update base URL)
-            return_url, cancel_url = self.paypal.create_return_urls(
-                self.webhook_base_url, 
-                session_id
-            )
+            if status.has_paid:
+                already_paid_text = templates.text('already_paid')
+                if hasattr(update, 'message'):
+                    await update.message.reply_text(already_paid_text)
+                else:
+                    await update.edit_message_text(already_paid_text)
+                return
             
-            # Create PayPal payment
-            payment_url, payment_id = self.paypal.create_payment(
-                user_id=user_id,
-                return_url=return_url,
-                cancel_url=cancel_url
-            )
+            # A pre-creation for this user may still be talking to PayPal
+            precreation = self._precreate_tasks.get(user_id)
+            if precreation:
+                await asyncio.shield(precreation)
+                status = await self.db.get_user_status(user_id)
             
-            if payment_url and payment_id:
-                # Store payment session
-                expires_at = datetime.now() + timedelta(minutes=30)  # 30 minutes expiry
-                self.db.add_payment_session(
-                    user_id=user_id,
-                    session_id=session_id,
-                    payment_url=payment_url,
-                    expires_at=expires_at
-                )
-                
-                payment_text = f"""
-💳 **Payment Ready**
-
-Amount: **${PAYMENT_AMOUNT} {PAYMENT_CURRENCY}**
-
-Click the button below to complete your payment via PayPal.
-
-⏰ This payment link expires in 30 minutes.
-
-After successful payment, you'll automatically receive your invite link!
-                """
+            # Hand out the user's still-valid link instead of creating another payment
+            payment_url, expires_at = self.reusable_payment_session(status)
+            if payment_url:
+                logger.info(f"Reusing pending payment session for user {user_id}")
+                if status.session_precreated and await self.db.claim_precreated_session(status.session_id):
+                    self.precreate_metrics['hits'] += 1
+            elif self.paypal.available:
+                if PAYMENT_PRECREATE_ENABLED:
+                    self.precreate_metrics['misses'] += 1
+                payment_url, expires_at = await self.start_payment(user_id)
+            
+            if payment_url:
+                minutes_left = max(1, int((expires_at - datetime.now()).total_seconds() // 60))
                 
-                keyboard = [
-                    [InlineKeyboardButton("💳 Pay with PayPal", url=payment_url)],
-                    [InlineKeyboardButton("❌ Cancel", callback_data="cancel_payment")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                payment_text = templates.text('payment_ready', minutes_left=minutes_left)
+                reply_markup = templates.payment_keyboard(payment_url)
                 
                 if hasattr(update, 'message'):
                     await update.message.reply_text(
@@ -327,7 +726,7 @@ After successful payment, you'll automatically receive your invite link!
                         reply_markup=reply_markup
                     )
             else:
-                error_text = "❌ Failed to create payment. Please try again later."
+                error_text = templates.text('payment_failed' if self.paypal.available else 'payments_unavailable')
                 if hasattr(update, 'message'):
                     await update.message.reply_text(error_text)
                 else:
@@ -335,48 +734,221 @@ After successful payment, you'll automatically receive your invite link!
                     
         except Exception as e:
             logger.error(f"Error initiating payment: {e}")
-            error_text = "❌ An error occurred while processing your request. Please try again."
+            error_text = templates.text('payment_error')
             if hasattr(update, 'message'):
                 await update.message.reply_text(error_text)
             else:
                 await update.edit_message_text(error_text)
     
+    @staticmethod
+    def _user_of(update) -> Optional[User]:
+        """Sender of an Update or of a CallbackQuery passed in its place"""
+        if isinstance(update, Update):
+            return update.effective_user
+        return getattr(update, 'from_user', None)
+
+    @staticmethod
+    def reusable_payment_session(status: UserStatus) -> Tuple[Optional[str], Optional[datetime]]:
+        """
+        Return the pending session's link if it stays valid long enough to use
+        Returns: (payment_url, expires_at) or (None, None)
+        """
+        if not status.has_pending_session:
+            return None, None
+        
+        expires_at = datetime.fromisoformat(status.session_expires_at)
+        if (expires_at - datetime.now()).total_seconds() < PAYMENT_SESSION_REUSE_MIN_SECONDS:
+            return None, None
+        
+        return status.payment_url, expires_at
+    
+    def schedule_payment_precreation(self, user_id: int):
+        """Create a payment for the user in the background, within the concurrency cap"""
+        if user_id in self._precreate_tasks or user_id in self._payment_starts or not self.paypal.available:
+            return
+        
+        if len(self._precreate_tasks) >= PAYMENT_PRECREATE_CONCURRENCY:
+            # At the cap: the user just pays the normal latency if they tap "Pay Now"
+            self.precreate_metrics['skipped'] += 1
+            return
+        
+        self.precreate_metrics['started'] += 1
+        task = asyncio.create_task(self._precreate_payment(user_id))
+        self._precreate_tasks[user_id] = task
+        task.add_done_callback(lambda _: self._precreate_tasks.pop(user_id, None))
+    
+    async def _precreate_payment(self, user_id: int):
+        """Background body of schedule_payment_precreation"""
+        try:
+            payment_url, _ = await self.start_payment(user_id, precreated=True)
+        except Exception as e:
+            logger.error(f"Error pre-creating payment for user {user_id}: {e}")
+            payment_url = None
+        
+        self.precreate_metrics['created' if payment_url else 'failed'] += 1
+    
+    async def start_payment(self, user_id: int, precreated: bool = False) -> Tuple[Optional[str], Optional[datetime]]:
+        """
+        Get the user a payment link, creating at most one payment at a time per user
+        Concurrent calls in this process share one result; across processes a
+        lease row makes later callers wait for the session the first one creates.
+        Returns: (payment_url, expires_at) or (None, None) if failed
+        """
+        # Double taps and /pay during a callback: share the call in flight
+        if user_id in self._payment_starts:
+            self.payment_start_metrics['shared'] += 1
+            return await asyncio.shield(self._payment_starts[user_id])
+        
+        self.payment_start_metrics['started'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._payment_starts[user_id] = future
+        try:
+            result = await self._start_payment_leased(user_id, precreated)
+        except asyncio.CancelledError:
+            # This task itself was cancelled
+            future.cancel()
+            raise
+        except Exception as e:
+            # Callers sharing the future get the real error, not a cancellation
+            future.set_exception(e)
+            # Raised to this caller below, so it never goes unretrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.set_exception(RuntimeError(f"Payment start for user {user_id} was interrupted"))
+                future.exception()
+            del self._payment_starts[user_id]
+    
+    async def _start_payment_leased(self, user_id: int, precreated: bool) -> Tuple[Optional[str], Optional[datetime]]:
+        """Body of start_payment, run while holding the user's payment_start lease"""
+        lease = f"payment_start:{user_id}"
+        deadline = time.monotonic() + PAYMENT_START_LEASE_SECONDS
+        waited = False
+        while True:
+            try:
+                acquired = await self.db.acquire_lease(lease, self.instance_id, PAYMENT_START_LEASE_SECONDS)
+            except Exception as e:
+                # Better a rare duplicate payment than no payment link at all
+                logger.error(f"Proceeding without payment start lease for user {user_id}: {e}")
+                acquired = None
+            if acquired is not False:
+                break
+            
+            # Another process is creating this user's payment: wait for its session
+            if not waited:
+                self.payment_start_metrics['lease_waits'] += 1
+                waited = True
+            if time.monotonic() >= deadline:
+                return None, None
+            await asyncio.sleep(PAYMENT_START_POLL_INTERVAL)
+            payment_url, expires_at = self.reusable_payment_session(await self.db.get_user_status(user_id, fresh=True))
+            if payment_url:
+                return payment_url, expires_at
+        
+        try:
+            # The previous holder may have stored a session just before we got the lease
+            payment_url, expires_at = self.reusable_payment_session(await self.db.get_user_status(user_id, fresh=True))
+            if payment_url:
+                return payment_url, expires_at
+            return await self.create_payment_session(user_id, precreated=precreated)
+        finally:
+            if acquired:
+                await self.db.release_lease(lease, self.instance_id)
+    
+    async def create_payment_session(self, user_id: int, precreated: bool = False) -> Tuple[Optional[str], Optional[datetime]]:
+        """
+        Create a PayPal payment and store it as a pending session
+        Returns: (payment_url, expires_at) or (None, None) if failed
+        """
+        # Generate session ID
+        session_id = self.paypal.generate_session_id()
+        
+        # Create return URLs (for webhook mode, update base URL)
+        return_url, cancel_url = self.paypal.create_return_urls(
+            self.webhook_base_url, 
+            session_id
+        )
+        
+        # Create PayPal payment
+        payment_url, payment_id = await self.paypal.create_payment(
+            user_id=user_id,
+            return_url=return_url,
+            cancel_url=cancel_url
+        )
+        
+        if not (payment_url and payment_id):
+            return None, None
+        
+        # Store payment session
+        expires_at = datetime.now() + timedelta(minutes=PAYMENT_SESSION_TTL_MINUTES)
+        await self.db.add_payment_session(
+            user_id=user_id,
+            session_id=session_id,
+            payment_url=payment_url,
+            expires_at=expires_at,
+            precreated=precreated,
+            payment_id=payment_id
+        )
+        
+        return payment_url, expires_at
+    
+    async def complete_payment_return(self, session_id: str, payment_id: str, payer_id: str) -> Optional[bool]:
+        """
+        Finish a purchase when PayPal redirects the buyer back to /payment/success
+        Returns: True if the payment is complete, False if it failed, None for an unknown
+        session or a payment that was not created for it
+        """
+        session = await self.db.get_payment_session(session_id)
+        # The payment must be the one created for this session, or any buyer's
+        # session could be paired with someone else's completed payment
+        if not session or session['payment_id'] != payment_id:
+            return None
+        
+        user_id = session['user_id']
+        if await self.db.payment_recorded(payment_id):
+            # A retried redirect is a no-op, unless the invite never went out
+            status = await self.db.get_user_status(user_id, fresh=True)
+            if status.has_paid and not status.invite_sent:
+                await self.send_invite_link(None, user_id)
+            return True
+        
+        success, payment_details = await self.paypal.execute_payment(payment_id, payer_id)
+        if not success:
+            return False
+        
+        # False means a concurrent redirect or webhook recorded it first
+        if await self.db.complete_purchase(
+            user_id=user_id,
+            session_id=session_id,
+            payment_id=payment_details['payment_id'],
+            payer_id=payer_id,
+            amount=payment_details['amount'],
+            currency=payment_details['currency'],
+            status='approved'
+        ):
+            await self.send_invite_link(None, user_id)
+        return True
+    
     async def send_invite_link(self, update, user_id: int):
         """Send the Telegram group invite link to user"""
         try:
-            invite_text = f"""
-🎉 **Welcome to the Premium Group!**
-
-Congratulations! Your payment has been confirmed.
-
-Here's your exclusive invite link:
-{TELEGRAM_GROUP_INVITE_LINK}
-
-**Important Notes:**
-• This link is for your personal use only
-• Click the link to join the group immediately
-• Save this message for future reference
-
-Welcome to our community! 🚀
-            """
+            invite_text = self.templates.for_user(self._user_of(update)).text('invite')
             
-            # Mark invite as sent
-            self.db.mark_invite_sent(user_id)
+            # Invites jump the send queue ahead of ordinary replies
+            await self.app.bot.send_message(
+                chat_id=user_id,
+                text=invite_text,
+                parse_mode=ParseMode.MARKDOWN,
+                disable_web_page_preview=True,
+                rate_limit_args=PRIORITY_INVITE
+            )
             
-            if hasattr(update, 'message'):
-                await update.message.reply_text(
-                    invite_text,
-                    parse_mode=ParseMode.MARKDOWN,
-                    disable_web_page_preview=True
-                )
-            else:
-                # Send as new message to user
-                await self.app.bot.send_message(
-                    chat_id=user_id,
-                    text=invite_text,
-                    parse_mode=ParseMode.MARKDOWN,
-                    disable_web_page_preview=True
-                )
+            # Mark invite as sent only once it went out, so a failed send is retried
+            await self.db.mark_invite_sent(user_id)
             
             logger.info(f"Invite link sent to user {user_id}")
             
@@ -389,7 +961,7 @@ Welcome to our community! 🚀
         
         # Add user to database if not exists
         user = update.effective_user
-        self.db.add_user(
+        await self.db.queue_user_upsert(
             user_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -397,17 +969,7 @@ Welcome to our community! 🚀
         )
         
         # Provide helpful response
-        response_text = """
-👋 Hello! I'm the Premium Group Access Bot.
-
-To get started, use one of these commands:
-• /start - Begin the process
-• /pay - Make payment for group access
-• /status - Check your payment status
-• /help - Get help and support
-
-Ready to join our exclusive group? Use /start! 🚀
-        """
+        response_text = self.templates.for_user(user).text('fallback')
         
         await update.message.reply_text(response_text)
     
@@ -0,0 +1,91 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe bounded LRU cache whose entries also expire after a fixed TTL
+    Tracks hits and misses so callers can report how much load it absorbs.
+    Each key also has an invalidation generation, so a value read from the
+    database before a concurrent invalidate is not cached after it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Generation of recently invalidated keys, bounded like the entries;
+        # forgotten keys report the newest generation ever forgotten
+        self._generations: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._generation_counter = 0
+        self._generation_floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def generation(self, key: Hashable) -> int:
+        """Token to pass to set() for a value about to be read from the source"""
+        with self._lock:
+            return self._generations.get(key, self._generation_floor)
+
+    def set(self, key: Hashable, value: Any, ttl: float = None, generation: int = None):
+        """
+        Store a value, evicting the least recently used entry when full
+        With a generation from generation(), nothing is stored if the key was
+        invalidated since, as the value may predate that write.
+        """
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._generation_floor) != generation:
+                return
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation_counter += 1
+            self._generations[key] = self._generation_counter
+            self._generations.move_to_end(key)
+            while len(self._generations) > self.maxsize:
+                _, forgotten = self._generations.popitem(last=False)
+                self._generation_floor = max(self._generation_floor, forgotten)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+            self._generations.clear()
+            self._generation_counter += 1
+            self._generation_floor = self._generation_counter
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
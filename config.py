@@ -6,19 +6,111 @@ load_dotenv()
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_GROUP_INVITE_LINK = os.getenv('TELEGRAM_GROUP_INVITE_LINK')
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')  # e.g. a local Bot API server; the token is appended
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', 'https://your-domain.com')  # Public URL of webhook_server.py
+# Telegram update webhook served by the ASGI server (run.py --mode asgi)
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram/webhook')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')  # Checked against X-Telegram-Bot-Api-Secret-Token
+# Outbound flow control, kept under Telegram's documented flood limits
+TELEGRAM_SEND_GLOBAL_RATE = float(os.getenv('TELEGRAM_SEND_GLOBAL_RATE', '30'))  # messages per second
+TELEGRAM_SEND_CHAT_RATE = float(os.getenv('TELEGRAM_SEND_CHAT_RATE', '1'))  # messages per second to one chat
+TELEGRAM_SEND_CHAT_BURST = float(os.getenv('TELEGRAM_SEND_CHAT_BURST', '3'))
+TELEGRAM_SEND_GROUP_RATE_PER_MINUTE = float(os.getenv('TELEGRAM_SEND_GROUP_RATE_PER_MINUTE', '20'))
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv('TELEGRAM_SEND_MAX_RETRIES', '3'))  # resends after RetryAfter
+# Updates handled at once; one user's updates are always handled in order. 1 = sequential
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
 
 # PayPal Configuration
 PAYPAL_CLIENT_ID = os.getenv('PAYPAL_CLIENT_ID')
 PAYPAL_CLIENT_SECRET = os.getenv('PAYPAL_CLIENT_SECRET')
 PAYPAL_MODE = os.getenv('PAYPAL_MODE', 'sandbox')  # 'sandbox' or 'live'
+PAYPAL_API_BASE_URL = os.getenv('PAYPAL_API_BASE_URL')  # Overrides the URL implied by PAYPAL_MODE
+PAYPAL_HTTP_TIMEOUT = float(os.getenv('PAYPAL_HTTP_TIMEOUT', '15'))  # seconds
+PAYPAL_MAX_CONNECTIONS = int(os.getenv('PAYPAL_MAX_CONNECTIONS', '20'))
+PAYPAL_MAX_CONCURRENCY = int(os.getenv('PAYPAL_MAX_CONCURRENCY', '10'))
+PAYPAL_TOKEN_REFRESH_MARGIN = float(os.getenv('PAYPAL_TOKEN_REFRESH_MARGIN', '300'))  # seconds before expiry
+PAYPAL_PAYMENT_CACHE_SIZE = int(os.getenv('PAYPAL_PAYMENT_CACHE_SIZE', '5000'))
+PAYPAL_PAYMENT_CACHE_TTL = float(os.getenv('PAYPAL_PAYMENT_CACHE_TTL', '900'))  # seconds
+# Webhook signatures are verified locally when the webhook id is set
+PAYPAL_WEBHOOK_ID = os.getenv('PAYPAL_WEBHOOK_ID')
+PAYPAL_WEBHOOK_CERT_HOSTS = tuple(
+    host.strip() for host in os.getenv(
+        'PAYPAL_WEBHOOK_CERT_HOSTS',
+        'api.paypal.com,api-m.paypal.com,api.sandbox.paypal.com,api-m.sandbox.paypal.com'
+    ).split(',') if host.strip()
+)
+PAYPAL_WEBHOOK_CA_BUNDLE = os.getenv('PAYPAL_WEBHOOK_CA_BUNDLE')  # PEM roots; certifi's bundle if unset
+PAYPAL_WEBHOOK_CERT_CACHE_TTL = float(os.getenv('PAYPAL_WEBHOOK_CERT_CACHE_TTL', '86400'))  # seconds
+# Per-attempt deadlines (seconds) for each kind of PayPal call
+PAYPAL_TIMEOUT_CREATE = float(os.getenv('PAYPAL_TIMEOUT_CREATE', '10'))
+PAYPAL_TIMEOUT_EXECUTE = float(os.getenv('PAYPAL_TIMEOUT_EXECUTE', '15'))
+PAYPAL_TIMEOUT_FIND = float(os.getenv('PAYPAL_TIMEOUT_FIND', '5'))
+PAYPAL_RETRY_ATTEMPTS = int(os.getenv('PAYPAL_RETRY_ATTEMPTS', '3'))
+PAYPAL_RETRY_BASE_DELAY = float(os.getenv('PAYPAL_RETRY_BASE_DELAY', '0.2'))  # seconds
+PAYPAL_RETRY_MAX_DELAY = float(os.getenv('PAYPAL_RETRY_MAX_DELAY', '2'))  # seconds
+PAYPAL_BREAKER_FAILURE_THRESHOLD = int(os.getenv('PAYPAL_BREAKER_FAILURE_THRESHOLD', '5'))
+PAYPAL_BREAKER_RESET_TIMEOUT = float(os.getenv('PAYPAL_BREAKER_RESET_TIMEOUT', '30'))  # seconds
 
 # Bot Configuration
 PAYMENT_AMOUNT = float(os.getenv('PAYMENT_AMOUNT', '10.00'))
 PAYMENT_CURRENCY = os.getenv('PAYMENT_CURRENCY', 'USD')
 ADMIN_USER_ID = os.getenv('ADMIN_USER_ID')
+BOT_DEFAULT_LOCALE = os.getenv('BOT_DEFAULT_LOCALE', 'en')  # For users whose language has no templates
+PAYMENT_SESSION_TTL_MINUTES = int(os.getenv('PAYMENT_SESSION_TTL_MINUTES', '30'))
+# A pending session is handed out again only if it stays valid at least this long
+PAYMENT_SESSION_REUSE_MIN_SECONDS = int(os.getenv('PAYMENT_SESSION_REUSE_MIN_SECONDS', '120'))
+# Create the PayPal payment in the background on /start so "Pay Now" answers instantly
+PAYMENT_PRECREATE_ENABLED = os.getenv('PAYMENT_PRECREATE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PAYMENT_PRECREATE_CONCURRENCY = int(os.getenv('PAYMENT_PRECREATE_CONCURRENCY', '5'))
+# Another process creating a user's payment holds its lease at most this long
+PAYMENT_START_LEASE_SECONDS = float(os.getenv('PAYMENT_START_LEASE_SECONDS', '45'))
+PAYMENT_START_POLL_INTERVAL = float(os.getenv('PAYMENT_START_POLL_INTERVAL', '0.25'))  # seconds
 
 # Database Configuration
-DATABASE_PATH = 'bot_database.db'
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'bot_database.db')
+DATABASE_BUSY_TIMEOUT_MS = int(os.getenv('DATABASE_BUSY_TIMEOUT_MS', '5000'))
+DATABASE_CACHE_SIZE_KB = int(os.getenv('DATABASE_CACHE_SIZE_KB', '8192'))
+DATABASE_MMAP_SIZE = int(os.getenv('DATABASE_MMAP_SIZE', str(64 * 1024 * 1024)))
+DATABASE_STATEMENT_CACHE_SIZE = int(os.getenv('DATABASE_STATEMENT_CACHE_SIZE', '256'))
+DATABASE_EXECUTOR_WORKERS = int(os.getenv('DATABASE_EXECUTOR_WORKERS', '4'))
+USER_UPSERT_BATCH_SIZE = int(os.getenv('USER_UPSERT_BATCH_SIZE', '200'))
+USER_UPSERT_FLUSH_INTERVAL = float(os.getenv('USER_UPSERT_FLUSH_INTERVAL', '1.0'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '10'))
+
+# Payment session sweeper
+SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', '300'))  # seconds
+SESSION_RETENTION_DAYS = float(os.getenv('SESSION_RETENTION_DAYS', '30'))
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv('SESSION_SWEEP_BATCH_SIZE', '500'))
+SESSION_SWEEP_MAX_BATCHES = int(os.getenv('SESSION_SWEEP_MAX_BATCHES', '20'))
+SESSION_VACUUM_PAGES = int(os.getenv('SESSION_VACUUM_PAGES', '1000'))
+
+# Payment reconciliation
+RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', '600'))  # seconds
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '100'))
+RECONCILE_MAX_BATCHES = int(os.getenv('RECONCILE_MAX_BATCHES', '10'))
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '5'))
+# Younger sessions are left to the normal redirect flow
+RECONCILE_MIN_AGE_MINUTES = float(os.getenv('RECONCILE_MIN_AGE_MINUTES', '10'))
+# PayPal only lets an approved payment be executed for a few hours
+RECONCILE_LOOKBACK_HOURS = float(os.getenv('RECONCILE_LOOKBACK_HOURS', '3'))
+# One process executes a given payment; the lease outlives PayPal's retries and deadline
+RECONCILE_EXECUTE_LEASE_SECONDS = float(os.getenv('RECONCILE_EXECUTE_LEASE_SECONDS', '120'))
+
+# Admin broadcasts
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '200'))  # recipients read and checkpointed per page
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '10'))  # sends in flight; the send scheduler sets the pace
+# A broadcast whose process stopped renewing its lease this long ago is resumed by another one
+BROADCAST_LEASE_SECONDS = float(os.getenv('BROADCAST_LEASE_SECONDS', '120'))
+
+# PayPal webhook queue
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', '1.0'))  # seconds
+WEBHOOK_EVENT_BATCH_SIZE = int(os.getenv('WEBHOOK_EVENT_BATCH_SIZE', '20'))
+WEBHOOK_EVENT_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_EVENT_MAX_ATTEMPTS', '5'))
+WEBHOOK_EVENT_RETRY_DELAY = float(os.getenv('WEBHOOK_EVENT_RETRY_DELAY', '30'))  # seconds, grows per attempt
+# A claimed event not finished within this long is handed to another worker
+WEBHOOK_EVENT_LEASE_SECONDS = float(os.getenv('WEBHOOK_EVENT_LEASE_SECONDS', '300'))
 
 # Validate required environment variables
 required_vars = [
@@ -1,224 +1,838 @@
 import sqlite3
 import logging
-from datetime import datetime
-from typing import Optional, List, Dict
-from config import DATABASE_PATH
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, NamedTuple
+from config import (
+    DATABASE_PATH,
+    DATABASE_BUSY_TIMEOUT_MS,
+    DATABASE_CACHE_SIZE_KB,
+    DATABASE_MMAP_SIZE,
+    DATABASE_STATEMENT_CACHE_SIZE,
+    USER_UPSERT_BATCH_SIZE,
+    USER_UPSERT_FLUSH_INTERVAL,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    SESSION_RETENTION_DAYS,
+    SESSION_SWEEP_BATCH_SIZE,
+    SESSION_SWEEP_MAX_BATCHES,
+    SESSION_VACUUM_PAGES
+)
+from cache import TTLCache
+import migrations
+
+# Profile upsert that leaves has_paid, invite_sent and created_at untouched
+UPSERT_USER_SQL = '''
+    INSERT INTO users (user_id, username, first_name, last_name)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name
+'''
+
+# Everything the bot needs to answer a user, fetched with one indexed query
+USER_STATUS_SQL = '''
+    SELECT u.user_id, u.has_paid, u.invite_sent, s.session_id, s.payment_url, s.expires_at, s.precreated
+    FROM (SELECT ? AS user_id) AS q
+    LEFT JOIN users u ON u.user_id = q.user_id
+    LEFT JOIN payment_sessions s ON s.id = (
+        SELECT id FROM payment_sessions
+        WHERE user_id = q.user_id AND status = 'pending' AND expires_at > ?
+        ORDER BY expires_at DESC
+        LIMIT 1
+    )
+'''
+
+# Keyset page of sessions whose PayPal payment may have completed unnoticed;
+# created_at is UTC (CURRENT_TIMESTAMP), hence datetime('now', ...). The partial
+# index is walked in id order; its WHERE terms must stay in the query.
+RECONCILE_SESSIONS_SQL = '''
+    SELECT id, user_id, session_id, payment_id FROM payment_sessions INDEXED BY idx_payment_sessions_unfinished
+    WHERE id > ?
+      AND status IN ('pending', 'expired')
+      AND payment_id IS NOT NULL
+      AND created_at >= datetime('now', ?)
+      AND created_at <= datetime('now', ?)
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Session sweeper batches: overdue pending sessions, then finished ones past retention
+SWEEP_EXPIRE_SQL = '''
+    SELECT id, precreated FROM payment_sessions
+    WHERE status = 'pending' AND expires_at <= ?
+    LIMIT ?
+'''
+SWEEP_ARCHIVE_SQL = '''
+    SELECT id FROM payment_sessions
+    WHERE status IN ('expired', 'completed', 'cancelled') AND expires_at <= ?
+    LIMIT ?
+'''
+
+# Due webhook events, plus ones whose worker never finished them
+CLAIM_WEBHOOK_EVENTS_SQL = '''
+    SELECT id, event_id, event_type, payload, attempts FROM webhook_events
+    WHERE (status = 'queued' AND available_at <= ?)
+       OR (status = 'processing' AND claimed_at <= ?)
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Queries paging through a table in key order; a sort step would re-read every match
+KEYSET_QUERIES = ('get_unfinished_sessions',)
+
+# Recipient filter of each broadcast audience
+BROADCAST_AUDIENCE_FILTERS = {
+    'all': '1 = 1',
+    'paid': 'has_paid = 1',
+    'unpaid': 'has_paid = 0'
+}
+
+# Rollup counters maintained by triggers (see migrations.py)
+STATS_COUNTERS = ('total_users', 'paid_users', 'invited_users', 'total_revenue')
+STATS_SQL = f"SELECT name, value FROM stats_counters WHERE name IN ({', '.join('?' * len(STATS_COUNTERS))})"
+
+# Database files already migrated by this process
+_migrated_paths = set()
+_migrated_lock = threading.Lock()
+
+class UserStatus(NamedTuple):
+    """Compact snapshot of a user's payment state"""
+    exists: bool
+    has_paid: bool
+    invite_sent: bool
+    session_id: Optional[str] = None
+    payment_url: Optional[str] = None
+    session_expires_at: Optional[str] = None
+    # Created speculatively on /start and not yet shown to the user
+    session_precreated: bool = False
+
+    @property
+    def has_pending_session(self) -> bool:
+        """Whether an unexpired pending payment session exists"""
+        return self.session_id is not None
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = DATABASE_PATH
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or DATABASE_PATH
+
+        # One long-lived connection per thread; sqlite3 connections are cheap
+        # to keep open but expensive to open, and must not be shared between
+        # threads that write concurrently.
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        # Write-behind buffer of profile upserts, coalesced per user_id
+        self._pending_users: Dict[int, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_stop = threading.Event()
+
+        # Recently read user rows and status snapshots, keyed by user_id and
+        # ('status', user_id); every write to a user invalidates both
+        self._user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
         self.init_database()
-    
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open and tune a new connection"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DATABASE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DATABASE_STATEMENT_CACHE_SIZE
+        )
+
+        # WAL lets the bot and the webhook server read while the other writes;
+        # NORMAL sync is durable across application crashes in WAL mode.
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(DATABASE_BUSY_TIMEOUT_MS)}')
+        conn.execute(f'PRAGMA cache_size = -{int(DATABASE_CACHE_SIZE_KB)}')
+        conn.execute(f'PRAGMA mmap_size = {int(DATABASE_MMAP_SIZE)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Get the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Flush buffered writes and close every connection opened by this manager"""
+        self._flusher_stop.set()
+        if self._flusher:
+            self._flusher.join()
+            self._flusher = None
+        self.flush_user_upserts()
+
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logging.error(f"Error closing database connection: {e}")
+
+        self._local = threading.local()
+
     def init_database(self):
-        """Initialize the database with required tables"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Users table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        has_paid BOOLEAN DEFAULT FALSE,
-                        invite_sent BOOLEAN DEFAULT FALSE
-                    )
-                ''')
-                
-                # Payments table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS payments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        payment_id TEXT UNIQUE,
-                        payer_id TEXT,
-                        amount REAL,
-                        currency TEXT,
-                        status TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        completed_at TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                # Payment sessions table (for tracking pending payments)
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS payment_sessions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        session_id TEXT UNIQUE,
-                        payment_url TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        expires_at TIMESTAMP,
-                        status TEXT DEFAULT 'pending',
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                conn.commit()
-                logging.info("Database initialized successfully")
-        except sqlite3.Error as e:
-            logging.error(f"Database initialization error: {e}")
-            raise
-    
+        """Bring the schema up to date, once per database file per process"""
+        with _migrated_lock:
+            if self.db_path in _migrated_paths:
+                return
+            try:
+                version = migrations.migrate(self.get_connection())
+                _migrated_paths.add(self.db_path)
+                logging.info(f"Database initialized successfully (schema version {version})")
+            except sqlite3.Error as e:
+                logging.error(f"Database initialization error: {e}")
+                raise
+
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> bool:
         """Add a new user or update existing user info"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users (user_id, username, first_name, last_name)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, username, first_name, last_name))
-                conn.commit()
-                return True
+            conn = self.get_connection()
+            with conn:
+                conn.execute(UPSERT_USER_SQL, (user_id, username, first_name, last_name))
+            with self._pending_lock:
+                self._pending_users.pop(user_id, None)
+            self._invalidate_user(user_id)
+            return True
         except sqlite3.Error as e:
             logging.error(f"Error adding user: {e}")
             return False
-    
+
+    def queue_user_upsert(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        """
+        Buffer a profile upsert instead of committing it immediately
+        Repeated upserts for the same user collapse into one row; the buffer is
+        written in a single transaction once it reaches USER_UPSERT_BATCH_SIZE
+        users or every USER_UPSERT_FLUSH_INTERVAL seconds.
+        """
+        with self._pending_lock:
+            self._pending_users[user_id] = (user_id, username, first_name, last_name)
+            pending = len(self._pending_users)
+            if self._flusher is None:
+                self._start_flusher()
+
+        if pending >= USER_UPSERT_BATCH_SIZE:
+            self.flush_user_upserts()
+
+    def _start_flusher(self):
+        """Start the background thread that flushes the buffer on a timer"""
+        def run():
+            while not self._flusher_stop.wait(USER_UPSERT_FLUSH_INTERVAL):
+                self.flush_user_upserts()
+
+        self._flusher = threading.Thread(target=run, name='user-upsert-flusher', daemon=True)
+        self._flusher.start()
+
+    def flush_user_upserts(self) -> int:
+        """Write all buffered profile upserts in one transaction"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending_users = self._pending_users, {}
+
+            if not batch:
+                return 0
+
+            try:
+                conn = self.get_connection()
+                with conn:
+                    conn.executemany(UPSERT_USER_SQL, list(batch.values()))
+                for user_id in batch:
+                    self._invalidate_user(user_id)
+                return len(batch)
+            except sqlite3.Error as e:
+                logging.error(f"Error flushing user upserts: {e}")
+                # Put the batch back without clobbering anything queued meanwhile
+                with self._pending_lock:
+                    for user_id, row in batch.items():
+                        self._pending_users.setdefault(user_id, row)
+                return 0
+
+    def _invalidate_user(self, user_id: int):
+        """Drop every cached view of a user"""
+        self._user_cache.invalidate(user_id)
+        self._user_cache.invalidate(('status', user_id))
+
     def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user information"""
+        """Get user information, including any profile change still buffered"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            user = self._user_cache.get(user_id)
+            if user is not None:
+                user = dict(user)
+            else:
+                generation = self._user_cache.generation(user_id)
+                cursor = self.get_connection().execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
                 row = cursor.fetchone()
                 if row:
                     columns = [description[0] for description in cursor.description]
-                    return dict(zip(columns, row))
-                return None
+                    user = dict(zip(columns, row))
+                    self._user_cache.set(user_id, dict(user), generation=generation)
+
+            with self._pending_lock:
+                pending = self._pending_users.get(user_id)
+            if pending:
+                if user is None:
+                    user = {'user_id': user_id, 'created_at': None, 'has_paid': False, 'invite_sent': False}
+                user['username'], user['first_name'], user['last_name'] = pending[1:]
+
+            return user
         except sqlite3.Error as e:
             logging.error(f"Error getting user: {e}")
             return None
-    
+
     def user_has_paid(self, user_id: int) -> bool:
         """Check if user has completed payment"""
         user = self.get_user(user_id)
         return user and user.get('has_paid', False)
-    
+
     def user_has_invite(self, user_id: int) -> bool:
         """Check if user has been sent the invite link"""
         user = self.get_user(user_id)
         return user and user.get('invite_sent', False)
-    
+
+    def get_user_status(self, user_id: int, fresh: bool = False) -> UserStatus:
+        """
+        Get paid/invite flags and any unexpired pending session in one query
+        fresh=True skips the cache, to see writes made by other processes.
+        """
+        now = datetime.now()
+        status = None if fresh else self._user_cache.get(('status', user_id))
+
+        if status is None:
+            # Taken before the read: a write invalidating the user meanwhile wins
+            generation = self._user_cache.generation(('status', user_id))
+            cacheable = True
+            try:
+                row = self.get_connection().execute(USER_STATUS_SQL, (user_id, now)).fetchone()
+            except sqlite3.Error as e:
+                logging.error(f"Error getting user status: {e}")
+                row = (None, False, False, None, None, None, None)
+                # Not a real snapshot: the next call should ask the database again
+                cacheable = False
+
+            status = UserStatus(
+                exists=row[0] is not None,
+                has_paid=bool(row[1]),
+                invite_sent=bool(row[2]),
+                session_id=row[3],
+                payment_url=row[4],
+                session_expires_at=row[5],
+                session_precreated=row[6] == 1
+            )
+            if cacheable:
+                self._user_cache.set(('status', user_id), status, generation=generation)
+        elif status.has_pending_session and status.session_expires_at <= str(now):
+            # Cached snapshot outlived its session
+            status = status._replace(
+                session_id=None, payment_url=None, session_expires_at=None, session_precreated=False
+            )
+
+        if not status.exists:
+            with self._pending_lock:
+                if user_id in self._pending_users:
+                    status = status._replace(exists=True)
+
+        return status
+
     def mark_user_paid(self, user_id: int) -> bool:
         """Mark user as having completed payment"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
                     UPDATE users SET has_paid = TRUE WHERE user_id = ?
                 ''', (user_id,))
-                conn.commit()
-                return cursor.rowcount > 0
+            self._invalidate_user(user_id)
+            return cursor.rowcount > 0
         except sqlite3.Error as e:
             logging.error(f"Error marking user as paid: {e}")
             return False
-    
+
     def mark_invite_sent(self, user_id: int) -> bool:
         """Mark that invite link has been sent to user"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
                     UPDATE users SET invite_sent = TRUE WHERE user_id = ?
                 ''', (user_id,))
-                conn.commit()
-                return cursor.rowcount > 0
+            self._invalidate_user(user_id)
+            return cursor.rowcount > 0
         except sqlite3.Error as e:
             logging.error(f"Error marking invite as sent: {e}")
             return False
-    
-    def add_payment_session(self, user_id: int, session_id: str, payment_url: str, expires_at: datetime) -> bool:
+
+    def add_payment_session(self, user_id: int, session_id: str, payment_url: str, expires_at: datetime,
+                            precreated: bool = False, payment_id: str = None) -> bool:
         """Add a payment session"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO payment_sessions (user_id, session_id, payment_url, expires_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, session_id, payment_url, expires_at))
-                conn.commit()
-                return True
+            conn = self.get_connection()
+            with conn:
+                conn.execute('''
+                    INSERT INTO payment_sessions (user_id, session_id, payment_url, expires_at, precreated, payment_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, session_id, payment_url, expires_at, 1 if precreated else 0, payment_id))
+            self._invalidate_user(user_id)
+            return True
         except sqlite3.Error as e:
             logging.error(f"Error adding payment session: {e}")
             return False
-    
+
+    def claim_precreated_session(self, session_id: str) -> bool:
+        """
+        Mark a speculatively created session as handed to its user
+        Returns: True the first time the session is claimed
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
+                    UPDATE payment_sessions SET precreated = 2 WHERE session_id = ? AND precreated = 1
+                ''', (session_id,))
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error claiming payment session: {e}")
+            return False
+
     def get_payment_session(self, session_id: str) -> Optional[Dict]:
         """Get payment session information"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM payment_sessions WHERE session_id = ?', (session_id,))
-                row = cursor.fetchone()
-                if row:
-                    columns = [description[0] for description in cursor.description]
-                    return dict(zip(columns, row))
-                return None
+            cursor = self.get_connection().execute('SELECT * FROM payment_sessions WHERE session_id = ?', (session_id,))
+            row = cursor.fetchone()
+            if row:
+                columns = [description[0] for description in cursor.description]
+                return dict(zip(columns, row))
+            return None
         except sqlite3.Error as e:
             logging.error(f"Error getting payment session: {e}")
             return None
-    
+
+    def get_session_by_payment_id(self, payment_id: str) -> Optional[Dict]:
+        """Get the payment session created for a PayPal payment"""
+        try:
+            cursor = self.get_connection().execute('SELECT * FROM payment_sessions WHERE payment_id = ?', (payment_id,))
+            row = cursor.fetchone()
+            if row:
+                columns = [description[0] for description in cursor.description]
+                return dict(zip(columns, row))
+            return None
+        except sqlite3.Error as e:
+            logging.error(f"Error getting payment session by payment id: {e}")
+            return None
+
     def complete_payment_session(self, session_id: str) -> bool:
         """Mark payment session as completed"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            conn = self.get_connection()
+            with conn:
+                row = conn.execute(
+                    'SELECT user_id FROM payment_sessions WHERE session_id = ?', (session_id,)
+                ).fetchone()
+                cursor = conn.execute('''
                     UPDATE payment_sessions SET status = 'completed' WHERE session_id = ?
                 ''', (session_id,))
-                conn.commit()
-                return cursor.rowcount > 0
+            if row:
+                self._invalidate_user(row[0])
+            return cursor.rowcount > 0
         except sqlite3.Error as e:
             logging.error(f"Error completing payment session: {e}")
             return False
-    
+
+    def sweep_payment_sessions(self, retention_days: float = None, batch_size: int = None,
+                               max_batches: int = None, vacuum_pages: int = None) -> Dict:
+        """
+        Expire overdue pending sessions and archive old finished ones
+        Work is done in bounded batches, each in its own short transaction, so
+        the sweeper never holds the write lock for long.
+        Returns: counts, duration and rows/sec of the sweep
+        """
+        retention_days = SESSION_RETENTION_DAYS if retention_days is None else retention_days
+        batch_size = batch_size or SESSION_SWEEP_BATCH_SIZE
+        max_batches = max_batches or SESSION_SWEEP_MAX_BATCHES
+        vacuum_pages = SESSION_VACUUM_PAGES if vacuum_pages is None else vacuum_pages
+
+        started = time.perf_counter()
+        now = datetime.now()
+        archive_before = now - timedelta(days=retention_days)
+        expired = archived = wasted = 0
+        conn = self.get_connection()
+
+        try:
+            # Pending sessions past their expiry
+            for _ in range(max_batches):
+                with conn:
+                    rows = conn.execute(SWEEP_EXPIRE_SQL, (now, batch_size)).fetchall()
+                    if rows:
+                        placeholders = ', '.join('?' * len(rows))
+                        conn.execute(
+                            f"UPDATE payment_sessions SET status = 'expired' WHERE id IN ({placeholders})",
+                            [row[0] for row in rows]
+                        )
+                expired += len(rows)
+                # Pre-created links that expired without ever being shown
+                wasted += sum(1 for row in rows if row[1] == 1)
+                if len(rows) < batch_size:
+                    break
+
+            # Finished sessions older than the retention window
+            for _ in range(max_batches):
+                with conn:
+                    ids = [row[0] for row in conn.execute(SWEEP_ARCHIVE_SQL, (archive_before, batch_size))]
+                    if ids:
+                        placeholders = ', '.join('?' * len(ids))
+                        conn.execute(f'''
+                            INSERT OR REPLACE INTO payment_sessions_archive
+                                (id, user_id, session_id, payment_url, created_at, expires_at, status, payment_id)
+                            SELECT id, user_id, session_id, payment_url, created_at, expires_at, status, payment_id
+                            FROM payment_sessions WHERE id IN ({placeholders})
+                        ''', ids)
+                        conn.execute(f'DELETE FROM payment_sessions WHERE id IN ({placeholders})', ids)
+                archived += len(ids)
+                if len(ids) < batch_size:
+                    break
+
+            # Hand freed pages back to the filesystem a little at a time
+            freed_pages = 0
+            if vacuum_pages:
+                free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                conn.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})').fetchall()
+                freed_pages = free_before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Error sweeping payment sessions: {e}")
+            raise
+
+        duration = time.perf_counter() - started
+        return {
+            'expired': expired,
+            'archived': archived,
+            'precreated_wasted': wasted,
+            'freed_pages': freed_pages,
+            'duration': duration,
+            'rows_per_sec': (expired + archived) / duration if duration > 0 else 0.0
+        }
+
+    def get_unfinished_sessions(self, after_id: int, limit: int, min_age_minutes: float,
+                                lookback_hours: float) -> List[Dict]:
+        """
+        Pending or expired sessions with a PayPal payment, in id order after after_id
+        Only sessions created between lookback_hours and min_age_minutes ago are returned.
+        """
+        try:
+            cursor = self.get_connection().execute(RECONCILE_SESSIONS_SQL, (
+                after_id,
+                f'-{float(lookback_hours) * 60} minutes',
+                f'-{float(min_age_minutes)} minutes',
+                limit
+            ))
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.error(f"Error loading unfinished payment sessions: {e}")
+            raise
+
+    def get_checkpoint(self, name: str) -> int:
+        """Saved position of a batch job, 0 if it has none"""
+        try:
+            row = self.get_connection().execute(
+                'SELECT position FROM job_checkpoints WHERE name = ?', (name,)
+            ).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logging.error(f"Error reading checkpoint {name}: {e}")
+            raise
+
+    def set_checkpoint(self, name: str, position: int):
+        """Save the position a batch job should resume from"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('''
+                    INSERT INTO job_checkpoints (name, position, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(name) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at
+                ''', (name, position))
+        except sqlite3.Error as e:
+            logging.error(f"Error saving checkpoint {name}: {e}")
+            raise
+
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew the named lease for ttl_seconds unless another owner holds an unexpired one"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
+                    INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, datetime('now', ?))
+                    ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE leases.expires_at <= datetime('now') OR leases.owner = excluded.owner
+                ''', (name, owner, f'+{ttl_seconds} seconds'))
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error acquiring lease {name}: {e}")
+            raise
+
+    def release_lease(self, name: str, owner: str):
+        """Give up a lease, if owner still holds it"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+        except sqlite3.Error as e:
+            logging.error(f"Error releasing lease {name}: {e}")
+
+    def create_broadcast(self, audience: str, text: str, created_by: int) -> Optional[int]:
+        """
+        Record a new broadcast to send
+        Returns: its id, or None if another broadcast is still running
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if conn.execute("SELECT 1 FROM broadcasts WHERE status = 'running'").fetchone():
+                    return None
+                cursor = conn.execute(
+                    'INSERT INTO broadcasts (audience, text, created_by) VALUES (?, ?, ?)',
+                    (audience, text, created_by)
+                )
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logging.error(f"Error creating broadcast: {e}")
+            raise
+
+    def get_broadcast(self, broadcast_id: int = None, running: bool = False) -> Optional[Dict]:
+        """The given broadcast, else the running one (running=True) or the latest one"""
+        if broadcast_id is not None:
+            query, params = 'SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,)
+        elif running:
+            query, params = "SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id LIMIT 1", ()
+        else:
+            query, params = 'SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1', ()
+        try:
+            cursor = self.get_connection().execute(query, params)
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([description[0] for description in cursor.description], row))
+        except sqlite3.Error as e:
+            logging.error(f"Error reading broadcast: {e}")
+            raise
+
+    def get_broadcast_recipients(self, audience: str, after_user_id: int, limit: int) -> List[int]:
+        """Keyset page of user ids in the audience, in id order after after_user_id"""
+        try:
+            cursor = self.get_connection().execute(f'''
+                SELECT user_id FROM users
+                WHERE user_id > ? AND {BROADCAST_AUDIENCE_FILTERS[audience]}
+                ORDER BY user_id
+                LIMIT ?
+            ''', (after_user_id, limit))
+            return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.error(f"Error loading broadcast recipients: {e}")
+            raise
+
+    def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                blocked: int, elapsed: float) -> bool:
+        """
+        Checkpoint a running broadcast; counts and elapsed are added to the saved totals
+        Returns: False if the broadcast is no longer running (it was cancelled)
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('''
+                    UPDATE broadcasts
+                    SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?,
+                        elapsed = elapsed + ?
+                    WHERE id = ?
+                ''', (last_user_id, sent, failed, blocked, elapsed, broadcast_id))
+                row = conn.execute('SELECT status FROM broadcasts WHERE id = ?', (broadcast_id,)).fetchone()
+            return row is not None and row[0] == 'running'
+        except sqlite3.Error as e:
+            logging.error(f"Error saving broadcast progress: {e}")
+            raise
+
+    def finish_broadcast(self, broadcast_id: int, status: str) -> bool:
+        """Move a running broadcast to 'finished' or 'cancelled'"""
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
+                    UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running'
+                ''', (status, broadcast_id))
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error finishing broadcast: {e}")
+            return False
+
     def add_payment(self, user_id: int, payment_id: str, payer_id: str, amount: float, currency: str, status: str) -> bool:
         """Add a payment record"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
+            conn = self.get_connection()
+            with conn:
+                conn.execute('''
                     INSERT INTO payments (user_id, payment_id, payer_id, amount, currency, status, completed_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (user_id, payment_id, payer_id, amount, currency, status, datetime.now()))
-                conn.commit()
                 return True
         except sqlite3.Error as e:
             logging.error(f"Error adding payment: {e}")
             return False
-    
+
+    def payment_recorded(self, payment_id: str) -> bool:
+        """Check whether a PayPal payment has already been recorded"""
+        try:
+            row = self.get_connection().execute(
+                'SELECT 1 FROM payments WHERE payment_id = ?', (payment_id,)
+            ).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logging.error(f"Error checking payment: {e}")
+            return False
+
+    def complete_purchase(self, user_id: int, session_id: Optional[str], payment_id: str, payer_id: str,
+                          amount: float, currency: str, status: str = 'approved') -> bool:
+        """
+        Record a completed purchase in a single transaction
+        Adds the payment, marks the user paid and completes the session. A
+        payment_id that is already recorded leaves everything untouched.
+        Returns: True if the purchase was newly recorded, False if it was a duplicate
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
+                    INSERT INTO payments (user_id, payment_id, payer_id, amount, currency, status, completed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(payment_id) DO NOTHING
+                ''', (user_id, payment_id, payer_id, amount, currency, status, datetime.now()))
+                if cursor.rowcount == 0:
+                    return False
+
+                # The user's profile may still be sitting in the write-behind buffer
+                conn.execute('''
+                    INSERT INTO users (user_id, has_paid) VALUES (?, TRUE)
+                    ON CONFLICT(user_id) DO UPDATE SET has_paid = TRUE
+                ''', (user_id,))
+
+                if session_id:
+                    conn.execute('''
+                        UPDATE payment_sessions SET status = 'completed' WHERE session_id = ?
+                    ''', (session_id,))
+
+            self._invalidate_user(user_id)
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Error completing purchase: {e}")
+            raise
+
+    def enqueue_webhook_event(self, event_id: str, event_type: str, payload: str) -> bool:
+        """
+        Store a received webhook for background processing
+        Returns: True if the event is new, False if event_id was already queued
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                cursor = conn.execute('''
+                    INSERT INTO webhook_events (event_id, event_type, payload, available_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(event_id) DO NOTHING
+                ''', (event_id, event_type, payload, datetime.now()))
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error queueing webhook event: {e}")
+            raise
+
+    def claim_webhook_events(self, limit: int, lease_seconds: float) -> List[Dict]:
+        """
+        Take up to limit due webhook events for processing
+        Events claimed more than lease_seconds ago by a worker that never
+        finished them are claimed again.
+        """
+        now = datetime.now()
+        try:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                cursor = conn.execute(
+                    CLAIM_WEBHOOK_EVENTS_SQL, (now, now - timedelta(seconds=lease_seconds), limit)
+                )
+                columns = [description[0] for description in cursor.description]
+                events = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                if events:
+                    placeholders = ', '.join('?' * len(events))
+                    conn.execute(f'''
+                        UPDATE webhook_events SET status = 'processing', claimed_at = ?, attempts = attempts + 1
+                        WHERE id IN ({placeholders})
+                    ''', [now] + [event['id'] for event in events])
+            return events
+        except sqlite3.Error as e:
+            logging.error(f"Error claiming webhook events: {e}")
+            raise
+
+    def finish_webhook_event(self, event_row_id: int, error: str = None, retry_delay: float = 0,
+                             max_attempts: int = 1) -> bool:
+        """
+        Record the outcome of processing a webhook event
+        A failed event is queued again after retry_delay until it has been
+        attempted max_attempts times, then left as 'failed'.
+        """
+        now = datetime.now()
+        try:
+            conn = self.get_connection()
+            with conn:
+                if error is None:
+                    cursor = conn.execute('''
+                        UPDATE webhook_events SET status = 'done', processed_at = ?, last_error = NULL
+                        WHERE id = ?
+                    ''', (now, event_row_id))
+                else:
+                    cursor = conn.execute('''
+                        UPDATE webhook_events
+                        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                            last_error = ?,
+                            available_at = ?
+                        WHERE id = ?
+                    ''', (max_attempts, error, now + timedelta(seconds=retry_delay), event_row_id))
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Error finishing webhook event: {e}")
+            return False
+
+    def webhook_queue_stats(self) -> Dict[str, int]:
+        """Number of webhook events in each status"""
+        try:
+            cursor = self.get_connection().execute('SELECT status, COUNT(*) FROM webhook_events GROUP BY status')
+            return dict(cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.error(f"Error reading webhook queue stats: {e}")
+            return {}
+
+    def cache_stats(self) -> Dict:
+        """Hit/miss counters of the user-state cache"""
+        return self._user_cache.stats()
+
     def get_user_stats(self) -> Dict:
-        """Get user statistics"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Total users
-                cursor.execute('SELECT COUNT(*) FROM users')
-                total_users = cursor.fetchone()[0]
-                
-                # Paid users
-                cursor.execute('SELECT COUNT(*) FROM users WHERE has_paid = TRUE')
-                paid_users = cursor.fetchone()[0]
-                
-                # Users with invites sent
-                cursor.execute('SELECT COUNT(*) FROM users WHERE invite_sent = TRUE')
-                invited_users = cursor.fetchone()[0]
-                
-                # Total revenue
-                cursor.execute('SELECT SUM(amount) FROM payments WHERE status = "approved"')
-                total_revenue = cursor.fetchone()[0] or 0
-                
-                return {
-                    'total_users': total_users,
-                    'paid_users': paid_users,
-                    'invited_users': invited_users,
-                    'total_revenue': total_revenue
-                }
+        """Get user statistics from the trigger-maintained counters"""
+        try:
+            cursor = self.get_connection().execute(STATS_SQL, STATS_COUNTERS)
+            return self._format_stats(dict(cursor.fetchall()))
         except sqlite3.Error as e:
             logging.error(f"Error getting user stats: {e}")
             return {
@@ -226,4 +840,90 @@ class DatabaseManager:
                 'paid_users': 0,
                 'invited_users': 0,
                 'total_revenue': 0
-            }
\ No newline at end of file
+            }
+
+    @staticmethod
+    def _format_stats(counters: Dict) -> Dict:
+        """Shape raw counter values like the original get_user_stats result"""
+        return {
+            'total_users': int(counters.get('total_users', 0)),
+            'paid_users': int(counters.get('paid_users', 0)),
+            'invited_users': int(counters.get('invited_users', 0)),
+            'total_revenue': round(counters.get('total_revenue', 0), 2)
+        }
+
+    def rebuild_stats(self) -> Dict:
+        """
+        Recompute the statistics counters from the raw tables
+        Returns: {'before': counters, 'after': recomputed, 'consistent': bool}
+        """
+        conn = self.get_connection()
+        try:
+            with conn:
+                # Take the write lock up front so no trigger runs in between
+                conn.execute('BEGIN IMMEDIATE')
+                before = dict(conn.execute('SELECT name, value FROM stats_counters').fetchall())
+
+                users = conn.execute('''
+                    SELECT COUNT(*),
+                           IFNULL(SUM(has_paid = TRUE), 0),
+                           IFNULL(SUM(invite_sent = TRUE), 0)
+                    FROM users
+                ''').fetchone()
+                revenue = conn.execute(
+                    "SELECT IFNULL(SUM(amount), 0) FROM payments WHERE status = 'approved'"
+                ).fetchone()[0]
+
+                after = dict(zip(STATS_COUNTERS, (*users, revenue)))
+                conn.executemany(
+                    'INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)',
+                    list(after.items())
+                )
+
+            before, after = self._format_stats(before), self._format_stats(after)
+            consistent = before == after
+            if not consistent:
+                logging.warning(f"Statistics counters drifted: {before} -> {after}")
+            return {'before': before, 'after': after, 'consistent': consistent}
+        except sqlite3.Error as e:
+            logging.error(f"Error rebuilding statistics: {e}")
+            raise
+
+    def hot_queries(self) -> Dict[str, tuple]:
+        """The queries on the per-update path and in the batch jobs, with representative parameters"""
+        now = datetime.now()
+        return {
+            'get_user': ('SELECT * FROM users WHERE user_id = ?', (1,)),
+            'get_user_status': (USER_STATUS_SQL, (1, now)),
+            'upsert_user': (UPSERT_USER_SQL, (1, None, None, None)),
+            'mark_user_paid': ('UPDATE users SET has_paid = TRUE WHERE user_id = ?', (1,)),
+            'mark_invite_sent': ('UPDATE users SET invite_sent = TRUE WHERE user_id = ?', (1,)),
+            'get_payment_session': ('SELECT * FROM payment_sessions WHERE session_id = ?', ('x',)),
+            'get_session_by_payment_id': ('SELECT * FROM payment_sessions WHERE payment_id = ?', ('x',)),
+            'complete_payment_session': ("UPDATE payment_sessions SET status = 'completed' WHERE session_id = ?", ('x',)),
+            'get_user_stats': (STATS_SQL, STATS_COUNTERS),
+            'get_unfinished_sessions': (RECONCILE_SESSIONS_SQL, (0, '-180 minutes', '-10 minutes', 100)),
+            'claim_webhook_events': (CLAIM_WEBHOOK_EVENTS_SQL, (now, now, 20)),
+            'sweep_expire_sessions': (SWEEP_EXPIRE_SQL, (now, 500)),
+            'sweep_archive_sessions': (SWEEP_ARCHIVE_SQL, (now, 500)),
+        }
+
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        """
+        Run EXPLAIN QUERY PLAN over the hot queries
+        Returns: {query_name: [plan steps that fully scan a table, or sort a keyset page]},
+        empty when all are indexed
+        """
+        conn = self.get_connection()
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        offenders = {}
+
+        for name, (sql, params) in self.hot_queries().items():
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            scans = [step for step in plan if step.startswith('SCAN ') and step.split()[1] in tables]
+            if name in KEYSET_QUERIES:
+                scans += [step for step in plan if step.startswith('USE TEMP B-TREE')]
+            if scans:
+                offenders[name] = scans
+
+        return offenders
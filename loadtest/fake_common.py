@@ -0,0 +1,92 @@
+"""
+Shared plumbing for the local PayPal and Telegram stand-in servers
+Both are stdlib ThreadingHTTPServers with configurable latency and error injection.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FaultInjector:
+    """
+    Adds latency and random failures to fake API calls
+    latency: mean delay in seconds; jitter: +/- spread around it;
+    error_rate: probability in [0, 1] that a call fails.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.injected_errors: Dict[str, int] = {}
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter)))
+
+    def should_fail(self, name: str) -> bool:
+        """Count a call and decide whether it gets an injected error"""
+        fail = self.error_rate > 0 and random.random() < self.error_rate
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if fail:
+                self.injected_errors[name] = self.injected_errors.get(name, 0) + 1
+        return fail
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'calls': dict(self.calls), 'injected_errors': dict(self.injected_errors)}
+
+
+class JSONRequestHandler(BaseHTTPRequestHandler):
+    """Request handler with helpers for JSON and form bodies; quiet by default"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def route(self) -> Tuple[str, Dict[str, str]]:
+        """(path, query parameters)"""
+        parts = urlsplit(self.path)
+        return parts.path, dict(parse_qsl(parts.query))
+
+    def read_body(self) -> Dict:
+        """Parse a JSON, urlencoded or empty request body"""
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not raw:
+            return {}
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            return json.loads(raw)
+        return dict(parse_qsl(raw.decode()))
+
+    def send_json(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_redirect(self, location: str):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def start_server(handler_class, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve handler_class on a daemon thread and return the server"""
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True).start()
+    return server
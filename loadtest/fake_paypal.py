@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the PayPal v1 REST API
+
+Implements just what AsyncPayPalHandler uses: OAuth client-credentials tokens
+and payment create / find / execute, including PayPal-Request-Id idempotency.
+GET /checkoutnow?token=<payment id> plays the buyer approving the payment and
+redirects to the payment's return_url, as PayPal does.
+
+Usage:
+    python loadtest/fake_paypal.py [--port 8082] [--latency 0.05] [--jitter 0.02] [--error-rate 0.01]
+Then point the bot at it with PAYPAL_API_BASE_URL=http://127.0.0.1:8082
+"""
+import argparse
+import itertools
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+from urllib.parse import urlencode
+
+from fake_common import FaultInjector, JSONRequestHandler, start_server
+
+PAYMENT_PATH = re.compile(r'^/v1/payments/payment/([^/]+)$')
+EXECUTE_PATH = re.compile(r'^/v1/payments/payment/([^/]+)/execute$')
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _error(name: str, message: str) -> Dict:
+    return {'name': name, 'message': message, 'debug_id': 'fake'}
+
+
+class FakePayPal:
+    """In-memory payment store plus the HTTP handler that serves it"""
+
+    def __init__(self, faults: FaultInjector = None):
+        self.faults = faults or FaultInjector()
+        self.payments: Dict[str, Dict] = {}
+        self.approved_payers: Dict[str, str] = {}
+        self.idempotent_responses: Dict[str, Tuple[int, Dict]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, body: Dict, base_url: str) -> Tuple[int, Dict]:
+        payment_id = f"PAYID-FAKE{next(self._ids):08d}"
+        payment = {
+            'id': payment_id,
+            'intent': body.get('intent', 'sale'),
+            'state': 'created',
+            'payer': body.get('payer', {}),
+            'transactions': body.get('transactions', []),
+            'redirect_urls': body.get('redirect_urls', {}),
+            'create_time': _now(),
+            'links': [
+                {'href': f"{base_url}/v1/payments/payment/{payment_id}", 'rel': 'self', 'method': 'GET'},
+                {'href': f"{base_url}/checkoutnow?token={payment_id}", 'rel': 'approval_url', 'method': 'REDIRECT'},
+                {'href': f"{base_url}/v1/payments/payment/{payment_id}/execute", 'rel': 'execute', 'method': 'POST'}
+            ]
+        }
+        with self._lock:
+            self.payments[payment_id] = payment
+        return 201, payment
+
+    def find(self, payment_id: str) -> Tuple[int, Dict]:
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return 404, _error('INVALID_RESOURCE_ID', 'Requested resource ID was not found.')
+        return 200, payment
+
+    def execute(self, payment_id: str, body: Dict) -> Tuple[int, Dict]:
+        with self._lock:
+            payment = self.payments.get(payment_id)
+            if payment is None:
+                return 404, _error('INVALID_RESOURCE_ID', 'Requested resource ID was not found.')
+            if payment['state'] == 'approved':
+                return 400, _error('PAYMENT_ALREADY_DONE', 'Payment has been done already for this cart.')
+            if self.approved_payers.get(payment_id) != body.get('payer_id'):
+                return 400, _error('PAYMENT_NOT_APPROVED_FOR_EXECUTION', 'Payer has not approved payment')
+            payment['state'] = 'approved'
+            payment['update_time'] = _now()
+            return 200, payment
+
+    def approve(self, payment_id: str) -> str:
+        """Buyer approval; returns the redirect to the merchant's return_url, or '' if unknown"""
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return ''
+        payer_id = f"PAYER{payment_id[-8:]}"
+        self.approved_payers[payment_id] = payer_id
+        # Like PayPal, an approved payment shows its payer before it is executed
+        payment['payer']['status'] = 'VERIFIED'
+        payment['payer']['payer_info'] = {'payer_id': payer_id, 'email': 'buyer@example.com'}
+        return_url = payment['redirect_urls'].get('return_url', '')
+        separator = '&' if '?' in return_url else '?'
+        return return_url + separator + urlencode({'paymentId': payment_id, 'token': payment_id, 'PayerID': payer_id})
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(JSONRequestHandler):
+            def do_GET(self):
+                path, query = self.route
+                if path == '/checkoutnow':
+                    location = fake.approve(query.get('token', ''))
+                    if not location:
+                        return self.send_json(404, _error('INVALID_RESOURCE_ID', 'Unknown checkout token'))
+                    return self.send_redirect(location)
+
+                match = PAYMENT_PATH.match(path)
+                if not match:
+                    return self.send_json(404, _error('NOT_FOUND', path))
+                self._api('find', lambda: fake.find(match.group(1)))
+
+            def do_POST(self):
+                path, _ = self.route
+                body = self.read_body()
+                if path == '/v1/oauth2/token':
+                    return self._api('token', lambda: (200, {
+                        'access_token': f"A21AAFAKE{time.time_ns()}",
+                        'token_type': 'Bearer',
+                        'expires_in': 32400
+                    }), authenticated=False)
+
+                base_url = f"http://{self.headers.get('Host')}"
+                if path == '/v1/payments/payment':
+                    return self._api('create', lambda: fake.create(body, base_url))
+
+                match = EXECUTE_PATH.match(path)
+                if match:
+                    return self._api('execute', lambda: fake.execute(match.group(1), body))
+                self.send_json(404, _error('NOT_FOUND', path))
+
+            def _api(self, name: str, call, authenticated: bool = True):
+                """Apply latency, faults, auth and PayPal-Request-Id replay around one API call"""
+                fake.faults.delay()
+                if fake.faults.should_fail(name):
+                    return self.send_json(503, _error('INTERNAL_SERVICE_ERROR', 'Injected failure'))
+                if authenticated and not (self.headers.get('Authorization') or '').startswith('Bearer '):
+                    return self.send_json(401, {'error': 'invalid_token'})
+
+                request_id = self.headers.get('PayPal-Request-Id')
+                replay = fake.idempotent_responses.get(request_id) if request_id else None
+                status, payload = replay or call()
+                if request_id and not replay:
+                    fake.idempotent_responses[request_id] = (status, payload)
+                self.send_json(status, payload)
+
+        return Handler
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        return start_server(self.handler_class(), port, host)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local PayPal v1 REST stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean added latency per API call, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency spread, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of API calls answered with 503')
+    args = parser.parse_args()
+
+    server = FakePayPal(FaultInjector(args.latency, args.jitter, args.error_rate)).serve(args.port, args.host)
+    print(f"Fake PayPal listening on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Telegram Bot API
+
+Serves the methods the bot and webhook server call (getMe, setWebhook,
+deleteWebhook, getUpdates, sendMessage, editMessageText, answerCallbackQuery).
+Updates are queued by the load generator, or over HTTP with POST
+/_control/update, and handed out by getUpdates or, once a webhook is set,
+POSTed to it. Everything the bot sends is kept per chat so a driver can wait
+for replies.
+
+Usage:
+    python loadtest/fake_telegram.py [--port 8081] [--latency 0.03] [--error-rate 0.01]
+Then point the bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from typing import Callable, Dict, List, Optional
+
+from fake_common import FaultInjector, JSONRequestHandler, start_server
+
+BOT_USER = {'id': 900000001, 'is_bot': True, 'first_name': 'Load Test Bot', 'username': 'loadtest_bot'}
+
+# Methods that may get an injected 429, like a real flood limit
+SEND_METHODS = ('sendMessage', 'editMessageText', 'answerCallbackQuery')
+
+
+class FakeTelegram:
+    """Update queue, per-chat outbox and the HTTP handler that serves them"""
+
+    def __init__(self, faults: FaultInjector = None):
+        self.faults = faults or FaultInjector()
+        self._updates: List[Dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._updates_ready = threading.Condition()
+        self._outbox: Dict[int, List[Dict]] = {}
+        self._outbox_changed = threading.Condition()
+        self.polls = 0
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        # Chats whose user blocked the bot: sendMessage answers 403
+        self.blocked_chats = set()
+        # Extra seconds every send to these chats takes, to model one slow conversation
+        self.slow_chats: Dict[int, float] = {}
+
+    # Driver side
+
+    @staticmethod
+    def user(user_id: int) -> Dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': 'Buyer', 'username': f"buyer{user_id}"}
+
+    def push_update(self, update: Dict):
+        with self._updates_ready:
+            update['update_id'] = next(self._update_ids)
+            if self.webhook_url:
+                threading.Thread(target=self._post_update, args=(update,), daemon=True).start()
+                return
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    def _post_update(self, update: Dict):
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=json.dumps(update).encode(),
+            headers={'Content-Type': 'application/json'}
+        )
+        if self.webhook_secret:
+            request.add_header('X-Telegram-Bot-Api-Secret-Token', self.webhook_secret)
+        try:
+            urllib.request.urlopen(request, timeout=30).close()
+        except OSError as e:
+            print(f"Webhook delivery of update {update['update_id']} failed: {e}")
+
+    def push_message(self, user_id: int, text: str):
+        """Queue a private message from user_id, tagging a leading /command"""
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self.user(user_id),
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self.push_update({'message': message})
+
+    def push_callback(self, user_id: int, message: Dict, data: str):
+        """Queue an inline button press on one of the bot's messages"""
+        self.push_update({'callback_query': {
+            'id': str(next(self._callback_ids)),
+            'from': self.user(user_id),
+            'chat_instance': str(user_id),
+            'message': message,
+            'data': data
+        }})
+
+    def sent_count(self, chat_id: int) -> int:
+        with self._outbox_changed:
+            return len(self._outbox.get(chat_id, []))
+
+    def wait_for_message(self, chat_id: int, predicate: Callable[[Dict], bool], start: int = 0,
+                         timeout: float = 30.0) -> Optional[Dict]:
+        """First message sent to chat_id at or after index start that matches predicate"""
+        deadline = time.monotonic() + timeout
+        with self._outbox_changed:
+            while True:
+                for message in self._outbox.get(chat_id, [])[start:]:
+                    if predicate(message):
+                        return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._outbox_changed.wait(remaining)
+
+    # Bot API side
+
+    def get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        self.polls += 1
+        with self._updates_ready:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates and timeout:
+                self._updates_ready.wait(timeout)
+            return self._updates[:limit]
+
+    def set_webhook(self, params: Dict) -> bool:
+        self.webhook_url = params.get('url') or None
+        self.webhook_secret = params.get('secret_token') or None
+        return True
+
+    def delete_webhook(self) -> bool:
+        self.webhook_url = self.webhook_secret = None
+        return True
+
+    def send_message(self, params: Dict) -> Dict:
+        chat_id = int(params['chat_id'])
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', '')
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = json.loads(params['reply_markup'])
+        self._deliver(chat_id, message)
+        return message
+
+    def edit_message_text(self, params: Dict) -> Dict:
+        message = self.send_message(params)
+        message['message_id'] = int(params.get('message_id') or message['message_id'])
+        message['edit_date'] = message['date']
+        return message
+
+    def _deliver(self, chat_id: int, message: Dict):
+        with self._outbox_changed:
+            self._outbox.setdefault(chat_id, []).append(message)
+            self._outbox_changed.notify_all()
+
+    def call(self, method: str, params: Dict):
+        """Dispatch one Bot API method; returns (status, response body)"""
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self.get_updates(params)}
+
+        self.faults.delay()
+        if method in SEND_METHODS and params.get('chat_id') and int(params['chat_id']) in self.slow_chats:
+            time.sleep(self.slow_chats[int(params['chat_id'])])
+        if method in SEND_METHODS and self.faults.should_fail(method):
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1}
+            }
+
+        if method == 'sendMessage' and int(params['chat_id']) in self.blocked_chats:
+            return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+
+        handlers = {
+            'getMe': lambda: BOT_USER,
+            'deleteWebhook': self.delete_webhook,
+            'setWebhook': lambda: self.set_webhook(params),
+            'answerCallbackQuery': lambda: True,
+            'sendMessage': lambda: self.send_message(params),
+            'editMessageText': lambda: self.edit_message_text(params)
+        }
+        if method not in handlers:
+            return 404, {'ok': False, 'error_code': 404, 'description': f"Not Found: method {method}"}
+        return 200, {'ok': True, 'result': handlers[method]()}
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(JSONRequestHandler):
+            def do_GET(self):
+                path, query = self.route
+                if path == '/_control/messages':
+                    chat_id = int(query.get('chat_id', 0))
+                    with fake._outbox_changed:
+                        return self.send_json(200, fake._outbox.get(chat_id, []))
+                self.do_POST()
+
+            def do_POST(self):
+                path, query = self.route
+                params = {**query, **self.read_body()}
+                if path == '/_control/update':
+                    fake.push_update(params)
+                    return self.send_json(200, {'ok': True})
+
+                # /bot<token>/<method>
+                status, payload = fake.call(path.rsplit('/', 1)[-1], params)
+                self.send_json(status, payload)
+
+        return Handler
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        return start_server(self.handler_class(), port, host)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Telegram Bot API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean added latency per call, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency spread, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of send calls answered with 429')
+    args = parser.parse_args()
+
+    server = FakeTelegram(FaultInjector(args.latency, args.jitter, args.error_rate)).serve(args.port, args.host)
+    print(f"Fake Telegram Bot API listening on http://{args.host}:{args.port}/bot (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Broadcast check: throughput, audience filtering and resume after a restart
+
+Starts fake_telegram in-process and fills a throwaway database with users,
+every third one paid and every tenth one having blocked the bot. A bot
+instance starts a broadcast to all users and is shut down halfway through;
+a second instance, as after a restart, resumes it from the checkpoint. A
+paid-only broadcast follows. Every recipient's inbox is then checked and
+the sent, blocked and failed counts and throughput are reported.
+
+Usage:
+    python loadtest/run_broadcast.py [--users 600] [--global-rate 30] [--telegram-latency 0.03]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_common import FaultInjector
+from fake_telegram import FakeTelegram
+
+ADMIN_ID = 900000
+ALL_TEXT = 'Broadcast check: hello everyone'
+PAID_TEXT = 'Broadcast check: hello members'
+
+
+async def new_bot():
+    from bot import InviteMemberBot
+
+    bot = InviteMemberBot()
+    bot.setup_application()
+    # No app.start(): the resume job must not run next to the explicit calls below
+    await bot.app.initialize()
+    return bot
+
+
+async def close_bot(bot):
+    await bot.post_stop(bot.app)
+    await bot.app.shutdown()
+    await bot.post_shutdown(bot.app)
+
+
+def received(telegram: FakeTelegram, user_id: int, text: str) -> int:
+    return sum(1 for message in telegram._outbox.get(user_id, []) if message['text'] == text)
+
+
+async def run(args, telegram):
+    users = range(1, args.users + 1)
+    paid = {user_id for user_id in users if user_id % 3 == 0}
+    telegram.blocked_chats.update(user_id for user_id in users if user_id % 10 == 0)
+
+    bot = await new_bot()
+    for user_id in users:
+        await bot.db.add_user(user_id, first_name='Buyer')
+        if user_id in paid:
+            await bot.db.mark_user_paid(user_id)
+
+    # First instance: start the broadcast and stop halfway, like a deploy would
+    broadcast_id = await bot.db.create_broadcast('all', ALL_TEXT, ADMIN_ID)
+    bot.start_broadcast(broadcast_id)
+    while (await bot.db.get_broadcast(broadcast_id))['last_user_id'] < args.users // 2:
+        await asyncio.sleep(0.1)
+    interrupted_at = (await bot.db.get_broadcast(broadcast_id))['last_user_id']
+    await close_bot(bot)
+
+    # Second instance picks it up from the checkpoint
+    bot = await new_bot()
+    resumed = await bot.db.get_broadcast(running=True)
+    await bot.run_broadcast(resumed['id'])
+    everyone = await bot.db.get_broadcast(broadcast_id)
+
+    started = time.perf_counter()
+    paid_id = await bot.db.create_broadcast('paid', PAID_TEXT, ADMIN_ID)
+    await bot.run_broadcast(paid_id)
+    members = await bot.db.get_broadcast(paid_id)
+    paid_wall = time.perf_counter() - started
+    await close_bot(bot)
+
+    reachable = [user_id for user_id in users if user_id not in telegram.blocked_chats]
+    missing = [user_id for user_id in reachable if received(telegram, user_id, ALL_TEXT) == 0]
+    resent = sum(max(received(telegram, user_id, ALL_TEXT) - 1, 0) for user_id in reachable)
+    wrong_audience = [user_id for user_id in users
+                      if received(telegram, user_id, PAID_TEXT) != (user_id in paid and user_id in reachable)]
+
+    print(f"{args.users} users, {len(paid)} paid, {len(telegram.blocked_chats)} blocked the bot, "
+          f"global send rate {args.global_rate}/s\n")
+    print(f"Broadcast to all, interrupted after user {interrupted_at} and resumed:")
+    print(f"  {summary(everyone)}")
+    print(f"  resent after the restart: {resent} (at most one page of {os.environ['BROADCAST_BATCH_SIZE']})")
+    print("Broadcast to paid users:")
+    print(f"  {summary(members)} ({paid_wall:.1f}s wall clock)")
+    print(f"  admin reports received: {len(telegram._outbox.get(ADMIN_ID, []))}")
+
+    passed = (
+        not missing and not wrong_audience
+        and everyone['status'] == members['status'] == 'finished'
+        and everyone['sent'] == len(reachable) and everyone['blocked'] == args.users - len(reachable)
+        and resent <= int(os.environ['BROADCAST_BATCH_SIZE'])
+    )
+    print(f"\n{'✅' if passed else '❌'} every reachable user got each broadcast meant for them, "
+          f"blocked users were counted, the restart resumed from the checkpoint")
+    return passed
+
+
+def summary(broadcast) -> str:
+    """The admin report on one line, without Markdown"""
+    from bot import InviteMemberBot
+    return InviteMemberBot.format_broadcast(broadcast).replace('**', '').replace('\n', ' ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Broadcast throughput and resume check')
+    parser.add_argument('--users', type=int, default=600)
+    parser.add_argument('--global-rate', type=float, default=30, help='TELEGRAM_SEND_GLOBAL_RATE for the run')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--telegram-latency', type=float, default=0.03)
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(FaultInjector(args.telegram_latency))
+    server = telegram.serve(args.telegram_port)
+    workdir = tempfile.mkdtemp(prefix='broadcast-')
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN='123456:BROADCAST',
+        TELEGRAM_GROUP_INVITE_LINK='https://t.me/+broadcast',
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{args.telegram_port}/bot",
+        TELEGRAM_SEND_GLOBAL_RATE=str(args.global_rate),
+        PAYPAL_CLIENT_ID='broadcast',
+        PAYPAL_CLIENT_SECRET='broadcast',
+        BROADCAST_BATCH_SIZE=str(args.batch_size),
+        DATABASE_PATH=os.path.join(workdir, 'broadcast.db')
+    )
+    try:
+        passed = asyncio.run(run(args, telegram))
+    finally:
+        server.shutdown()
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Click-spam check for payment creation
+
+Starts fake_paypal in-process and builds two InviteMemberBot instances on one
+throwaway database, as two worker processes would have: separate connections,
+separate in-process state, one SQLite file. Every simulated user then fires a
+burst of concurrent "Pay Now" payment starts spread over both instances, and
+the PayPal create calls are counted, first through the unguarded
+create_payment_session and then through start_payment.
+
+Usage:
+    python loadtest/run_click_spam.py [--users 50] [--clicks 8] [--paypal-latency 0.3]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_common import FaultInjector
+from fake_paypal import FakePayPal
+
+
+async def spam(bots, users, clicks, start):
+    """clicks concurrent payment starts per user, alternating between bots; returns links per user"""
+    starts = [(user_id, bots[click % len(bots)]) for user_id in users for click in range(clicks)]
+    results = await asyncio.gather(*(start(bot, user_id) for user_id, bot in starts))
+    links = {}
+    for (user_id, _), (payment_url, _) in zip(starts, results):
+        links.setdefault(user_id, set()).add(payment_url)
+    return links
+
+
+async def run(args, paypal):
+    from bot import InviteMemberBot
+
+    bots = [InviteMemberBot(), InviteMemberBot()]
+    guarded_users = range(1, args.users + 1)
+    unguarded_users = range(args.users + 1, 2 * args.users + 1)
+    for user_id in [*guarded_users, *unguarded_users]:
+        await bots[0].db.add_user(user_id, first_name='Buyer')
+
+    creates = lambda: paypal.faults.stats()['calls'].get('create', 0)
+
+    before = creates()
+    await spam(bots, unguarded_users, args.clicks, lambda bot, user_id: bot.create_payment_session(user_id))
+    unguarded = creates() - before
+
+    before = creates()
+    links = await spam(bots, guarded_users, args.clicks, lambda bot, user_id: bot.start_payment(user_id))
+    guarded = creates() - before
+
+    for bot in bots:
+        await bot.paypal.close()
+        bot.db.close()
+
+    print(f"{args.users} users x {args.clicks} concurrent clicks over {len(bots)} bot instances\n")
+    print(f"PayPal creates without the guard: {unguarded}")
+    print(f"PayPal creates with start_payment: {guarded}")
+    for index, bot in enumerate(bots):
+        print(f"  instance {index}: {bot.payment_start_metrics}")
+
+    single_link = all(len(urls) == 1 and None not in urls for urls in links.values())
+    passed = guarded == args.users and single_link
+    print(f"\n{'✅' if passed else '❌'} one PayPal payment and one link per user")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent payment start check')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--clicks', type=int, default=8, help='Concurrent payment starts per user')
+    parser.add_argument('--paypal-port', type=int, default=8082)
+    parser.add_argument('--paypal-latency', type=float, default=0.3)
+    args = parser.parse_args()
+
+    paypal = FakePayPal(FaultInjector(args.paypal_latency))
+    server = paypal.serve(args.paypal_port)
+    workdir = tempfile.mkdtemp(prefix='clickspam-')
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN='123456:CLICKSPAM',
+        TELEGRAM_GROUP_INVITE_LINK='https://t.me/+clickspam',
+        PAYPAL_CLIENT_ID='clickspam',
+        PAYPAL_CLIENT_SECRET='clickspam',
+        PAYPAL_API_BASE_URL=f"http://127.0.0.1:{args.paypal_port}",
+        DATABASE_PATH=os.path.join(workdir, 'clickspam.db')
+    )
+    try:
+        passed = asyncio.run(run(args, paypal))
+    finally:
+        server.shutdown()
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the purchase flow against local PayPal and Telegram fakes
+
+Starts fake_paypal and fake_telegram in-process, launches the real bot
+(run.py, polling) and webhook_server.py against them with a throwaway
+database, or with --server asgi the single ASGI app (run.py --mode asgi),
+then drives simulated buyers through every stage:
+
+    start             /start until the welcome message with "Pay Now" arrives
+    initiate_payment  "Pay Now" press until the PayPal link arrives
+    payment_success   PayPal's redirect to /payment/success until it answers
+    invite            that redirect until the invite message arrives
+
+and reports throughput plus p50/p95/p99 latency per stage.
+
+Usage:
+    python loadtest/run_loadtest.py [--buyers 1000] [--concurrency 50]
+        [--paypal-latency 0.1] [--paypal-error-rate 0.02] [--telegram-latency 0.03]
+        [--server asgi] [--asgi-workers 4]
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from fake_common import FaultInjector
+from fake_paypal import FakePayPal
+from fake_telegram import FakeTelegram
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INVITE_LINK = 'https://t.me/+loadtest'
+STAGES = ('start', 'initiate_payment', 'payment_success', 'invite', 'end_to_end')
+# webhook_server.py always listens here; the ASGI app is started on it too
+WEBHOOK_PORT = 5000
+
+
+def http_get(url: str, timeout: float) -> Tuple[int, Dict[str, str]]:
+    """GET without following redirects; returns (status, headers)"""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    try:
+        conn.request('GET', parts.path + ('?' + parts.query if parts.query else ''))
+        response = conn.getresponse()
+        response.read()
+        return response.status, dict(response.getheaders())
+    finally:
+        conn.close()
+
+
+def buttons(message: Dict) -> List[Dict]:
+    rows = message.get('reply_markup', {}).get('inline_keyboard', [])
+    return [button for row in rows for button in row]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class BuyerFailed(Exception):
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"{stage}: {reason}")
+        self.stage = stage
+
+
+def run_buyer(telegram: FakeTelegram, user_id: int, timeout: float) -> Dict[str, float]:
+    """Walk one simulated buyer through the purchase; returns seconds per stage"""
+    timings = {}
+    began = time.perf_counter()
+
+    # /start -> welcome message with the "Pay Now" button
+    seen = telegram.sent_count(user_id)
+    telegram.push_message(user_id, '/start')
+    welcome = telegram.wait_for_message(
+        user_id, lambda m: any(b.get('callback_data') == 'pay_now' for b in buttons(m)), seen, timeout
+    )
+    if welcome is None:
+        raise BuyerFailed('start', 'no welcome message')
+    timings['start'] = time.perf_counter() - began
+
+    # "Pay Now" -> PayPal link
+    stage_began = time.perf_counter()
+    seen = telegram.sent_count(user_id)
+    telegram.push_callback(user_id, welcome, 'pay_now')
+    offer = telegram.wait_for_message(user_id, lambda m: any(b.get('url') for b in buttons(m)), seen, timeout)
+    if offer is None:
+        raise BuyerFailed('initiate_payment', 'no payment link')
+    timings['initiate_payment'] = time.perf_counter() - stage_began
+    approval_url = next(b['url'] for b in buttons(offer) if b.get('url'))
+
+    # Buyer approves on PayPal, which redirects back to the webhook server
+    status, headers = http_get(approval_url, timeout)
+    if status != 302:
+        raise BuyerFailed('payment_success', f"approval returned {status}")
+
+    stage_began = time.perf_counter()
+    seen = telegram.sent_count(user_id)
+    status, _ = http_get(headers['Location'], timeout)
+    if status != 200:
+        raise BuyerFailed('payment_success', f"return URL answered {status}")
+    timings['payment_success'] = time.perf_counter() - stage_began
+
+    invite = telegram.wait_for_message(user_id, lambda m: INVITE_LINK in m.get('text', ''), seen, timeout)
+    if invite is None:
+        raise BuyerFailed('invite', 'no invite message')
+    timings['invite'] = time.perf_counter() - stage_began
+    timings['end_to_end'] = time.perf_counter() - began
+    return timings
+
+
+def wait_until(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end purchase flow load test')
+    parser.add_argument('--buyers', type=int, default=1000, help='Simulated buyers (default: 1000)')
+    parser.add_argument('--concurrency', type=int, default=50, help='Buyers in flight at once (default: 50)')
+    parser.add_argument('--first-user-id', type=int, default=10_000_000)
+    parser.add_argument('--stage-timeout', type=float, default=60.0, help='Seconds to wait for each stage')
+    parser.add_argument('--paypal-port', type=int, default=8082)
+    parser.add_argument('--paypal-latency', type=float, default=0.0)
+    parser.add_argument('--paypal-jitter', type=float, default=0.0)
+    parser.add_argument('--paypal-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--telegram-jitter', type=float, default=0.0)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument('--server', choices=['split', 'asgi'], default='split',
+                        help='Polling bot plus webhook_server.py, or one ASGI app (default: split)')
+    parser.add_argument('--asgi-workers', type=int, default=1, help='Worker processes for --server asgi')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    paypal = FakePayPal(FaultInjector(args.paypal_latency, args.paypal_jitter, args.paypal_error_rate))
+    telegram = FakeTelegram(FaultInjector(args.telegram_latency, args.telegram_jitter, args.telegram_error_rate))
+    servers = [paypal.serve(args.paypal_port), telegram.serve(args.telegram_port)]
+
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN='123456:LOADTEST',
+        TELEGRAM_GROUP_INVITE_LINK=INVITE_LINK,
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{args.telegram_port}/bot",
+        PAYPAL_CLIENT_ID='loadtest',
+        PAYPAL_CLIENT_SECRET='loadtest',
+        PAYPAL_API_BASE_URL=f"http://127.0.0.1:{args.paypal_port}",
+        WEBHOOK_BASE_URL=f"http://127.0.0.1:{WEBHOOK_PORT}",
+        TELEGRAM_WEBHOOK_SECRET='loadtest-secret',
+        DATABASE_PATH=os.path.join(workdir, 'loadtest.db')
+    )
+    if args.server == 'asgi':
+        commands = (('asgi', ['run.py', '--mode', 'asgi', '--host', '127.0.0.1', '--port', str(WEBHOOK_PORT),
+                              '--workers', str(args.asgi_workers)]),)
+    else:
+        commands = (('bot', ['run.py', '--mode', 'polling']), ('webhook', ['webhook_server.py']))
+    processes = []
+    for name, command in commands:
+        log = open(os.path.join(workdir, f"{name}.log"), 'w')
+        processes.append(subprocess.Popen(
+            [sys.executable] + command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        ))
+    print(f"Bot and webhook server logs: {workdir}")
+
+    results: List[Dict[str, float]] = []
+    failures: Dict[str, int] = {}
+    try:
+        if args.server == 'asgi':
+            wait_until(lambda: telegram.webhook_url is not None, 30, 'the bot to set its webhook')
+        else:
+            wait_until(lambda: telegram.polls > 0, 30, 'the bot to start polling')
+        wait_until(lambda: http_get(f"http://127.0.0.1:{WEBHOOK_PORT}/health", 5)[0] == 200, 30, 'the webhook server')
+
+        print(f"Driving {args.buyers} buyers, {args.concurrency} at a time...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_buyer, telegram, args.first_user_id + i, args.stage_timeout)
+                for i in range(args.buyers)
+            ]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except BuyerFailed as e:
+                    failures[e.stage] = failures.get(e.stage, 0) + 1
+                except Exception as e:
+                    failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+        elapsed = time.perf_counter() - started
+
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', WEBHOOK_PORT, timeout=5)
+            conn.request('GET', '/metrics')
+            webhook_metrics = json.loads(conn.getresponse().read())
+        except (OSError, ValueError):
+            webhook_metrics = None
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for server in servers:
+            server.shutdown()
+
+    report = {
+        'buyers': args.buyers,
+        'completed': len(results),
+        'failed': failures,
+        'elapsed': elapsed,
+        'throughput': len(results) / elapsed if elapsed else 0.0,
+        'stages': {},
+        'paypal_fake': paypal.faults.stats(),
+        'telegram_fake': telegram.faults.stats(),
+        'webhook_metrics': webhook_metrics
+    }
+    for stage in STAGES:
+        values = sorted(r[stage] for r in results)
+        report['stages'][stage] = {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': values[-1] if values else 0.0
+        }
+
+    print(f"\nCompleted {report['completed']}/{args.buyers} purchases in {elapsed:.1f}s "
+          f"({report['throughput']:.1f} purchases/s)")
+    if failures:
+        print(f"Failures by stage: {failures}")
+    print(f"\n{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, row in report['stages'].items():
+        print(f"{stage:<18}{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+              f"{row['p99'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}")
+    print(f"\nFake PayPal: {report['paypal_fake']}")
+    print(f"Fake Telegram: {report['telegram_fake']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
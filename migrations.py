@@ -0,0 +1,317 @@
+"""
+Versioned schema migrations for the bot database
+The applied version is stored in PRAGMA user_version; each migration runs once,
+in order, inside its own transaction. Steps that cannot run in a transaction
+must be safe to repeat, since two processes starting together may both run them.
+"""
+import sqlite3
+import logging
+from typing import Callable, List, NamedTuple
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+    # Some statements (VACUUM, auto_vacuum changes) cannot run inside a transaction
+    transactional: bool = True
+
+def _create_base_tables(conn: sqlite3.Connection):
+    # Users table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            has_paid BOOLEAN DEFAULT FALSE,
+            invite_sent BOOLEAN DEFAULT FALSE
+        )
+    ''')
+
+    # Payments table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            payment_id TEXT UNIQUE,
+            payer_id TEXT,
+            amount REAL,
+            currency TEXT,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Payment sessions table (for tracking pending payments)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payment_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_id TEXT UNIQUE,
+            payment_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            status TEXT DEFAULT 'pending',
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+def _create_stats_counters(conn: sqlite3.Connection):
+    # Rollup counters kept current by triggers so /stats never scans a table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_stats_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value + IFNULL(NEW.has_paid = TRUE, 0) WHERE name = 'paid_users';
+            UPDATE stats_counters SET value = value + IFNULL(NEW.invite_sent = TRUE, 0) WHERE name = 'invited_users';
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_stats_update AFTER UPDATE OF has_paid, invite_sent ON users
+        BEGIN
+            UPDATE stats_counters
+            SET value = value + IFNULL(NEW.has_paid = TRUE, 0) - IFNULL(OLD.has_paid = TRUE, 0)
+            WHERE name = 'paid_users';
+            UPDATE stats_counters
+            SET value = value + IFNULL(NEW.invite_sent = TRUE, 0) - IFNULL(OLD.invite_sent = TRUE, 0)
+            WHERE name = 'invited_users';
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_stats_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value - IFNULL(OLD.has_paid = TRUE, 0) WHERE name = 'paid_users';
+            UPDATE stats_counters SET value = value - IFNULL(OLD.invite_sent = TRUE, 0) WHERE name = 'invited_users';
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS payments_stats_insert AFTER INSERT ON payments
+        WHEN NEW.status = 'approved'
+        BEGIN
+            UPDATE stats_counters SET value = value + IFNULL(NEW.amount, 0) WHERE name = 'total_revenue';
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS payments_stats_update AFTER UPDATE OF status, amount ON payments
+        BEGIN
+            UPDATE stats_counters
+            SET value = value
+                + CASE WHEN NEW.status = 'approved' THEN IFNULL(NEW.amount, 0) ELSE 0 END
+                - CASE WHEN OLD.status = 'approved' THEN IFNULL(OLD.amount, 0) ELSE 0 END
+            WHERE name = 'total_revenue';
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS payments_stats_delete AFTER DELETE ON payments
+        WHEN OLD.status = 'approved'
+        BEGIN
+            UPDATE stats_counters SET value = value - IFNULL(OLD.amount, 0) WHERE name = 'total_revenue';
+        END
+    ''')
+
+    # Seed from whatever data the database already holds
+    conn.execute('''
+        INSERT OR IGNORE INTO stats_counters (name, value)
+        SELECT 'total_users', COUNT(*) FROM users
+        UNION ALL SELECT 'paid_users', IFNULL(SUM(has_paid = TRUE), 0) FROM users
+        UNION ALL SELECT 'invited_users', IFNULL(SUM(invite_sent = TRUE), 0) FROM users
+        UNION ALL SELECT 'total_revenue', IFNULL(SUM(amount), 0) FROM payments WHERE status = 'approved'
+    ''')
+
+def _add_hot_path_indexes(conn: sqlite3.Connection):
+    # Pending-session lookup for a user (status snapshot, session reuse)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_sessions_user_status_expires
+        ON payment_sessions (user_id, status, expires_at)
+    ''')
+    # Expiry sweeps over pending sessions
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_sessions_status_expires
+        ON payment_sessions (status, expires_at)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_has_paid ON users (has_paid)')
+
+def _create_session_archive(conn: sqlite3.Connection):
+    # Finished or abandoned sessions moved out of the hot table by the sweeper
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payment_sessions_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            session_id TEXT,
+            payment_url TEXT,
+            created_at TIMESTAMP,
+            expires_at TIMESTAMP,
+            status TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    # ALTER TABLE has no IF NOT EXISTS; skip columns an earlier run already added
+    if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _enable_incremental_vacuum(conn: sqlite3.Connection):
+    # auto_vacuum only takes effect on an existing file after a full VACUUM;
+    # safe to repeat, a second run finds it already enabled
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+
+def _add_session_precreated_flag(conn: sqlite3.Connection):
+    # 0 = created on request, 1 = pre-created and unclaimed, 2 = pre-created and claimed
+    _add_column(conn, 'payment_sessions', 'precreated', 'INTEGER NOT NULL DEFAULT 0')
+
+def _add_reconciliation_state(conn: sqlite3.Connection):
+    # PayPal payment id of each session, so unfinished payments can be looked up later
+    _add_column(conn, 'payment_sessions', 'payment_id', 'TEXT')
+    _add_column(conn, 'payment_sessions_archive', 'payment_id', 'TEXT')
+
+    # Resume points for background jobs that walk a table in batches
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _add_webhook_event_queue(conn: sqlite3.Connection):
+    # Webhook lookups map a PayPal payment back to its session
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_payment_sessions_payment_id ON payment_sessions (payment_id)')
+
+    # Durable queue of received PayPal webhooks; event_id deduplicates redeliveries
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS webhook_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id TEXT NOT NULL UNIQUE,
+            event_type TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            available_at TIMESTAMP,
+            claimed_at TIMESTAMP,
+            processed_at TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_webhook_events_status_available ON webhook_events (status, available_at)')
+
+def _add_leases(conn: sqlite3.Connection):
+    # Short-lived named locks shared by every process using the database
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+def _add_broadcasts(conn: sqlite3.Connection):
+    # Admin broadcasts; users are walked in id order and last_user_id is the resume point
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            audience TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_by INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            elapsed REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)')
+
+def _add_unfinished_session_index(conn: sqlite3.Connection):
+    # Reconciliation walks unfinished sessions in id order without sorting them
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_sessions_unfinished ON payment_sessions (id)
+        WHERE status IN ('pending', 'expired') AND payment_id IS NOT NULL
+    ''')
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Create users, payments and payment_sessions tables', _create_base_tables),
+    Migration(2, 'Add trigger-maintained statistics counters', _create_stats_counters),
+    Migration(3, 'Add indexes for hot lookups', _add_hot_path_indexes),
+    Migration(4, 'Add payment_sessions_archive table', _create_session_archive),
+    Migration(5, 'Enable incremental vacuum', _enable_incremental_vacuum, transactional=False),
+    Migration(6, 'Track speculatively pre-created payment sessions', _add_session_precreated_flag),
+    Migration(7, 'Store PayPal payment ids on sessions and add job checkpoints', _add_reconciliation_state),
+    Migration(8, 'Index session payment ids and add the webhook event queue', _add_webhook_event_queue),
+    Migration(9, 'Add leases table for cross-process locks', _add_leases),
+    Migration(10, 'Add broadcasts table', _add_broadcasts),
+    Migration(11, 'Index unfinished sessions for reconciliation', _add_unfinished_session_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """Schema version recorded in the database file"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply every migration newer than the database's user_version
+    Safe to call from several processes at once: each step re-checks the
+    version after taking the write lock.
+    Returns: the schema version after migrating
+    """
+    version = get_version(conn)
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+
+        if migration.transactional:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if get_version(conn) >= migration.version:
+                    # Another process got here first
+                    version = get_version(conn)
+                    continue
+                migration.apply(conn)
+                conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+        else:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                current = get_version(conn)
+            if current >= migration.version:
+                version = current
+                continue
+            # Runs outside a transaction, so another process may repeat it
+            # concurrently; such steps must be idempotent
+            migration.apply(conn)
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                # Never lower the version another process has already reached
+                if get_version(conn) < migration.version:
+                    conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+
+        version = migration.version
+        logging.info(f"Applied database migration {migration.version}: {migration.description}")
+
+    return version
@@ -0,0 +1,38 @@
+"""
+HTML pages shown to buyers when PayPal sends them back to the bot
+"""
+
+SUCCESS_PAGE = """
+            <html>
+            <head><title>Payment Successful</title></head>
+            <body>
+                <h1>✅ Payment Successful!</h1>
+                <p>Thank you for your payment! You should receive your Telegram group invite link shortly.</p>
+                <p>Please check your Telegram bot chat for the invite link.</p>
+                <p>You can now close this window.</p>
+            </body>
+            </html>
+            """
+
+FAILED_PAGE = """
+            <html>
+            <head><title>Payment Failed</title></head>
+            <body>
+                <h1>❌ Payment Failed</h1>
+                <p>There was an issue processing your payment. Please try again.</p>
+                <p>If the problem persists, please contact support.</p>
+            </body>
+            </html>
+            """
+
+CANCEL_PAGE = """
+    <html>
+    <head><title>Payment Cancelled</title></head>
+    <body>
+        <h1>❌ Payment Cancelled</h1>
+        <p>Your payment was cancelled. No charges have been made.</p>
+        <p>You can try again anytime by returning to the Telegram bot.</p>
+        <p>You can now close this window.</p>
+    </body>
+    </html>
+    """
@@ -1,9 +1,73 @@
 import paypalrestsdk
+import httpx
+import asyncio
+import contextlib
 import logging
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Tuple
-from config import PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_MODE, PAYMENT_AMOUNT, PAYMENT_CURRENCY
+from typing import Optional, Dict, Tuple, Callable, Awaitable
+from config import (
+    PAYPAL_CLIENT_ID,
+    PAYPAL_CLIENT_SECRET,
+    PAYPAL_MODE,
+    PAYPAL_API_BASE_URL,
+    PAYPAL_HTTP_TIMEOUT,
+    PAYPAL_MAX_CONNECTIONS,
+    PAYPAL_MAX_CONCURRENCY,
+    PAYPAL_TOKEN_REFRESH_MARGIN,
+    PAYPAL_PAYMENT_CACHE_SIZE,
+    PAYPAL_PAYMENT_CACHE_TTL,
+    PAYPAL_TIMEOUT_CREATE,
+    PAYPAL_TIMEOUT_EXECUTE,
+    PAYPAL_TIMEOUT_FIND,
+    PAYPAL_RETRY_ATTEMPTS,
+    PAYPAL_RETRY_BASE_DELAY,
+    PAYPAL_RETRY_MAX_DELAY,
+    PAYPAL_BREAKER_FAILURE_THRESHOLD,
+    PAYPAL_BREAKER_RESET_TIMEOUT,
+    PAYMENT_AMOUNT,
+    PAYMENT_CURRENCY
+)
+from cache import TTLCache
+from resilience import CircuitBreaker, call_with_retries
+
+# Payment states that never change again; cached copies in these states are trusted
+FINAL_PAYMENT_STATES = ('approved', 'failed', 'canceled', 'expired')
+
+PAYPAL_API_BASE_URLS = {
+    'sandbox': 'https://api-m.sandbox.paypal.com',
+    'live': 'https://api-m.paypal.com'
+}
+
+def build_payment_request(user_id: int, return_url: str, cancel_url: str) -> Dict:
+    """Body of a v1 'sale' payment for group access"""
+    return {
+        "intent": "sale",
+        "payer": {
+            "payment_method": "paypal"
+        },
+        "redirect_urls": {
+            "return_url": return_url,
+            "cancel_url": cancel_url
+        },
+        "transactions": [{
+            "item_list": {
+                "items": [{
+                    "name": "Telegram Group Access",
+                    "sku": f"tg_access_{user_id}",
+                    "price": str(PAYMENT_AMOUNT),
+                    "currency": PAYMENT_CURRENCY,
+                    "quantity": 1
+                }]
+            },
+            "amount": {
+                "total": str(PAYMENT_AMOUNT),
+                "currency": PAYMENT_CURRENCY
+            },
+            "description": f"Payment for Telegram group access - User ID: {user_id}"
+        }]
+    }
 
 class PayPalHandler:
     def __init__(self):
@@ -21,32 +85,7 @@ class PayPalHandler:
         Returns: (payment_url, payment_id) or (None, None) if failed
         """
         try:
-            payment = paypalrestsdk.Payment({
-                "intent": "sale",
-                "payer": {
-                    "payment_method": "paypal"
-                },
-                "redirect_urls": {
-                    "return_url": return_url,
-                    "cancel_url": cancel_url
-                },
-                "transactions": [{
-                    "item_list": {
-                        "items": [{
-                            "name": "Telegram Group Access",
-                            "sku": f"tg_access_{user_id}",
-                            "price": str(PAYMENT_AMOUNT),
-                            "currency": PAYMENT_CURRENCY,
-                            "quantity": 1
-                        }]
-                    },
-                    "amount": {
-                        "total": str(PAYMENT_AMOUNT),
-                        "currency": PAYMENT_CURRENCY
-                    },
-                    "description": f"Payment for Telegram group access - User ID: {user_id}"
-                }]
-            })
+            payment = paypalrestsdk.Payment(build_payment_request(user_id, return_url, cancel_url))
             
             if payment.create():
                 logging.info(f"Payment created successfully for user {user_id}: {payment.id}")
@@ -141,4 +180,454 @@ class PayPalHandler:
         """Create return and cancel URLs for PayPal"""
         return_url = f"{base_url}/payment/success?session_id={session_id}"
         cancel_url = f"{base_url}/payment/cancel?session_id={session_id}"
-        return return_url, cancel_url
\ No newline at end of file
+        return return_url, cancel_url
+
+
+class PayPalTokenCache:
+    """
+    In-memory OAuth access token with proactive, single-flight refresh
+    The token is refreshed in the background PAYPAL_TOKEN_REFRESH_MARGIN seconds
+    before it expires; concurrent callers share one in-flight fetch.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[Tuple[str, int]]], refresh_margin: float = None):
+        self._fetch = fetch
+        self.refresh_margin = PAYPAL_TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.fetch_count = 0
+        self.fetch_failures = 0
+        self.background_refreshes = 0
+        self.last_refresh_latency: Optional[float] = None
+        self.max_refresh_latency = 0.0
+        self._total_refresh_latency = 0.0
+
+    async def get(self) -> str:
+        """Return a valid token, fetching one only if none is usable"""
+        now = time.monotonic()
+        if self._token and now < self._expires_at:
+            if now >= self._refresh_at:
+                self._start_refresh(background=True)
+            return self._token
+
+        # shield: one caller being cancelled must not cancel everyone's fetch
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate(self):
+        """Forget the current token, e.g. after PayPal rejected it"""
+        self._token = None
+        self._expires_at = 0.0
+
+    def close(self):
+        """Stop the scheduled refresh"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _start_refresh(self, background: bool = False) -> asyncio.Task:
+        """Start a fetch unless one is already running, and return it"""
+        if self._inflight is None or self._inflight.done():
+            if background:
+                self.background_refreshes += 1
+            self._inflight = asyncio.ensure_future(self._refresh())
+            self._inflight.add_done_callback(self._log_failure)
+        return self._inflight
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logging.error(f"PayPal access token refresh failed: {task.exception()}")
+
+    async def _refresh(self) -> str:
+        started = time.perf_counter()
+        self.fetch_count += 1
+        try:
+            token, expires_in = await self._fetch()
+        except Exception:
+            self.fetch_failures += 1
+            raise
+
+        latency = time.perf_counter() - started
+        self.last_refresh_latency = latency
+        self.max_refresh_latency = max(self.max_refresh_latency, latency)
+        self._total_refresh_latency += latency
+
+        now = time.monotonic()
+        self._token = token
+        self._expires_at = now + expires_in
+        self._refresh_at = now + max(expires_in - self.refresh_margin, expires_in / 2)
+
+        # Keep the token warm even when no payments are coming in
+        self.close()
+        self._timer = asyncio.get_running_loop().call_later(
+            self._refresh_at - now, self._start_refresh, True
+        )
+        return token
+
+    def metrics(self) -> Dict:
+        """Token fetch counters and refresh latency"""
+        successes = self.fetch_count - self.fetch_failures
+        return {
+            'fetch_count': self.fetch_count,
+            'fetch_failures': self.fetch_failures,
+            'background_refreshes': self.background_refreshes,
+            'last_refresh_latency': self.last_refresh_latency,
+            'avg_refresh_latency': self._total_refresh_latency / successes if successes else None,
+            'max_refresh_latency': self.max_refresh_latency,
+            'expires_in': max(self._expires_at - time.monotonic(), 0) if self._token else 0
+        }
+
+
+class AsyncPayPalHandler:
+    """
+    Non-blocking PayPal REST client with the same return contracts as PayPalHandler
+    All calls share one keep-alive connection pool, carry a per-operation
+    deadline and are capped at PAYPAL_MAX_CONCURRENCY in flight. Timeouts,
+    connection errors and 5xx/429 responses are retried with jittered backoff
+    and feed a circuit breaker that fails calls fast while PayPal is unhealthy.
+    """
+
+    def __init__(self, base_url: str = None):
+        self.base_url = (base_url or PAYPAL_API_BASE_URL or PAYPAL_API_BASE_URLS[PAYPAL_MODE]).rstrip('/')
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.token_cache = PayPalTokenCache(self._fetch_access_token)
+        self.breaker = CircuitBreaker(
+            'PayPal',
+            failure_threshold=PAYPAL_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=PAYPAL_BREAKER_RESET_TIMEOUT
+        )
+        self.retry_counts: Dict[str, int] = {}
+
+        # Recently seen payment resources keyed by PayPal payment id, filled from
+        # create/execute responses, finds and webhook events
+        self.payment_cache = TTLCache(maxsize=PAYPAL_PAYMENT_CACHE_SIZE, ttl=PAYPAL_PAYMENT_CACHE_TTL)
+        # Executions in flight, so concurrent redirects share one execute call
+        self._executions: Dict[str, asyncio.Future] = {}
+        self.find_count = 0
+        self.execute_count = 0
+        self.execute_deduplicated = 0
+
+        logging.info(f"Async PayPal client configured in {PAYPAL_MODE} mode ({self.base_url})")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created on first use inside the running event loop"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(PAYPAL_HTTP_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=PAYPAL_MAX_CONNECTIONS,
+                    max_keepalive_connections=PAYPAL_MAX_CONNECTIONS
+                )
+            )
+            self._semaphore = asyncio.Semaphore(PAYPAL_MAX_CONCURRENCY)
+        return self._client
+
+    async def close(self):
+        """Stop token refreshes and close pooled connections"""
+        self.token_cache.close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_access_token(self) -> Tuple[str, int]:
+        """
+        Request a new OAuth2 client-credentials token
+        Returns: (access_token, expires_in seconds)
+        """
+        response = await self.client.post(
+            '/v1/oauth2/token',
+            data={'grant_type': 'client_credentials'},
+            auth=(PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET),
+            headers={'Accept': 'application/json'}
+        )
+        response.raise_for_status()
+        token = response.json()
+        expires_in = int(token.get('expires_in') or 0)
+        if expires_in <= 0:
+            # A zero lifetime would schedule the next refresh immediately, forever
+            raise ValueError(f"PayPal token response has no usable expires_in: {token.get('expires_in')!r}")
+        return token['access_token'], expires_in
+
+    @property
+    def available(self) -> bool:
+        """False while the circuit breaker is failing PayPal calls fast"""
+        return self.breaker.available
+
+    @staticmethod
+    def _is_service_failure(e: Exception) -> bool:
+        """Errors that say PayPal is unhealthy, as opposed to rejecting the request"""
+        if isinstance(e, (asyncio.TimeoutError, httpx.TransportError)):
+            return True
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code >= 500 or e.response.status_code == 429
+        return False
+
+    async def _request(self, method: str, path: str, json: Dict = None, *, operation: str, deadline: float) -> Dict:
+        """
+        Authenticated REST call with a per-attempt deadline, retries and the circuit breaker
+        POSTs carry one PayPal-Request-Id across all attempts, so PayPal applies a
+        retried create or execute only once.
+        Raises httpx.HTTPStatusError on a PayPal error response and
+        CircuitOpenError while the breaker is open.
+        """
+        headers = {'Content-Type': 'application/json'}
+        if method != 'GET':
+            headers['PayPal-Request-Id'] = str(uuid.uuid4())
+
+        def on_retry(attempt: int, e: Exception):
+            self.retry_counts[operation] = self.retry_counts.get(operation, 0) + 1
+            logging.warning(f"PayPal {operation} attempt {attempt} failed, retrying: {self._describe_error(e)}")
+
+        return await call_with_retries(
+            lambda token: self._send(method, path, json, headers, token),
+            deadline=deadline,
+            attempts=PAYPAL_RETRY_ATTEMPTS,
+            base_delay=PAYPAL_RETRY_BASE_DELAY,
+            max_delay=PAYPAL_RETRY_MAX_DELAY,
+            is_failure=self._is_service_failure,
+            breaker=self.breaker,
+            on_retry=on_retry,
+            prepare=self._request_slot
+        )
+
+    @contextlib.asynccontextmanager
+    async def _request_slot(self):
+        """
+        One of PAYPAL_MAX_CONCURRENCY request slots, plus a valid token
+        Entered before the attempt's deadline starts, so queueing behind other
+        requests is not mistaken for PayPal being slow.
+        """
+        # The client is created lazily, together with the semaphore
+        self.client
+        async with self._semaphore:
+            yield await self.token_cache.get()
+
+    async def _send(self, method: str, path: str, json: Optional[Dict], headers: Dict, token: str) -> Dict:
+        """One attempt of _request, holding a request slot"""
+        client = self.client
+        response = await client.request(
+            method,
+            path,
+            json=json,
+            headers={**headers, 'Authorization': f'Bearer {token}'}
+        )
+        if response.status_code == 401:
+            # Token revoked or expired early: fetch a fresh one and retry once
+            self.token_cache.invalidate()
+            token = await self.token_cache.get()
+            response = await client.request(
+                method,
+                path,
+                json=json,
+                headers={**headers, 'Authorization': f'Bearer {token}'}
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def metrics(self) -> Dict:
+        """Operational metrics for the PayPal client"""
+        return {
+            'token': self.token_cache.metrics(),
+            'breaker': self.breaker.metrics(),
+            'retries': dict(self.retry_counts),
+            'payment_cache': self.payment_cache.stats(),
+            'finds': self.find_count,
+            'executes': self.execute_count,
+            'executes_deduplicated': self.execute_deduplicated
+        }
+
+    def _remember(self, payment: Dict):
+        """Cache a payment resource returned by PayPal"""
+        if payment.get('id'):
+            self.payment_cache.set(payment['id'], payment)
+
+    async def _find_payment(self, payment_id: str) -> Dict:
+        """Payment resource from the cache if it is final, otherwise from PayPal"""
+        payment = self.payment_cache.get(payment_id)
+        if payment is not None and payment.get('state') in FINAL_PAYMENT_STATES:
+            return payment
+
+        self.find_count += 1
+        payment = await self._request(
+            'GET', f'/v1/payments/payment/{payment_id}', operation='find', deadline=PAYPAL_TIMEOUT_FIND
+        )
+        self._remember(payment)
+        return payment
+
+    def record_webhook_event(self, event: Dict):
+        """
+        Fold an authenticated webhook event into the payment cache
+        A completed sale means its parent payment is approved, so later
+        verification of that payment needs no round trip.
+        """
+        if event.get('event_type') != 'PAYMENT.SALE.COMPLETED':
+            return
+
+        sale = event.get('resource', {})
+        payment_id = sale.get('parent_payment')
+        if not payment_id:
+            return
+
+        payment = dict(self.payment_cache.get(payment_id) or {'id': payment_id})
+        payment['state'] = 'approved'
+        if 'transactions' not in payment and sale.get('amount'):
+            payment['transactions'] = [{'amount': sale['amount']}]
+        self._remember(payment)
+
+    @staticmethod
+    def _describe_error(e: Exception) -> str:
+        """Include PayPal's error body for HTTP errors"""
+        if isinstance(e, httpx.HTTPStatusError):
+            return f"{e.response.status_code} {e.response.text}"
+        return str(e) or e.__class__.__name__
+
+    async def create_payment(self, user_id: int, return_url: str, cancel_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Create a PayPal payment
+        Returns: (payment_url, payment_id) or (None, None) if failed
+        """
+        try:
+            payment = await self._request(
+                'POST',
+                '/v1/payments/payment',
+                json=build_payment_request(user_id, return_url, cancel_url),
+                operation='create',
+                deadline=PAYPAL_TIMEOUT_CREATE
+            )
+            self._remember(payment)
+            logging.info(f"Payment created successfully for user {user_id}: {payment['id']}")
+
+            # Get the approval URL
+            for link in payment.get('links', []):
+                if link.get('rel') == 'approval_url':
+                    return link['href'], payment['id']
+
+            logging.error("No approval URL found in payment links")
+            return None, None
+
+        except Exception as e:
+            logging.error(f"Exception creating PayPal payment: {self._describe_error(e)}")
+            return None, None
+
+    async def execute_payment(self, payment_id: str, payer_id: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Execute a PayPal payment after user approval
+        Returns: (success, payment_details)
+        """
+        # Already executed by this process: reuse the result
+        executed = self.payment_cache.get(('executed', payment_id))
+        if executed is not None:
+            self.execute_deduplicated += 1
+            return True, executed
+
+        # Being executed right now: share that call
+        if payment_id in self._executions:
+            self.execute_deduplicated += 1
+            return await asyncio.shield(self._executions[payment_id])
+
+        future = asyncio.get_running_loop().create_future()
+        self._executions[payment_id] = future
+        try:
+            result = await self._execute_payment(payment_id, payer_id)
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._executions[payment_id]
+
+    async def _execute_payment(self, payment_id: str, payer_id: str) -> Tuple[bool, Optional[Dict]]:
+        """Single execute call, no preceding find"""
+        try:
+            self.execute_count += 1
+            try:
+                payment = await self._request(
+                    'POST',
+                    f'/v1/payments/payment/{payment_id}/execute',
+                    json={'payer_id': payer_id},
+                    operation='execute',
+                    deadline=PAYPAL_TIMEOUT_EXECUTE
+                )
+            except httpx.HTTPStatusError as e:
+                # Executed earlier by another process; read back the final state instead
+                if e.response.status_code != 400 or 'PAYMENT_ALREADY_DONE' not in e.response.text:
+                    raise
+                payment = await self._find_payment(payment_id)
+                if payment.get('state') != 'approved':
+                    raise
+            self._remember(payment)
+            logging.info(f"Payment executed successfully: {payment_id}")
+
+            # Extract payment details
+            amount = payment['transactions'][0]['amount']
+            payment_details = {
+                'payment_id': payment['id'],
+                'payer_id': payer_id,
+                'state': payment.get('state'),
+                'amount': float(amount['total']),
+                'currency': amount['currency'],
+                'create_time': payment.get('create_time'),
+                'update_time': payment.get('update_time')
+            }
+
+            self.payment_cache.set(('executed', payment_id), payment_details)
+            return True, payment_details
+
+        except Exception as e:
+            logging.error(f"Exception executing PayPal payment: {self._describe_error(e)}")
+            return False, None
+
+    async def get_payment_details(self, payment_id: str) -> Optional[Dict]:
+        """Get details of a PayPal payment"""
+        try:
+            payment = await self._find_payment(payment_id)
+            transactions = payment.get('transactions') or []
+
+            payment_details = {
+                'payment_id': payment['id'],
+                'state': payment.get('state'),
+                'intent': payment.get('intent'),
+                'amount': float(transactions[0]['amount']['total']) if transactions else 0,
+                'currency': transactions[0]['amount']['currency'] if transactions else '',
+                'create_time': payment.get('create_time'),
+                'update_time': payment.get('update_time'),
+                'payer_info': payment.get('payer', {}).get('payer_info', {})
+            }
+
+            return payment_details
+
+        except Exception as e:
+            logging.error(f"Exception getting PayPal payment details: {self._describe_error(e)}")
+            return None
+
+    async def verify_payment(self, payment_id: str) -> bool:
+        """Verify that a payment was completed successfully"""
+        try:
+            payment = await self._find_payment(payment_id)
+            return payment.get('state') == "approved"
+        except Exception as e:
+            logging.error(f"Exception verifying PayPal payment: {self._describe_error(e)}")
+            return False
+
+    def generate_webhook_url(self, base_url: str) -> str:
+        """Generate webhook URL for PayPal notifications"""
+        return f"{base_url}/webhook/paypal"
+
+    @staticmethod
+    def generate_session_id() -> str:
+        """Generate a unique session ID for payment tracking"""
+        return str(uuid.uuid4())
+
+    def create_return_urls(self, base_url: str, session_id: str) -> Tuple[str, str]:
+        """Create return and cancel URLs for PayPal"""
+        return_url = f"{base_url}/payment/success?session_id={session_id}"
+        cancel_url = f"{base_url}/payment/cancel?session_id={session_id}"
+        return return_url, cancel_url
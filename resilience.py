@@ -0,0 +1,146 @@
+"""
+Failure handling for calls to external services
+Deadlines, jittered retries and a circuit breaker that fails fast while the
+remote side is unhealthy.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar('T')
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail immediately. After reset_timeout one trial call is let through;
+    success closes the circuit, failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        # Metrics
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def available(self) -> bool:
+        """Whether a call would currently be let through"""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._trial_in_flight)
+
+    def before_call(self):
+        """Reserve a call, or raise CircuitOpenError"""
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        self.rejected_calls += 1
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logging.info(f"{self.name} circuit closed")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+
+    def release(self):
+        """Give back a reserved call that ended without an outcome (e.g. cancelled)"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN or self._trial_in_flight:
+                self.times_opened += 1
+                logging.warning(f"{self.name} circuit opened after {self._failures} consecutive failures")
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def metrics(self) -> Dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'times_opened': self.times_opened,
+            'rejected_calls': self.rejected_calls
+        }
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (1-based)"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+async def call_with_retries(
+    func: Callable[..., Awaitable[T]],
+    *,
+    deadline: float,
+    attempts: int = 1,
+    base_delay: float = 0.2,
+    max_delay: float = 2.0,
+    is_failure: Callable[[Exception], bool] = lambda e: True,
+    breaker: CircuitBreaker = None,
+    on_retry: Callable[[int, Exception], None] = None,
+    prepare: Callable[[], AsyncContextManager[Any]] = None
+) -> T:
+    """
+    Run func with a per-attempt deadline, retrying service failures with jitter
+    is_failure separates service failures (timeouts, 5xx) from errors where the
+    service answered and simply refused the request; only the former count
+    against the breaker or are retried. A retry loop stops as soon as the
+    breaker opens, re-raising the last real error.
+    prepare, if given, is entered before each attempt's deadline starts and
+    its value passed to func: waiting for a local slot is not the service's time.
+    """
+    for attempt in range(1, attempts + 1):
+        if breaker:
+            breaker.before_call()
+        try:
+            if prepare:
+                async with prepare() as prepared:
+                    result = await asyncio.wait_for(func(prepared), timeout=deadline)
+            else:
+                result = await asyncio.wait_for(func(), timeout=deadline)
+        except asyncio.CancelledError:
+            if breaker:
+                breaker.release()
+            raise
+        except Exception as e:
+            if not is_failure(e):
+                if breaker:
+                    breaker.record_success()
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt == attempts or (breaker and not breaker.available):
+                raise
+            if on_retry:
+                on_retry(attempt, e)
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+        else:
+            if breaker:
+                breaker.record_success()
+            return result
@@ -12,7 +12,7 @@ def main():
     parser = argparse.ArgumentParser(description='Telegram Invite Member Bot')
     parser.add_argument(
         '--mode', 
-        choices=['polling', 'webhook'], 
+        choices=['polling', 'webhook', 'asgi'], 
         default='polling',
         help='Bot running mode (default: polling)'
     )
@@ -26,6 +26,27 @@ def main():
         default=8443,
         help='Port for webhook mode (default: 8443)'
     )
+    parser.add_argument(
+        '--host',
+        default='0.0.0.0',
+        help='Bind address for asgi mode (default: 0.0.0.0)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Worker processes for asgi mode; update ordering is per worker (default: 1)'
+    )
+    parser.add_argument(
+        '--rebuild-stats',
+        action='store_true',
+        help='Recompute statistics counters from the raw tables and exit'
+    )
+    parser.add_argument(
+        '--check-query-plans',
+        action='store_true',
+        help='Fail if any hot query does a full table scan, then exit'
+    )
     parser.add_argument(
         '--verbose',
         action='store_true',
@@ -41,6 +62,48 @@ def main():
         level=log_level
     )
     
+    if args.rebuild_stats:
+        from database import DatabaseManager
+        db = DatabaseManager()
+        result = db.rebuild_stats()
+        db.close()
+        
+        if result['consistent']:
+            print(f"✅ Statistics counters are consistent: {result['after']}")
+        else:
+            print(f"⚠️ Statistics counters rebuilt: {result['before']} -> {result['after']}")
+        return
+    
+    if args.check_query_plans:
+        from database import DatabaseManager
+        db = DatabaseManager()
+        offenders = db.check_query_plans()
+        db.close()
+        
+        if offenders:
+            for name, scans in offenders.items():
+                print(f"❌ {name}: {'; '.join(scans)}")
+            sys.exit(1)
+        print("✅ All hot queries use an index")
+        return
+    
+    if args.mode == 'asgi':
+        from config import TELEGRAM_WEBHOOK_SECRET
+        if not TELEGRAM_WEBHOOK_SECRET:
+            print("❌ Error: TELEGRAM_WEBHOOK_SECRET is required for asgi mode")
+            sys.exit(1)
+        
+        # Each uvicorn worker imports asgi_server and builds its own bot
+        print("🤖 Starting bot and payment endpoints as one ASGI app...")
+        print(f"Listening on {args.host}:{args.port} with {args.workers} worker(s)")
+        if args.workers > 1:
+            print("⚠️ Each worker keeps its own users' updates in order; one user's updates may reach different workers")
+        print("Press Ctrl+C to stop the bot")
+        
+        import uvicorn
+        uvicorn.run('asgi_server:app', host=args.host, port=args.port, workers=args.workers)
+        return
+    
     # Create bot instance
     bot = InviteMemberBot()
     
@@ -0,0 +1,241 @@
+"""
+Flow control for outbound Telegram requests
+SendScheduler is plugged into python-telegram-bot as its rate limiter, so
+every reply, edit and send made through the bot passes through it. A request
+first waits for a token from its chat's bucket, then for one from the global
+bucket, which hands tokens out by priority lane. Flood-control answers
+(RetryAfter) pause the chat and the request is sent again.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (
+    TELEGRAM_SEND_GLOBAL_RATE,
+    TELEGRAM_SEND_CHAT_RATE,
+    TELEGRAM_SEND_CHAT_BURST,
+    TELEGRAM_SEND_GROUP_RATE_PER_MINUTE,
+    TELEGRAM_SEND_MAX_RETRIES
+)
+
+# Priority lanes, served lowest first; pass one as rate_limit_args
+PRIORITY_INVITE = 0
+PRIORITY_REPLY = 1
+PRIORITY_BULK = 2
+LANE_NAMES = ('invite', 'reply', 'bulk')
+
+# Latency samples kept per lane for the percentiles in metrics()
+LATENCY_SAMPLES = 1000
+
+# Idle chat buckets are dropped once this many are tracked
+CHAT_BUCKET_PRUNE_AT = 10000
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        if now < self.updated:
+            # Held
+            return self.updated - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def hold(self, seconds: float, now: float):
+        """Hand out nothing for seconds, then a single token"""
+        self.tokens = 1
+        self.updated = max(self.updated, now + seconds)
+
+    def full(self, now: float) -> bool:
+        return self.delay(now) == 0.0 and self.tokens >= self.capacity
+
+def _percentiles(samples: Deque[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {'p50': 0.0, 'p95': 0.0}
+    return {
+        'p50': ordered[len(ordered) // 2] * 1000,
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+    }
+
+class SendScheduler(BaseRateLimiter[int]):
+    """
+    Global and per-chat token buckets with priority lanes
+    Requests without a chat_id (getMe, answerCallbackQuery, setWebhook, ...)
+    are not throttled and go straight out, but RetryAfter is honoured for them
+    too.
+    """
+
+    def __init__(self, global_rate: float = None, chat_rate: float = None, chat_burst: float = None,
+                 group_rate_per_minute: float = None, max_retries: int = None):
+        self.chat_rate = chat_rate or TELEGRAM_SEND_CHAT_RATE
+        self.chat_burst = chat_burst or TELEGRAM_SEND_CHAT_BURST
+        self.group_rate = (group_rate_per_minute or TELEGRAM_SEND_GROUP_RATE_PER_MINUTE) / 60
+        self.max_retries = TELEGRAM_SEND_MAX_RETRIES if max_retries is None else max_retries
+        global_rate = global_rate or TELEGRAM_SEND_GLOBAL_RATE
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._prune_at = CHAT_BUCKET_PRUNE_AT
+
+        # Requests that have their chat token and wait for a global one
+        self._lanes: List[Deque[asyncio.Future]] = [deque() for _ in LANE_NAMES]
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.queued = [0] * len(LANE_NAMES)
+        self.sent = [0] * len(LANE_NAMES)
+        self.failed = 0
+        self.retry_afters = 0
+        self._waits = [deque(maxlen=LATENCY_SAMPLES) for _ in LANE_NAMES]
+        self._latencies = [deque(maxlen=LATENCY_SAMPLES) for _ in LANE_NAMES]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict, List[Dict]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict, List[Dict]]:
+        chat_id = data.get('chat_id')
+        with contextlib.suppress(ValueError, TypeError):
+            chat_id = int(chat_id)
+
+        lane = PRIORITY_REPLY if rate_limit_args is None else rate_limit_args
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                self.queued[lane] += 1
+                try:
+                    await self._acquire(chat_id, lane)
+                finally:
+                    self.queued[lane] -= 1
+                if attempt == 0:
+                    self._waits[lane].append(time.monotonic() - started)
+
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_afters += 1
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                logging.warning(f"Telegram flood control on {endpoint} to chat {chat_id}, retrying in {e.retry_after}s")
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after)
+                else:
+                    self._chat_bucket(chat_id).hold(e.retry_after, time.monotonic())
+                continue
+            except Exception:
+                self.failed += 1
+                raise
+
+            if chat_id is not None:
+                self.sent[lane] += 1
+                self._latencies[lane].append(time.monotonic() - started)
+            return result
+
+    async def _acquire(self, chat_id: Union[int, str], lane: int):
+        """Wait for a chat token, then for a global token in lane order"""
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            delay = bucket.delay(time.monotonic())
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        bucket.take()
+
+        if not any(self._lanes) and self._global.delay(time.monotonic()) <= 0:
+            self._global.take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        """Grant global tokens to waiting requests, highest priority lane first"""
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._global.delay(time.monotonic())
+            if delay > 0:
+                # Pick again afterwards: a more urgent request may have arrived
+                await asyncio.sleep(delay)
+                continue
+
+            self._global.take()
+            lane.popleft().set_result(None)
+
+    def _next_lane(self) -> Optional[Deque[asyncio.Future]]:
+        for lane in self._lanes:
+            # Drop requests cancelled while waiting
+            while lane and lane[0].done():
+                lane.popleft()
+            if lane:
+                return lane
+        return None
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                self._prune()
+            # Negative ids and @usernames are groups and channels, which have a per-minute limit
+            group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if group else self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self):
+        """Forget full buckets; a new bucket behaves exactly the same"""
+        now = time.monotonic()
+        self._chats = {chat_id: bucket for chat_id, bucket in self._chats.items() if not bucket.full(now)}
+        self._prune_at = max(CHAT_BUCKET_PRUNE_AT, 2 * len(self._chats))
+
+    def metrics(self) -> Dict:
+        return {
+            'queued': dict(zip(LANE_NAMES, self.queued)),
+            'sent': dict(zip(LANE_NAMES, self.sent)),
+            'failed': self.failed,
+            'retry_afters': self.retry_afters,
+            'wait_ms': {name: _percentiles(waits) for name, waits in zip(LANE_NAMES, self._waits)},
+            'latency_ms': {name: _percentiles(latencies) for name, latencies in zip(LANE_NAMES, self._latencies)},
+            'chats_tracked': len(self._chats)
+        }
@@ -0,0 +1,197 @@
+"""
+Message and keyboard templates
+Every text and keyboard the bot sends is rendered once per locale at startup,
+with the configured price and invite link already filled in. Per-user fields
+(a first name, minutes left on a link) stay as str.format fields and are
+substituted when the message is sent; texts without them are plain constants.
+"""
+from string import Formatter
+from typing import Dict, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, User
+
+from config import PAYMENT_AMOUNT, PAYMENT_CURRENCY, TELEGRAM_GROUP_INVITE_LINK, BOT_DEFAULT_LOCALE
+
+# Message catalogue per locale. {amount}, {currency} and {invite_link} come from
+# config; any other field is filled in per message.
+MESSAGES: Dict[str, Dict[str, str]] = {
+    'en': {
+        'welcome': """
+🤖 **Welcome to the Premium Group Access Bot!**
+
+Hello {first_name}! 👋
+
+To join our exclusive Telegram group, you need to make a one-time payment of **${amount} {currency}**.
+
+**What you get:**
+• Access to our premium Telegram group
+• Exclusive content and discussions
+• Direct access to community members
+• Lifetime membership
+
+**How it works:**
+1. Click the "💳 Pay Now" button below
+2. Complete the payment via PayPal
+3. Receive your invite link automatically
+
+Ready to join? Click the button below! 👇
+""",
+        'already_invited': (
+            "✅ You have already paid and received the invite link!\n\n"
+            "If you need the link again, please contact support."
+        ),
+        'help': """
+🆘 **Help & Support**
+
+**Available Commands:**
+• `/start` - Start the bot and see payment options
+• `/help` - Show this help message
+• `/status` - Check your payment status
+• `/pay` - Start the payment process
+
+**How to join the group:**
+1. Use `/start` to begin
+2. Click "💳 Pay Now" to make payment
+3. Complete PayPal payment
+4. Receive your invite link
+
+**Payment Information:**
+• Amount: ${amount} {currency}
+• Method: PayPal
+• One-time payment
+• Lifetime access
+
+**Need Support?**
+If you encounter any issues, please contact our support team.
+
+**Security Note:**
+We use secure PayPal payments. Your financial information is protected.
+""",
+        'user_not_found': "❌ User not found. Please use /start first.",
+        'status_completed': (
+            "✅ **Payment Status: COMPLETED**\n\n"
+            "You have successfully paid and received access to the group!"
+        ),
+        'status_paid': (
+            "⏳ **Payment Status: PAID**\n\n"
+            "Your payment is confirmed. Processing your invite link..."
+        ),
+        'status_pending': (
+            "❌ **Payment Status: PENDING**\n\n"
+            "You haven't completed the payment yet.\n"
+            "Amount required: ${amount} {currency}\n\n"
+            "Use /pay to start the payment process."
+        ),
+        'already_paid': "✅ You have already completed the payment!",
+        'payment_ready': """
+💳 **Payment Ready**
+
+Amount: **${amount} {currency}**
+
+Click the button below to complete your payment via PayPal.
+
+⏰ This payment link expires in {minutes_left} minutes.
+
+After successful payment, you'll automatically receive your invite link!
+""",
+        'payment_failed': "❌ Failed to create payment. Please try again later.",
+        'payments_unavailable': "⚠️ Payments are temporarily unavailable. Please try again in a few minutes.",
+        'payment_error': "❌ An error occurred while processing your request. Please try again.",
+        'invite': """
+🎉 **Welcome to the Premium Group!**
+
+Congratulations! Your payment has been confirmed.
+
+Here's your exclusive invite link:
+{invite_link}
+
+**Important Notes:**
+• This link is for your personal use only
+• Click the link to join the group immediately
+• Save this message for future reference
+
+Welcome to our community! 🚀
+""",
+        'fallback': """
+👋 Hello! I'm the Premium Group Access Bot.
+
+To get started, use one of these commands:
+• /start - Begin the process
+• /pay - Make payment for group access
+• /status - Check your payment status
+• /help - Get help and support
+
+Ready to join our exclusive group? Use /start! 🚀
+""",
+        'button_pay_now': "💳 Pay Now",
+        'button_help': "ℹ️ Help",
+        'button_status': "📊 My Status",
+        'button_refresh': "🔄 Refresh Status",
+        'button_pay_paypal': "💳 Pay with PayPal",
+        'button_cancel': "❌ Cancel"
+    }
+}
+
+def _prerender(template: str, config: Dict[str, str]) -> str:
+    """Fill in the config fields, leaving the per-user ones as {field}"""
+    fields = {name for _, name, _, _ in Formatter().parse(template) if name}
+    per_user = fields - config.keys()
+    if not per_user:
+        return template.format(**config)
+    # The result is formatted again, so braces in config values must survive that
+    values = {name: value.replace('{', '{{').replace('}', '}}') for name, value in config.items()}
+    values.update({name: '{' + name + '}' for name in per_user})
+    return template.format(**values)
+
+class Templates:
+    """Texts and keyboards of one locale, rendered up front"""
+
+    def __init__(self, locale: str, messages: Dict[str, str], config: Dict[str, str]):
+        self.locale = locale
+        self._texts = {name: _prerender(text, config).strip() for name, text in messages.items()}
+
+        pay_now = InlineKeyboardButton(self._texts['button_pay_now'], callback_data="pay_now")
+        refresh = InlineKeyboardButton(self._texts['button_refresh'], callback_data="status")
+        self._cancel = InlineKeyboardButton(self._texts['button_cancel'], callback_data="cancel_payment")
+        self.start_keyboard = InlineKeyboardMarkup([
+            [pay_now],
+            [InlineKeyboardButton(self._texts['button_help'], callback_data="help")],
+            [InlineKeyboardButton(self._texts['button_status'], callback_data="status")]
+        ])
+        self.status_keyboard_unpaid = InlineKeyboardMarkup([[pay_now], [refresh]])
+        self.status_keyboard_paid = InlineKeyboardMarkup([[refresh]])
+
+    def text(self, name: str, **fields) -> str:
+        """Rendered text; per-user fields are passed as keyword arguments"""
+        text = self._texts[name]
+        return text.format(**fields) if fields else text
+
+    def payment_keyboard(self, payment_url: str) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton(self._texts['button_pay_paypal'], url=payment_url)],
+            [self._cancel]
+        ])
+
+class TemplateRegistry:
+    """Templates for every locale in the catalogue, picked by a user's language"""
+
+    def __init__(self, catalogue: Dict[str, Dict[str, str]] = None, default_locale: str = None):
+        catalogue = catalogue or MESSAGES
+        config = {
+            'amount': f"{PAYMENT_AMOUNT:.2f}",
+            'currency': PAYMENT_CURRENCY,
+            'invite_link': TELEGRAM_GROUP_INVITE_LINK
+        }
+        default_locale = default_locale or BOT_DEFAULT_LOCALE
+        # Locales may leave out entries; those fall back to the default locale's text
+        base = catalogue[default_locale]
+        self._locales = {
+            locale: Templates(locale, {**base, **messages}, config)
+            for locale, messages in catalogue.items()
+        }
+        self.default = self._locales[default_locale]
+
+    def for_user(self, user: Optional[User]) -> Templates:
+        """Templates in the user's Telegram language, or the default locale"""
+        code = (user.language_code if user else None) or ''
+        return self._locales.get(code) or self._locales.get(code.split('-')[0]) or self.default
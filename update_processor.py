@@ -0,0 +1,107 @@
+"""
+Concurrent update processing that keeps each user's updates in order
+Updates from different users are handled in parallel, up to a fixed number
+at a time; a user's next update starts only once their previous one is done,
+so a double tap or a quick /status after "Pay Now" is seen in the order sent.
+"""
+import asyncio
+import inspect
+import sys
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Bounded pool of update handlers with per-user ordering
+    Updates waiting for an earlier update of the same user do not hold a
+    pool slot, so one busy user cannot starve everyone else.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        # The base class semaphore is taken before do_process_update runs, so
+        # it must never block: a blocked update could be overtaken by a later
+        # one from the same user, and updates waiting on their user's previous
+        # one would hold its slots. The base class sizes it from
+        # max_concurrent_updates, which reports the real bound (self._pool)
+        # so Application still runs concurrency=1 inline; replace it.
+        super().__init__(concurrency)
+        self._semaphore = asyncio.BoundedSemaphore(sys.maxsize)
+        self._pool: Optional[asyncio.Semaphore] = None
+        # Per user: a future resolved when their latest update is done
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+
+        # Metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self.concurrency
+
+    async def initialize(self) -> None:
+        self._pool = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """User (or, failing that, chat) whose updates must stay in order"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.ordering_key(update)
+        previous = self._tails.get(key) if key is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._tails[key] = done
+
+        try:
+            if previous is not None:
+                self.waiting += 1
+                try:
+                    # Shielded: cancelling this update must not cancel the one before it
+                    await asyncio.shield(previous)
+                finally:
+                    self.waiting -= 1
+            async with self._pool:
+                self.in_flight += 1
+                try:
+                    await coroutine
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+        finally:
+            # Never ran (cancelled while waiting): close it to avoid a "never awaited" warning
+            if inspect.iscoroutine(coroutine) and inspect.getcoroutinestate(coroutine) == inspect.CORO_CREATED:
+                coroutine.close()
+            if previous is not None and not previous.done():
+                # Cancelled while waiting: the user's next update still waits for the previous one
+                previous.add_done_callback(lambda _: self._finish(key, done))
+            else:
+                self._finish(key, done)
+
+    def _finish(self, key: Optional[Hashable], done: asyncio.Future):
+        """Let the user's next update start"""
+        if not done.done():
+            done.set_result(None)
+        if key is not None and self._tails.get(key) is done:
+            del self._tails[key]
+
+    def metrics(self) -> Dict:
+        return {
+            'concurrency': self.concurrency,
+            'in_flight': self.in_flight,
+            'waiting_on_same_user': self.waiting,
+            'processed': self.processed
+        }
@@ -2,55 +2,83 @@
 Webhook server for handling PayPal payment notifications
 This is optional - you can also check payment status manually or use polling
 """
+import asyncio
 import logging
 import json
+import threading
 from datetime import datetime
 from flask import Flask, request, jsonify
-from telegram import Bot
 
-from config import TELEGRAM_BOT_TOKEN
-from database import DatabaseManager
-from paypal_handler import PayPalHandler
+from config import PAYPAL_WEBHOOK_ID
+from bot import InviteMemberBot
+from webhook_worker import WebhookEventWorker
+from webhook_signature import WebhookVerifier
+from payment_pages import SUCCESS_PAGE, FAILED_PAGE, CANCEL_PAGE
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize components
-db = DatabaseManager()
-paypal_handler = PayPalHandler()
-telegram_bot = Bot(token=TELEGRAM_BOT_TOKEN)
+# Initialize components: the bot owns the database, PayPal and Telegram
+# clients, and the payment-return flow shared with the ASGI server
+bot = InviteMemberBot()
+bot.setup_application()
+db = bot.db
+paypal_handler = bot.paypal
+
+if PAYPAL_WEBHOOK_ID:
+    webhook_verifier = WebhookVerifier.from_config()
+else:
+    webhook_verifier = None
+    logger.warning("PAYPAL_WEBHOOK_ID is not set: PayPal webhook signatures are NOT verified")
+
+# Flask runs every async view on a fresh event loop, but pooled HTTP clients
+# are bound to the loop that created them. PayPal and Telegram calls therefore
+# run on this long-lived loop so their keep-alive connections are reused.
+shared_loop = asyncio.new_event_loop()
+threading.Thread(target=shared_loop.run_forever, name='webhook-loop', daemon=True).start()
+
+async def on_shared_loop(coro):
+    """Await a coroutine on the long-lived loop that owns the connection pools"""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, shared_loop))
+
+# Queued webhook events are processed on the shared loop as well
+webhook_worker = WebhookEventWorker(
+    db,
+    paypal_handler,
+    on_purchase=lambda user_id: bot.send_invite_link(None, user_id)
+)
+shared_loop.call_soon_threadsafe(webhook_worker.start)
 
 @app.route('/webhook/paypal', methods=['POST'])
 async def paypal_webhook():
-    """Handle PayPal webhook notifications"""
+    """
+    Queue a PayPal webhook notification and acknowledge it immediately
+    Verification and bookkeeping happen in the background workers; a
+    redelivered event id is acknowledged without queueing it again.
+    """
     try:
         # Get the webhook data
-        webhook_data = request.get_json()
+        webhook_data = request.get_json(silent=True)
         
         if not webhook_data:
             return jsonify({'error': 'No data received'}), 400
         
+        event_id = webhook_data.get('id')
         event_type = webhook_data.get('event_type')
-        resource = webhook_data.get('resource', {})
+        if not event_id:
+            return jsonify({'error': 'Missing event id'}), 400
         
-        logger.info(f"Received PayPal webhook: {event_type}")
+        if webhook_verifier and not webhook_verifier.verify(request.headers, request.get_data()):
+            return jsonify({'error': 'Invalid signature'}), 400
         
-        # Handle payment completion
-        if event_type == 'PAYMENT.SALE.COMPLETED':
-            payment_id = resource.get('parent_payment')
-            
-            if payment_id:
-                # Verify the payment
-                if paypal_handler.verify_payment(payment_id):
-                    # Find user by payment session
-                    # This would require storing payment_id in payment_sessions table
-                    # For now, we'll handle this in the return URL flow
-                    logger.info(f"Payment verified: {payment_id}")
-                else:
-                    logger.warning(f"Payment verification failed: {payment_id}")
+        if await db.enqueue_webhook_event(event_id, event_type, request.get_data(as_text=True)):
+            logger.info(f"Queued PayPal webhook {event_id}: {event_type}")
+            webhook_worker.notify()
+            return jsonify({'status': 'queued'}), 200
         
-        return jsonify({'status': 'success'}), 200
+        logger.info(f"Duplicate PayPal webhook {event_id} ignored")
+        return jsonify({'status': 'duplicate'}), 200
         
     except Exception as e:
         logger.error(f"Webhook error: {e}")
@@ -67,79 +95,13 @@ async def payment_success():
         if not all([payment_id, payer_id, session_id]):
             return "Missing payment parameters", 400
         
-        # Get payment session
-        session = db.get_payment_session(session_id)
-        if not session:
+        # Execution, bookkeeping and the invite run on the loop that owns the clients
+        completed = await on_shared_loop(bot.complete_payment_return(session_id, payment_id, payer_id))
+        if completed is None:
             return "Invalid session", 400
-        
-        user_id = session['user_id']
-        
-        # Execute the payment
-        success, payment_details = paypal_handler.execute_payment(payment_id, payer_id)
-        
-        if success:
-            # Mark user as paid
-            db.mark_user_paid(user_id)
-            
-            # Complete payment session
-            db.complete_payment_session(session_id)
-            
-            # Add payment record
-            db.add_payment(
-                user_id=user_id,
-                payment_id=payment_details['payment_id'],
-                payer_id=payer_id,
-                amount=payment_details['amount'],
-                currency=payment_details['currency'],
-                status='approved'
-            )
-            
-            # Send invite link via Telegram
-            from config import TELEGRAM_GROUP_INVITE_LINK
-            
-            invite_text = f"""
-🎉 **Payment Successful!**
-
-Thank you for your payment! Your access to the premium group has been activated.
-
-Here's your exclusive invite link:
-{TELEGRAM_GROUP_INVITE_LINK}
-
-Welcome to our community! 🚀
-            """
-            
-            await telegram_bot.send_message(
-                chat_id=user_id,
-                text=invite_text,
-                parse_mode='Markdown',
-                disable_web_page_preview=True
-            )
-            
-            # Mark invite as sent
-            db.mark_invite_sent(user_id)
-            
-            return """
-            <html>
-            <head><title>Payment Successful</title></head>
-            <body>
-                <h1>✅ Payment Successful!</h1>
-                <p>Thank you for your payment! You should receive your Telegram group invite link shortly.</p>
-                <p>Please check your Telegram bot chat for the invite link.</p>
-                <p>You can now close this window.</p>
-            </body>
-            </html>
-            """
-        else:
-            return """
-            <html>
-            <head><title>Payment Failed</title></head>
-            <body>
-                <h1>❌ Payment Failed</h1>
-                <p>There was an issue processing your payment. Please try again.</p>
-                <p>If the problem persists, please contact support.</p>
-            </body>
-            </html>
-            """, 400
+        if completed:
+            return SUCCESS_PAGE
+        return FAILED_PAGE, 400
             
     except Exception as e:
         logger.error(f"Payment success handler error: {e}")
@@ -148,17 +110,21 @@ Welcome to our community! 🚀
 @app.route('/payment/cancel')
 def payment_cancel():
     """Handle cancelled payment return from PayPal"""
-    return """
-    <html>
-    <head><title>Payment Cancelled</title></head>
-    <body>
-        <h1>❌ Payment Cancelled</h1>
-        <p>Your payment was cancelled. No charges have been made.</p>
-        <p>You can try again anytime by returning to the Telegram bot.</p>
-        <p>You can now close this window.</p>
-    </body>
-    </html>
-    """
+    return CANCEL_PAGE
+
+@app.route('/metrics')
+def metrics():
+    """Operational metrics as JSON"""
+    return jsonify({
+        'database': {'user_cache': db.cache_stats()},
+        'paypal': paypal_handler.metrics(),
+        'telegram': bot.send_scheduler.metrics(),
+        'webhooks': {
+            **webhook_worker.metrics(),
+            'queue': db.db.webhook_queue_stats(),
+            'signatures': webhook_verifier.metrics() if webhook_verifier else None
+        }
+    })
 
 @app.route('/health')
 def health_check():
@@ -0,0 +1,194 @@
+"""
+Local verification of PayPal webhook signatures
+PayPal signs "<transmission id>|<transmission time>|<webhook id>|<crc32 of body>"
+with the key of a certificate it links in the PAYPAL-CERT-URL header. The
+certificate chain is downloaded once per URL, validated against trusted roots
+and cached, so checking an event needs no call to PayPal.
+"""
+import base64
+import binascii
+import logging
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Mapping, Tuple
+from urllib.parse import urlsplit
+
+import certifi
+import httpx
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509.oid import NameOID
+
+from config import (
+    PAYPAL_WEBHOOK_ID,
+    PAYPAL_WEBHOOK_CERT_HOSTS,
+    PAYPAL_WEBHOOK_CA_BUNDLE,
+    PAYPAL_WEBHOOK_CERT_CACHE_TTL
+)
+
+# Subject of the certificate PayPal signs webhooks with
+SIGNING_CERT_COMMON_NAME = 'messageverificationcerts.paypal.com'
+
+# PAYPAL-AUTH-ALGO values and the digest they stand for
+AUTH_ALGORITHMS = {'SHA256withRSA': hashes.SHA256}
+
+def load_trusted_roots(path: str = None) -> List[x509.Certificate]:
+    """Root certificates from a PEM bundle (certifi's by default)"""
+    with open(path or certifi.where(), 'rb') as f:
+        return x509.load_pem_x509_certificates(f.read())
+
+def _fetch_certificates(url: str) -> bytes:
+    response = httpx.get(url, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+class WebhookVerifier:
+    """
+    Checks PayPal webhook transmission signatures against cached certificates
+    Thread-safe; a certificate URL is downloaded by one caller at a time.
+    """
+
+    def __init__(self, webhook_id: str, trusted_roots: List[x509.Certificate], cert_hosts: Tuple[str, ...],
+                 cache_ttl: float = 86400, common_name: str = SIGNING_CERT_COMMON_NAME,
+                 fetch: Callable[[str], bytes] = None):
+        self.webhook_id = webhook_id
+        self.cert_hosts = tuple(cert_hosts)
+        self.cache_ttl = cache_ttl
+        self.common_name = common_name
+        self._fetch = fetch or _fetch_certificates
+        self._roots: Dict[x509.Name, List[x509.Certificate]] = {}
+        for root in trusted_roots:
+            self._roots.setdefault(root.subject, []).append(root)
+
+        # cert URL -> (public key, monotonic expiry)
+        self._keys: Dict[str, Tuple[object, float]] = {}
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+        # Metrics
+        self.verified = 0
+        self.rejected = 0
+        self.cert_fetches = 0
+
+    @classmethod
+    def from_config(cls) -> 'WebhookVerifier':
+        return cls(
+            PAYPAL_WEBHOOK_ID,
+            load_trusted_roots(PAYPAL_WEBHOOK_CA_BUNDLE),
+            PAYPAL_WEBHOOK_CERT_HOSTS,
+            cache_ttl=PAYPAL_WEBHOOK_CERT_CACHE_TTL
+        )
+
+    def verify(self, headers: Mapping[str, str], body: bytes) -> bool:
+        """Whether body carries a valid PayPal signature for this webhook"""
+        try:
+            self._verify(headers, body)
+        except (ValueError, InvalidSignature, httpx.HTTPError) as e:
+            self.rejected += 1
+            logging.warning(f"Rejected PayPal webhook signature: {str(e) or e.__class__.__name__}")
+            return False
+        self.verified += 1
+        return True
+
+    def _verify(self, headers: Mapping[str, str], body: bytes):
+        headers = {name.lower(): value for name, value in headers.items()}
+        transmission_id = headers.get('paypal-transmission-id')
+        transmission_time = headers.get('paypal-transmission-time')
+        signature = headers.get('paypal-transmission-sig')
+        cert_url = headers.get('paypal-cert-url')
+        algorithm = AUTH_ALGORITHMS.get(headers.get('paypal-auth-algo'))
+
+        if not all([transmission_id, transmission_time, signature, cert_url]):
+            raise ValueError("missing transmission headers")
+        if algorithm is None:
+            raise ValueError(f"unsupported auth algorithm {headers.get('paypal-auth-algo')}")
+
+        try:
+            signature = base64.b64decode(signature, validate=True)
+        except binascii.Error:
+            raise ValueError("signature is not valid base64")
+
+        message = f"{transmission_id}|{transmission_time}|{self.webhook_id}|{zlib.crc32(body)}"
+        self._signing_key(cert_url).verify(signature, message.encode(), padding.PKCS1v15(), algorithm())
+
+    def _signing_key(self, cert_url: str):
+        """Public key behind cert_url, from the cache or a validated download"""
+        parts = urlsplit(cert_url)
+        if parts.scheme != 'https' or parts.hostname not in self.cert_hosts:
+            raise ValueError(f"certificate URL {cert_url} is not on a PayPal host")
+
+        cached = self._keys.get(cert_url)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        with self._lock:
+            url_lock = self._url_locks.setdefault(cert_url, threading.Lock())
+        with url_lock:
+            # Another thread may have fetched it while we waited
+            cached = self._keys.get(cert_url)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+
+            self.cert_fetches += 1
+            chain = x509.load_pem_x509_certificates(self._fetch(cert_url))
+            self._validate_chain(chain)
+
+            leaf = chain[0]
+            # Never trust a cached key past the certificate's own expiry
+            lifetime = (leaf.not_valid_after_utc - datetime.now(timezone.utc)).total_seconds()
+            self._keys[cert_url] = (leaf.public_key(), time.monotonic() + min(self.cache_ttl, lifetime))
+            return leaf.public_key()
+
+    def _validate_chain(self, chain: List[x509.Certificate]):
+        """Raise ValueError unless chain is a current leaf-first chain to a trusted root"""
+        now = datetime.now(timezone.utc)
+        leaf = chain[0]
+        names = [attr.value for attr in leaf.subject.get_attributes_for_oid(NameOID.COMMON_NAME)]
+        if self.common_name not in names:
+            raise ValueError(f"certificate is issued to {names}, not {self.common_name}")
+
+        for cert, issuer in zip(chain, chain[1:]):
+            self._check_issued_by(cert, issuer, now)
+
+        top = chain[-1]
+        if top in self._roots.get(top.subject, []):
+            self._check_current(top, now)
+            return
+        for root in self._roots.get(top.issuer, []):
+            try:
+                self._check_issued_by(top, root, now)
+                return
+            except ValueError:
+                continue
+        raise ValueError("certificate chain does not lead to a trusted root")
+
+    @staticmethod
+    def _check_current(cert: x509.Certificate, now: datetime):
+        if not cert.not_valid_before_utc <= now <= cert.not_valid_after_utc:
+            raise ValueError(f"certificate {cert.subject.rfc4514_string()} is expired or not yet valid")
+
+    def _check_issued_by(self, cert: x509.Certificate, issuer: x509.Certificate, now: datetime):
+        self._check_current(cert, now)
+        self._check_current(issuer, now)
+        try:
+            constraints = issuer.extensions.get_extension_for_class(x509.BasicConstraints).value
+        except x509.ExtensionNotFound:
+            constraints = None
+        if constraints is None or not constraints.ca:
+            raise ValueError(f"{issuer.subject.rfc4514_string()} is not a CA certificate")
+        try:
+            cert.verify_directly_issued_by(issuer)
+        except (ValueError, TypeError, InvalidSignature):
+            raise ValueError(f"{cert.subject.rfc4514_string()} is not signed by {issuer.subject.rfc4514_string()}")
+
+    def metrics(self) -> Dict:
+        return {
+            'verified': self.verified,
+            'rejected': self.rejected,
+            'cert_fetches': self.cert_fetches,
+            'cached_certs': len(self._keys)
+        }
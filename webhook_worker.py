@@ -0,0 +1,149 @@
+"""
+Background processing of queued PayPal webhook events
+The webhook endpoint only stores events in the webhook_events table; the
+workers here claim them, finalize the payments they describe and retry
+failures with growing delays.
+"""
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import (
+    WEBHOOK_WORKERS,
+    WEBHOOK_POLL_INTERVAL,
+    WEBHOOK_EVENT_BATCH_SIZE,
+    WEBHOOK_EVENT_MAX_ATTEMPTS,
+    WEBHOOK_EVENT_RETRY_DELAY,
+    WEBHOOK_EVENT_LEASE_SECONDS
+)
+from async_database import AsyncDatabaseManager
+from paypal_handler import AsyncPayPalHandler
+
+class WebhookEventWorker:
+    """
+    Pool of asyncio tasks draining the webhook_events queue
+    Workers wake as soon as the endpoint queues an event (notify) and
+    otherwise poll every WEBHOOK_POLL_INTERVAL seconds, so events queued by
+    another process are picked up too.
+    """
+
+    def __init__(self, db: AsyncDatabaseManager, paypal: AsyncPayPalHandler,
+                 on_purchase: Callable[[int], Awaitable[None]], workers: int = None):
+        self.db = db
+        self.paypal = paypal
+        # Called with the user id after a webhook recorded a new purchase
+        self.on_purchase = on_purchase
+        self.workers = workers or WEBHOOK_WORKERS
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+        # Metrics
+        self.processed = 0
+        self.failed = 0
+        self.purchases_recorded = 0
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        logging.info(f"Started {self.workers} webhook event workers")
+
+    def notify(self):
+        """Wake the workers; safe to call from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self):
+        """Cancel the workers; claimed events are retried once their lease runs out"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                events = await self.db.claim_webhook_events(WEBHOOK_EVENT_BATCH_SIZE, WEBHOOK_EVENT_LEASE_SECONDS)
+            except Exception as e:
+                logging.error(f"Error claiming webhook events: {e}")
+                events = []
+
+            if not events:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=WEBHOOK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for event in events:
+                await self._handle(event)
+
+    async def _handle(self, event: Dict):
+        """Process one claimed event and record the outcome"""
+        try:
+            await self.process(json.loads(event['payload']))
+        except Exception as e:
+            self.failed += 1
+            # attempts is the count before this claim
+            logging.error(f"Webhook event {event['event_id']} failed on attempt {event['attempts'] + 1}: {e}")
+            await self.db.finish_webhook_event(
+                event['id'],
+                error=str(e) or e.__class__.__name__,
+                retry_delay=WEBHOOK_EVENT_RETRY_DELAY * (2 ** event['attempts']),
+                max_attempts=WEBHOOK_EVENT_MAX_ATTEMPTS
+            )
+        else:
+            self.processed += 1
+            await self.db.finish_webhook_event(event['id'])
+
+    async def process(self, event: Dict):
+        """Apply one webhook event; raises to have it retried later"""
+        if event.get('event_type') != 'PAYMENT.SALE.COMPLETED':
+            return
+
+        payment_id = event.get('resource', {}).get('parent_payment')
+        if not payment_id or await self.db.payment_recorded(payment_id):
+            # Usually the return-URL redirect recorded it already
+            return
+
+        session = await self.db.get_session_by_payment_id(payment_id)
+        if session is None:
+            logging.warning(f"No payment session for PayPal payment {payment_id}")
+            return
+
+        details = await self.paypal.get_payment_details(payment_id)
+        if details is None:
+            raise RuntimeError(f"could not look up PayPal payment {payment_id}")
+        if details['state'] != 'approved':
+            logging.warning(f"Webhook for PayPal payment {payment_id} in state {details['state']}, ignored")
+            return
+        self.paypal.record_webhook_event(event)
+
+        recorded = await self.db.complete_purchase(
+            user_id=session['user_id'],
+            session_id=session['session_id'],
+            payment_id=payment_id,
+            payer_id=details['payer_info'].get('payer_id'),
+            amount=details['amount'],
+            currency=details['currency'],
+            status='approved'
+        )
+        if recorded:
+            self.purchases_recorded += 1
+            logging.info(f"Payment {payment_id} recorded from webhook for user {session['user_id']}")
+            try:
+                await self.on_purchase(session['user_id'])
+            except Exception as e:
+                logging.error(f"Error notifying user {session['user_id']} of payment {payment_id}: {e}")
+
+    def metrics(self) -> Dict:
+        return {
+            'workers': len(self._tasks),
+            'processed': self.processed,
+            'failed': self.failed,
+            'purchases_recorded': self.purchases_recorded
+        }